@@ -463,6 +463,9 @@ all_ins(PyObject* d)
 #ifdef F_DUPFD
     if (ins(d, "F_DUPFD", (long)F_DUPFD)) return -1;
 #endif
+#ifdef F_DUPFD_CLOEXEC  /* OVM_MAIN patch: used by FdState */
+    if (ins(d, "F_DUPFD_CLOEXEC", (long)F_DUPFD_CLOEXEC)) return -1;
+#endif
 #ifdef F_GETFD
     if (ins(d, "F_GETFD", (long)F_GETFD)) return -1;
 #endif
@@ -0,0 +1,87 @@
+#!/usr/bin/env bash
+#
+# Measure the cost of fork() in OSH, with and without gc.freeze().
+#
+# Each subshell, pipeline stage, and command sub forks the interpreter.  When
+# the garbage collector runs in the child, it writes to every object header it
+# visits, which copies the parent's heap pages.  ShellMain() calls gc.freeze()
+# after initialization to prevent that; OSH_GC_FREEZE=0 turns it off.
+#
+# Usage:
+#   benchmarks/fork.sh <function name>
+#
+# Example:
+#   benchmarks/fork.sh measure _bin/osh
+#   benchmarks/fork.sh report
+
+set -o nounset
+set -o pipefail
+set -o errexit
+
+readonly BASE_DIR=_tmp/fork
+
+# Bare subshells: the cost of fork() and exit().
+subshell-script() {
+  local n=$1
+  cat <<EOF
+i=0
+while test \$i -lt $n; do
+  ( : )
+  i=\$((i + 1))
+done
+EOF
+}
+
+# Command subs that allocate enough to trigger collections in the child.
+gc-script() {
+  local n=$1
+  cat <<EOF
+work() {
+  local j=0 s=''
+  while test \$j -lt 300; do
+    s="\$s \$j"
+    j=\$((j + 1))
+  done
+  echo "\${#s}"
+}
+i=0
+while test \$i -lt $n; do
+  x=\$(work)
+  i=\$((i + 1))
+done
+EOF
+}
+
+measure() {
+  local osh=${1:-_bin/osh}
+  local n=${2:-200}
+
+  mkdir -p $BASE_DIR
+  local out=$BASE_DIR/times.tsv
+  echo $'status\telapsed_secs\tminflt\tmajflt\tworkload\tgc_freeze' > $out
+
+  local workload freeze
+  for workload in subshell gc; do
+    local script=$BASE_DIR/$workload.sh
+    $workload-script $n > $script
+
+    for freeze in 0 1; do
+      OSH_GC_FREEZE=$freeze benchmarks/time.py --tsv --rusage -o $out \
+        --field $workload --field $freeze -- \
+        $osh $script > /dev/null
+    done
+  done
+
+  report $n
+}
+
+# Print elapsed time and page faults per fork.
+report() {
+  local n=${1:-200}
+  awk -v n=$n '
+  NR == 1 { print "workload\tgc_freeze\tms_per_fork\tminflt_per_fork"; next }
+          { printf("%s\t%s\t%.3f\t%.1f\n", $5, $6, $2 * 1000 / n, $3 / n) }
+  ' $BASE_DIR/times.tsv
+}
+
+"$@"
@@ -42,4 +42,106 @@ printf-loop-complex() {
   done | wc -l
 }
 
+# ${big//pat/rep} on a ~50 KB string with 10,000 matches.  The replacement is
+# done in a single libc call for globs, and with str.replace() for constant
+# patterns.
+#
+# OSH: 120 ms (was 570 ms with a libc call per match)
+# bash: 120 ms
+#
+# Usage:
+#   ./micro.sh patsub-all bin/osh
+patsub-all() {
+  local sh=${1:-bin/osh}
+  time $sh -c '
+big=$(seq 10000)
+big=${big//$'"'\\n'"'/,}
+for i in 1 2 3 4 5 6 7 8 9 10; do
+  x=${big//,/ }      # constant
+  y=${big//[0-9],/_} # glob
+done
+echo ${#big} ${#x} ${#y}
+'
+}
+
+# Read a global variable 5000 times at the bottom of a recursive call stack.
+# Dynamic scope lookup is O(1), so the time should be flat as depth grows.
+# (CPython's recursion limit stops OSH at a depth of around 90.)
+#
+# OSH: 456 ms at depth 1, 479 ms at depth 80
+# Before: 491 ms at depth 1, 600 ms at depth 80
+#
+# Usage:
+#   ./micro.sh var-depth bin/osh
+var-depth() {
+  local sh=${1:-bin/osh}
+  for depth in 1 20 40 60 80; do
+    echo "depth $depth"
+    time $sh -c '
+g=global
+f() {
+  local level=$1
+  if test $level -gt 0; then
+    f $((level - 1))
+    return
+  fi
+  local i=0
+  while test $i -lt 5000; do
+    x=$g
+    i=$((i + 1))
+  done
+}
+f '$depth
+  done
+}
+
+# A counter loop.  Arithmetic stores a value.Int, so variables and constants
+# aren't parsed again on every iteration.
+#
+# OSH: 542 ms
+# Before: 785 ms
+#
+# Usage:
+#   ./micro.sh arith-loop bin/osh
+arith-loop() {
+  local sh=${1:-bin/osh}
+  time $sh -c '
+i=0
+sum=0
+while (( i < 20000 )); do
+  (( sum += i * 2 ))
+  i=$((i + 1))
+done
+echo $sum
+'
+}
+
+# ${x#pat} ${x%pat} ${x##pat} ${x%%pat} on a 16 KB string of 8192 'a/' pairs.
+# The shortest matches try each boundary from the short end, so they stop
+# after a few regexec() calls.  They search for the longest match first, so
+# when nothing matches, e.g. ${x#*/} on 40K chars without a slash, it takes one
+# call.
+#
+# OSH: under 1 ms per op
+# Before: 190 ms per ${x#*/} and 530 ms per ${x%/*} (quadratic)
+#
+# Usage:
+#   ./micro.sh strip-affix bin/osh
+strip-affix() {
+  local sh=${1:-bin/osh}
+  for op in '#*/' '%/*' '##*/' '%%/*'; do
+    echo "op $op"
+    time $sh -c '
+x=a/
+for i in 1 2 3 4 5 6 7 8 9 10 11 12 13; do
+  x=$x$x
+done
+for i in 1 2 3 4 5 6 7 8 9 10; do
+  y=${x'"$op"'}
+done
+echo ${#y}
+'
+  done
+}
+
 "$@"
@@ -258,6 +258,35 @@ EOF
 EOF
 }
 
+# Parse all the files in the manifest with 'oshc parse', which uses a worker
+# process per core.  Prints a TSV row per file and the total throughput.
+#
+# Example: benchmarks/osh-parser.sh parallel-throughput 4
+parallel-throughput() {
+  local num_jobs=${1:-}  # default: number of CPUs
+  local files=${2:-benchmarks/osh-parser-files.txt}
+  local out=$BASE_DIR/parallel-throughput.tsv
+
+  mkdir -p $BASE_DIR
+
+  # Not an array because of the set -u bug mentioned above.
+  local jobs_flag=${num_jobs:+-j$num_jobs}
+
+  local start end
+  start=$(date +%s.%N)
+  grep -v '^#' $files | xargs -- bin/oshc parse $jobs_flag > $out || true
+  end=$(date +%s.%N)
+
+  cat $out
+  awk -v start=$start -v end=$end '
+    NR > 1 { lines += $3; tokens += $4 }
+    END {
+      elapsed = end - start
+      printf("%d lines, %d tokens in %.2f s: %.0f lines/s\n",
+             lines, tokens, elapsed, lines / elapsed)
+    }' $out
+}
+
 time-test() {
   benchmarks/time.py \
     --field bash --field foo.txt --output _tmp/bench.csv \
@@ -20,6 +20,7 @@ from __future__ import print_function
 
 import csv
 import optparse
+import resource
 import sys
 import subprocess
 import time
@@ -43,6 +44,9 @@ def Options():
   p.add_option(
       '--field', dest='fields', default=[], action='append',
       help='A string to append to each row, after the exit code and status')
+  p.add_option(
+      '--rusage', dest='rusage', default=False, action='store_true',
+      help='Also write the minor and major page faults of the process tree')
   return p
 
 
@@ -66,7 +70,12 @@ def main(argv):
                        quoting=csv.QUOTE_NONE)
     else:
       out = csv.writer(f)
-    row = (exit_code, '%.4f' % elapsed) + fields
+    row = (exit_code, '%.4f' % elapsed)
+    if opts.rusage:
+      # Includes descendants that the child waited for.
+      ru = resource.getrusage(resource.RUSAGE_CHILDREN)
+      row += (ru.ru_minflt, ru.ru_majflt)
+    row += fields
     out.writerow(row)
 
   # Preserve the command's exit code.  (This means you can't distinguish
@@ -47,6 +47,7 @@ _tlog('before imports')
 
 import atexit
 import errno
+import gc
 
 from _devbuild.gen.runtime_asdl import builtin_e, arg_vector
 from _devbuild.gen.syntax_asdl import source
@@ -68,6 +69,7 @@ from core.util import log
 from frontend import args
 from frontend import reader
 from frontend import parse_lib
+from frontend import parse_cache
 
 from oil_lang import cmd_exec as oil_cmd_exec
 
@@ -87,6 +89,7 @@ from pylib import os_path
 
 from tools import deps
 from tools import osh2oil
+from tools import parse_files
 from tools import readlink
 
 import libc
@@ -235,10 +238,10 @@ def SourceStartupFile(rc_path, lang, parse_ctx, ex):
   try:
     arena.PushSource(rc_path)
     with open(rc_path) as f:
-      rc_line_reader = reader.FileLineReader(f, arena)
       if lang == 'osh':
-        rc_c_parser = parse_ctx.MakeOshParser(rc_line_reader)
+        rc_c_parser = parse_ctx.MakeOshFileParser(f, rc_path)
       else:
+        rc_line_reader = reader.FileReader(f, arena)
         rc_c_parser = parse_ctx.MakeOilParser(rc_line_reader)
       try:
         status = main_loop.Batch(ex, rc_c_parser, arena)
@@ -316,8 +319,15 @@ def ShellMain(lang, argv0, argv, login_shell):
 
   if opts.one_pass_parse and not exec_opts.noexec:
     raise args.UsageError('--one-pass-parse requires noexec (-n)')
+  # Opt-in cache of parsed sourced files and rc files.
+  parse_cache_dir = posix.environ.get('OSH_PARSE_CACHE_DIR')
+  if parse_cache_dir:
+    p_cache = parse_cache.ParseCache(parse_cache_dir)
+  else:
+    p_cache = None
   parse_ctx = parse_lib.ParseContext(arena, aliases, oil_grammar,
-                                     one_pass_parse=opts.one_pass_parse)
+                                     one_pass_parse=opts.one_pass_parse,
+                                     parse_cache=p_cache)
 
   # Three ParseContext instances SHARE aliases.
   comp_arena = alloc.Arena()
@@ -385,7 +395,10 @@ def ShellMain(lang, argv0, argv, login_shell):
     debug_f.log('Writing logs to %r', debug_path)
 
   interp = posix.environ.get('OSH_HIJACK_SHEBANG', '')
-  exec_deps.ext_prog = process.ExternalProgram(interp, fd_state, errfmt, debug_f)
+  search_path = state.SearchPath(mem)
+  exec_deps.search_path = search_path
+  exec_deps.ext_prog = process.ExternalProgram(interp, fd_state, search_path,
+                                               errfmt, debug_f)
 
   splitter = split.SplitContext(mem)
   exec_deps.splitter = splitter
@@ -447,14 +460,15 @@ def ShellMain(lang, argv0, argv, login_shell):
 
       builtin_e.HELP: builtin.Help(loader, errfmt),
 
-      builtin_e.TYPE: builtin.Type(funcs, aliases, mem),
+      builtin_e.TYPE: builtin.Type(funcs, aliases, search_path),
+      builtin_e.HASH: builtin.Hash(search_path, errfmt),
       builtin_e.REPR: builtin.Repr(mem, errfmt),
 
       builtin_e.GETOPTS: builtin.GetOpts(mem, errfmt),
 
       builtin_e.WAIT: builtin.Wait(exec_deps.waiter, exec_deps.job_state, mem,
                                    errfmt),
-      builtin_e.JOBS: builtin.Jobs(exec_deps.job_state),
+      builtin_e.JOBS: builtin.Jobs(exec_deps.job_state, exec_deps.waiter),
       builtin_e.UMASK: builtin.Umask,
 
       builtin_e.COLON: lambda arg_vec: 0,  # a "special" builtin 
@@ -495,6 +509,7 @@ def ShellMain(lang, argv0, argv, login_shell):
 
   sig_state = process.SignalState()
   sig_state.InitShell()
+  sig_state.InitSigChld(exec_deps.waiter)
 
   builtins[builtin_e.TRAP] = builtin.Trap(sig_state, exec_deps.traps,
                                           exec_deps.trap_nodes, ex, errfmt)
@@ -546,7 +561,7 @@ def ShellMain(lang, argv0, argv, login_shell):
         ui.Stderr("osh: Couldn't open %r: %s", script_name,
                   posix.strerror(e.errno))
         return 1
-      line_reader = reader.FileLineReader(f, arena)
+      line_reader = reader.FileReader(f, arena)
 
   # TODO: assert arena.NumSourcePaths() == 1
   # TODO: .rc file needs its own arena.
@@ -555,6 +570,13 @@ def ShellMain(lang, argv0, argv, login_shell):
   else:
     c_parser = parse_ctx.MakeOilParser(line_reader)
 
+  # Move the objects created during initialization out of the collector's
+  # reach, so collections in forked children don't write to their pages.
+  # gc.freeze() is in our patched Python-2.7.13, but not in CPython 2.  See
+  # benchmarks/fork.sh.
+  if hasattr(gc, 'freeze') and posix.environ.get('OSH_GC_FREEZE') != '0':
+    gc.freeze()
+
   if exec_opts.interactive:
     # Calculate ~/.config/oil/oshrc or oilrc
     # Use ~/.config/oil to avoid cluttering the user's home directory.  Some
@@ -610,6 +632,7 @@ def ShellMain(lang, argv0, argv, login_shell):
   status = main_loop.Batch(ex, c_parser, arena, nodes_out=nodes_out)
   if ex.MaybeRunExitTrap():
     status = ex.LastStatus()
+  debug_f.log('eval/trap code cache: %s', ex.code_cache.Stats())
 
   # Only print nodes if the whole parse succeeded.
   if nodes_out is not None and status == 0:
@@ -655,7 +678,7 @@ def BoilMain(main_argv):
 
 # TODO: Hook up to completion.
 SUBCOMMANDS = [
-    'translate', 'arena', 'spans', 'format', 'deps', 'undefined-vars'
+    'translate', 'arena', 'spans', 'format', 'deps', 'undefined-vars', 'parse'
 ]
 
 def OshCommandMain(argv):
@@ -681,6 +704,9 @@ def OshCommandMain(argv):
   if action not in SUBCOMMANDS:
     raise args.UsageError('Invalid subcommand %r.' % action)
 
+  if action == 'parse':  # takes many files
+    return parse_files.main(argv[1:])
+
   arena = alloc.Arena()
   try:
     script_name = argv[1]
@@ -705,7 +731,7 @@ def OshCommandMain(argv):
   parse_ctx = parse_lib.ParseContext(arena, aliases, oil_grammar,
                                      one_pass_parse=True)
 
-  line_reader = reader.FileLineReader(f, arena)
+  line_reader = reader.FileReader(f, arena)
   c_parser = parse_ctx.MakeOshParser(line_reader)
 
   try:
@@ -5,19 +5,33 @@ This is roughly what you might do in C++, but it's probably overly complicated
 for Python.
 
 The idea is to save the LST for functions, but discard it for commands that
-have already executed.  Each statement/function can be parsed into a separate
-Arena, and the entire Arena can be discarded at once.
+have already executed.
+
+This is implemented with a single Arena and a mark:
+
+- main_loop.Batch() calls GetMark() before parsing each command, and
+  Reclaim() after executing it (with shopt -s reclaim_arena).  IDs after the
+  mark are then reused by the next command.
+- Code that stores LST nodes beyond the current command, like function
+  definitions and traps, calls Retain().  Reclaim() never discards anything
+  added before the last Retain().
 
 Also, we don't want to save comment lines.
+
+Spans are stored in three parallel arrays of machine ints rather than as one
+line_span object per token.  On large scripts, the line_span objects used to
+dominate memory usage.
 """
 
+import array
+
 from _devbuild.gen.syntax_asdl import (
     line_span, source_t, source__CFlag, source__MainFile, source__SourcedFile
 )
 from asdl import const
 from core.util import log
 
-from typing import List, Dict
+from typing import List, Dict, Tuple
 
 
 class Arena(object):
@@ -36,12 +50,19 @@ class Arena(object):
     self.line_srcs = []  # type: List[source_t]
     self.line_num_strs = {}  # type: Dict[int, str]  # an INTERN table
 
-    # indexed by span_id
-    self.spans = []  # type: List[line_span]
+    # Three parallel arrays for span information, indexed by span_id.  A
+    # line_span is only created when someone calls GetLineSpan().
+    self.span_line_ids = array.array('i')
+    self.span_cols = array.array('i')
+    self.span_lengths = array.array('i')
 
     # reuse these instances in many line_span instances
     self.source_instances = []  # type: List[source_t]
 
+    # Reclaim() won't discard lines and spans before these IDs.
+    self.retained_lines = 0
+    self.retained_spans = 0
+
   def PushSource(self, src):
     # type: (source_t) -> None
     self.source_instances.append(src)
@@ -71,11 +92,9 @@ class Arena(object):
     # type: (int) -> int
     return self.line_nums[line_id]
 
-  # NOTE: Not used yet.  Using an intern table seems like a good idea, but I
-  # haven't measured the performance benefit of it.  The case I'm thinking of
-  # is where you have a tight loop and every line uses $LINENO.  It's better to
-  # create 3 objects rather than 3*N objects, where N is the number of loop
-  # iterations.
+  # Used for $LINENO and BASH_LINENO.  In a tight loop where every line uses
+  # $LINENO, it's better to create 3 objects rather than 3*N objects, where N
+  # is the number of loop iterations.
   def GetLineNumStr(self, line_id):
     # type: (int) -> str
     line_num = self.line_nums[line_id]
@@ -107,22 +126,77 @@ class Arena(object):
   def AddLineSpan(self, line_id, col, length):
     # type: (int, int, int) -> int
     """Save a line_span and return a new span ID for later retrieval."""
-    span_id = len(self.spans)  # spids are just array indices
-    span = line_span(line_id, col, length)
-    self.spans.append(span)
+    span_id = len(self.span_line_ids)  # spids are just array indices
+    self.span_line_ids.append(line_id)
+    self.span_cols.append(col)
+    self.span_lengths.append(length)
     return span_id
 
   def GetLineSpan(self, span_id):
     # type: (int) -> line_span
+    """Return a new line_span object.
+
+    Prefer the GetSpan*() accessors in hot paths, since they don't allocate.
+    """
     assert span_id != const.NO_INTEGER, span_id
     try:
-      return self.spans[span_id]
+      return line_span(self.span_line_ids[span_id], self.span_cols[span_id],
+                       self.span_lengths[span_id])
     except IndexError:
       log('Span ID out of range: %d is greater than %d', span_id,
-          len(self.spans))
+          len(self.span_line_ids))
       raise
 
+  def GetSpanLineId(self, span_id):
+    # type: (int) -> int
+    assert span_id != const.NO_INTEGER, span_id
+    return self.span_line_ids[span_id]
+
+  def GetSpanCol(self, span_id):
+    # type: (int) -> int
+    assert span_id != const.NO_INTEGER, span_id
+    return self.span_cols[span_id]
+
+  def GetSpanLength(self, span_id):
+    # type: (int) -> int
+    assert span_id != const.NO_INTEGER, span_id
+    return self.span_lengths[span_id]
+
   def LastSpanId(self):
     # type: () -> int
     """Return one past the last span ID."""
-    return len(self.spans)
+    return len(self.span_line_ids)
+
+  def GetMark(self):
+    # type: () -> Tuple[int, int]
+    """Return the number of lines and spans, to pass to Reclaim() later."""
+    return len(self.line_vals), len(self.span_line_ids)
+
+  def Retain(self):
+    # type: () -> None
+    """Keep all lines and spans added so far.
+
+    Called when an LST node outlives the command that created it, e.g. for
+    function definitions and traps.
+    """
+    self.retained_lines = len(self.line_vals)
+    self.retained_spans = len(self.span_line_ids)
+
+  def Reclaim(self, mark):
+    # type: (Tuple[int, int]) -> None
+    """Discard lines and spans added after the mark, unless they're retained.
+
+    The discarded IDs will be handed out again, so the caller must ensure that
+    nothing refers to them.
+    """
+    num_lines, num_spans = mark
+    num_lines = max(num_lines, self.retained_lines)
+    num_spans = max(num_spans, self.retained_spans)
+
+    del self.line_vals[num_lines:]
+    del self.line_nums[num_lines:]
+    del self.line_srcs[num_lines:]
+
+    del self.span_line_ids[num_spans:]
+    del self.span_cols[num_spans:]
+    del self.span_lengths[num_spans:]
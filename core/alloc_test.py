@@ -25,6 +25,18 @@ class AllocTest(unittest.TestCase):
 
     span_id = arena.AddLineSpan(0, 1, 2)
     self.assertEqual(0, span_id)
+    span_id = arena.AddLineSpan(1, 3, 4)
+    self.assertEqual(1, span_id)
+    self.assertEqual(2, arena.LastSpanId())
+
+    span = arena.GetLineSpan(1)
+    self.assertEqual(1, span.line_id)
+    self.assertEqual(3, span.col)
+    self.assertEqual(4, span.length)
+
+    self.assertEqual(0, arena.GetSpanLineId(0))
+    self.assertEqual(1, arena.GetSpanCol(0))
+    self.assertEqual(2, arena.GetSpanLength(0))
 
     arena.PopSource()
 
@@ -55,6 +67,34 @@ class AllocTest(unittest.TestCase):
     self.assertEqual('one.oil', arena.GetLineSource(id3).path)
     self.assertEqual(3, arena.GetLineNumber(id3))
 
+  def testReclaim(self):
+    arena = self.arena
+    arena.PushSource(source.MainFile('one.oil'))
+
+    arena.AddLine('f() { echo hi; }', 1)
+    arena.AddLineSpan(0, 0, 1)
+
+    mark = arena.GetMark()
+    arena.AddLine('echo one', 2)
+    arena.AddLineSpan(1, 0, 4)
+    arena.Reclaim(mark)
+    self.assertEqual(1, arena.LastSpanId())
+
+    # IDs are reused
+    self.assertEqual(1, arena.AddLine('echo two', 3))
+    self.assertEqual(1, arena.AddLineSpan(1, 0, 4))
+    self.assertEqual('echo two', arena.GetLine(1))
+    self.assertEqual(3, arena.GetLineNumber(1))
+
+    # Nothing before Retain() is reclaimed
+    arena.Retain()
+    arena.AddLine('echo three', 4)
+    arena.AddLineSpan(2, 0, 4)
+    arena.Reclaim(mark)
+    self.assertEqual(2, arena.LastSpanId())
+    self.assertEqual('echo two', arena.GetLine(1))
+
+    arena.PopSource()
 
 if __name__ == '__main__':
   unittest.main()
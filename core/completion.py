@@ -472,12 +472,12 @@ class ExternalCommandAction(CompletionAction):
 
   This is PART of compge -A command.
   """
-  def __init__(self, mem):
+  def __init__(self, search_path):
     """
     Args:
-      mem: for looking up Path
+      search_path: state.SearchPath for the directories in $PATH
     """
-    self.mem = mem
+    self.search_path = search_path
     # Should we list everything executable in $PATH here?  And then whenever
     # $PATH is changed, regenerated it?
     # Or we can cache directory listings?  What if the contents of the dir
@@ -503,11 +503,8 @@ class ExternalCommandAction(CompletionAction):
     - When we get a newer timestamp, we should clear the old one.
     - When PATH is changed, we can remove old entries.
     """
-    val = self.mem.GetVar('PATH')
-    if val.tag != value_e.Str:
-      # No matches if not a string
-      return
-    path_dirs = val.s.split(':')
+    # No matches if $PATH isn't a string
+    path_dirs = self.search_path.Dirs()
     #log('path: %s', path_dirs)
 
     executables = []
@@ -115,7 +115,7 @@ class CompletionTest(unittest.TestCase):
 
   def testExternalCommandAction(self):
     mem = state.Mem('dummy', [], {}, None)
-    a = completion.ExternalCommandAction(mem)
+    a = completion.ExternalCommandAction(state.SearchPath(mem))
     comp = self._CompApi([], 0, 'f')
     print(list(a.Matches(comp)))
 
@@ -82,8 +82,7 @@ class CrashDumper(object):
     }
 
     if span_id != const.NO_INTEGER:
-      span = ex.arena.GetLineSpan(span_id)
-      line_id = span.line_id
+      line_id = ex.arena.GetSpanLineId(span_id)
 
       # Could also do msg % args separately, but JavaScript won't be able to
       # render that.
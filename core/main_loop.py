@@ -41,6 +41,10 @@ def Interactive(opts, ex, c_parser, display, errfmt):
     # - display.EraseLines() needs to be called BEFORE displaying anything, so
     # it appears in all branches.
 
+    # Reap background jobs that exited while the last command ran.  This
+    # doesn't block, and usually doesn't make any system calls.
+    ex.waiter.Poll()
+
     while True:  # ONLY EXECUTES ONCE
       try:
         # may raise HistoryError or ParseError
@@ -143,6 +147,13 @@ def Batch(ex, c_parser, arena, nodes_out=None):
   """
   status = 0
   while True:
+    # With shopt -s reclaim_arena, lines and spans for each command are
+    # discarded after it runs, so long-running scripts use constant memory.
+    reclaim = nodes_out is None and ex.exec_opts.reclaim_arena
+    if reclaim:
+      mark = arena.GetMark()
+      saved_spid = ex.mem.CurrentSpanId()
+
     try:
       node = c_parser.ParseLogicalLine()  # can raise ParseError
       if node is None:  # EOF
@@ -161,6 +172,17 @@ def Batch(ex, c_parser, arena, nodes_out=None):
 
     is_control_flow, is_fatal = ex.ExecuteAndCatch(node)
     status = ex.LastStatus()
+
+    if reclaim:
+      arena.Reclaim(mark)
+      # Don't leave dangling references to the discarded spans.  The current
+      # span ID is used for $LINENO and as a fallback location for errors.
+      ex.mem.RestoreCurrentSpanId(saved_spid)
+      # The parser's current token and the lexer's current line may have been
+      # discarded.
+      c_parser.Reset()
+      c_parser.ResetInputObjects()
+
     # e.g. divide by zero or 'exit' in the middle of a script
     if is_control_flow or is_fatal:
       break
@@ -20,6 +20,7 @@ from _devbuild.gen.runtime_asdl import redirect_e, process_state_e
 from core import ui
 from core.util import log
 from pylib import os_
+from pylib import os_path
 
 import posix_ as posix
 
@@ -42,18 +43,31 @@ def GetHomeDir():
     return e.pw_dir
 
 
+# Signals that child processes reset to the default handler.
+_CHILD_DEFAULT_SIGNALS = [
+    signal.SIGQUIT,  # Respond to Ctrl-\ (core dump)
+    signal.SIGINT,  # Respond to Ctrl-C
+
+    # Python sets SIGPIPE handler to SIG_IGN by default.  Child processes
+    # shouldn't have this.
+    # https://docs.python.org/2/library/signal.html
+    # See Python/pythonrun.c.
+    signal.SIGPIPE,
+]
+
+
 def SignalState_AfterForkingChild():
   """Not a member of SignalState since we didn't do dependency injection."""
-  # Respond to Ctrl-\ (core dump)
-  signal.signal(signal.SIGQUIT, signal.SIG_DFL)
-  # Respond to Ctrl-C
-  signal.signal(signal.SIGINT, signal.SIG_DFL)
+  for sig_num in _CHILD_DEFAULT_SIGNALS:
+    signal.signal(sig_num, signal.SIG_DFL)
 
-  # Python sets SIGPIPE handler to SIG_IGN by default.  Child processes
-  # shouldn't have this.
-  # https://docs.python.org/2/library/signal.html
-  # See Python/pythonrun.c.
-  signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+  # The SIGCHLD self-pipe belongs to the parent.  Waiter.Poll() in a subshell
+  # notices the PID change and calls waitpid() directly.
+  signal.set_wakeup_fd(-1)
+
+
+# The SIGCHLD self-pipe lives above the descriptors that FdState uses.
+_SIGCHLD_MIN_FD = 100
 
 
 class SignalState(object):
@@ -63,6 +77,7 @@ class SignalState(object):
     # Before doing anything else, save the original handler that raises
     # KeyboardInterrupt.
     self.orig_sigint_handler = signal.getsignal(signal.SIGINT)
+    self.sigchld_handler = None  # set by InitSigChld()
 
   def _IgnoreSigInt(self):
     signal.signal(signal.SIGINT, signal.SIG_IGN)
@@ -99,6 +114,32 @@ class SignalState(object):
     # TODO: Should we restore the user-registered handler?
     self._IgnoreSigInt()
 
+  def InitSigChld(self, waiter):
+    """Notify the waiter of SIGCHLD through a self-pipe.
+
+    Waiter.Poll() reads the pipe, so it only calls waitpid() when a child has
+    changed state.
+    """
+    fds = []
+    for fd in posix.pipe():
+      # Move it out of the 0-9 range that scripts can redirect.
+      new_fd = fcntl.fcntl(fd, fcntl.F_DUPFD, _SIGCHLD_MIN_FD)
+      posix.close(fd)
+      fcntl.fcntl(new_fd, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+      flags = fcntl.fcntl(new_fd, fcntl.F_GETFL)
+      fcntl.fcntl(new_fd, fcntl.F_SETFL, flags | posix.O_NONBLOCK)
+      fds.append(new_fd)
+    r, w = fds
+
+    # The C-level handler writes a byte to the fd; the Python-level handler is
+    # a no-op.  Blocking calls like read() shouldn't fail with EINTR.
+    self.sigchld_handler = lambda sig_num, frame: None
+    signal.signal(signal.SIGCHLD, self.sigchld_handler)
+    signal.siginterrupt(signal.SIGCHLD, False)
+    signal.set_wakeup_fd(w)
+    waiter.sigchld_fd = r
+    waiter.sigchld_pid = posix.getpid()
+
   def AddUserTrap(self, sig_num, handler):
     """For user-defined handlers registered with the 'trap' builtin."""
     if sig_num == signal.SIGINT:
@@ -112,6 +153,8 @@ class SignalState(object):
     # Restore default
     if sig_num == signal.SIGINT:
       self._IgnoreSigInt()
+    elif sig_num == signal.SIGCHLD and self.sigchld_handler:
+      signal.signal(sig_num, self.sigchld_handler)
     else:
       signal.signal(sig_num, signal.SIG_DFL)
 
@@ -122,6 +165,10 @@ class _FdFrame(object):
     self.need_close = []
     self.need_wait = []
 
+    # For PushStdio()
+    self.saved_stdout = None
+    self.need_close_files = []  # (file object, span ID of the redirect)
+
   def Forget(self):
     """For exec 1>&2."""
     del self.saved[:]  # like list.clear() in Python 3.3
@@ -132,6 +179,78 @@ class _FdFrame(object):
     return '<_FdFrame %s %s>' % (self.saved, self.need_close)
 
 
+# The shell's own descriptors, e.g. saved copies of redirected descriptors,
+# are at or above this number.  Scripts use 0-9.
+_SHELL_MIN_FD = 10
+
+# Our patched Python-2.7.13 has F_DUPFD_CLOEXEC, but CPython 2 doesn't.
+_F_DUPFD_CLOEXEC = getattr(fcntl, 'F_DUPFD_CLOEXEC', None)
+
+
+def _DupHigh(fd):
+  """Copy 'fd' to the lowest free descriptor >= _SHELL_MIN_FD.
+
+  The copy is closed on exec.
+
+  Raises:
+    IOError, e.g. EBADF if 'fd' isn't open.
+  """
+  if _F_DUPFD_CLOEXEC is not None:
+    return fcntl.fcntl(fd, _F_DUPFD_CLOEXEC, _SHELL_MIN_FD)
+  new_fd = fcntl.fcntl(fd, fcntl.F_DUPFD, _SHELL_MIN_FD)
+  fcntl.fcntl(new_fd, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+  return new_fd
+
+
+# A pipe can always hold this much without blocking the writer.  Linux pipes
+# hold 64 KiB by default, but they can be made smaller.
+_PIPE_SIZE = 4096
+
+
+def _WriteAll(fd, s):
+  """Write a whole string to a descriptor, handling partial writes."""
+  n = len(s)
+  i = 0
+  while i < n:
+    i += posix.write(fd, s[i:])
+
+
+_heredoc_counter = [0]
+
+
+def _HereDocTempFile(body):
+  """Write a here doc to an unlinked temp file.
+
+  Returns:
+    A descriptor open for reading at the start of the body, or -1 on error.
+  """
+  tmp_dir = posix.environ.get('TMPDIR') or '/tmp'
+  _heredoc_counter[0] += 1
+  path = os_path.join(
+      tmp_dir, 'osh-heredoc-%d-%d' % (posix.getpid(), _heredoc_counter[0]))
+  try:
+    write_fd = posix.open(path, posix.O_WRONLY | posix.O_CREAT | posix.O_EXCL,
+                          0o600)
+  except OSError:
+    return -1
+
+  # Open it again for reading, so we don't have to seek.
+  try:
+    read_fd = posix.open(path, posix.O_RDONLY, 0)
+  except OSError:
+    read_fd = -1
+  posix.unlink(path)
+
+  if read_fd != -1:
+    try:
+      _WriteAll(write_fd, body)
+    except OSError:  # e.g. disk full
+      posix.close(read_fd)
+      read_fd = -1
+  posix.close(write_fd)
+  return read_fd
+
+
 class FdState(object):
   """This is for the current process, as opposed to child processes.
 
@@ -141,23 +260,9 @@ class FdState(object):
     self.errfmt = errfmt
     self.cur_frame = _FdFrame()  # for the top level
     self.stack = [self.cur_frame]
-
-  # TODO: Use fcntl(F_DUPFD) and look at the return value!  I didn't understand
-  # the difference.
-
-  def _GetFreeDescriptor(self):
-    """Return a free file descriptor above 10 that isn't used."""
-    done = False
-    fd = 10
-    while True:
-      try:
-        fcntl.fcntl(fd, fcntl.F_GETFD)
-      except IOError as e:
-        if e.errno == errno.EBADF:
-          break
-      fd += 1
-
-    return fd
+    # Saved descriptors that we'll restore, so we can move them out of the
+    # way of a redirect like 10>&1.
+    self.owned = set()
 
   def Open(self, path, mode='r'):
     """Opens a path for read, but moves it out of the reserved 3-9 fd range.
@@ -176,8 +281,7 @@ class FdState(object):
       raise AssertionError(mode)
 
     fd = posix.open(path, fd_mode, 0o666)  # may raise OSError
-    new_fd = self._GetFreeDescriptor()
-    posix.dup2(fd, new_fd)
+    new_fd = _DupHigh(fd)
     posix.close(fd)
     try:
       f = posix.fdopen(new_fd, mode)  # Might raise IOError
@@ -185,6 +289,17 @@ class FdState(object):
       raise OSError(*e.args)  # Consistently raise OSError
     return f
 
+  def _MoveOwned(self, fd):
+    """Move one of our saved descriptors, so a redirect can use 'fd'."""
+    new_fd = _DupHigh(fd)
+    posix.close(fd)
+    for frame in self.stack:
+      for i, (saved, orig) in enumerate(frame.saved):
+        if saved == fd:
+          frame.saved[i] = (new_fd, orig)
+    self.owned.remove(fd)
+    self.owned.add(new_fd)
+
   def _PushDup(self, fd1, fd2):
     """Save fd2, and dup fd1 onto fd2.
 
@@ -193,23 +308,27 @@ class FdState(object):
     Returns:
       success Bool
     """
-    new_fd = self._GetFreeDescriptor()
     #log('---- _PushDup %s %s', fd1, fd2)
-    need_restore = True
-    try:
-      fcntl.fcntl(fd2, fcntl.F_DUPFD, new_fd)
-    except IOError as e:
-      # Example program that causes this error: exec 4>&1.  Descriptor 4 isn't
-      # open.
-      # This seems to be ignored in dash too in savefd()?
-      if e.errno == errno.EBADF:
-        #log('ERROR %s', e)
-        need_restore = False
-      else:
-        raise
+    if fd2 in self.owned:
+      # e.g. { echo hi 10>&1; } 2>err, where 10 is the saved stderr.  To the
+      # script, fd2 wasn't open, so close it afterward.
+      self._MoveOwned(fd2)
+      need_restore = False
+      need_close = True
     else:
-      posix.close(fd2)
-      fcntl.fcntl(new_fd, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+      need_close = False
+      need_restore = True
+      try:
+        new_fd = _DupHigh(fd2)
+      except IOError as e:
+        # Example program that causes this error: exec 4>&1.  Descriptor 4
+        # isn't open.
+        # This seems to be ignored in dash too in savefd()?
+        if e.errno == errno.EBADF:
+          #log('ERROR %s', e)
+          need_restore = False
+        else:
+          raise
 
     #log('==== dup %s %s\n' % (fd1, fd2))
     try:
@@ -218,14 +337,16 @@ class FdState(object):
       # bash/dash give this error too, e.g. for 'echo hi 1>&3'
       self.errfmt.Print('%d: %s', fd1, posix.strerror(e.errno))
 
-      # Restore and return error
-      posix.dup2(new_fd, fd2)
-      posix.close(new_fd)
       # Undo it
+      if need_restore:
+        posix.close(new_fd)
       return False
 
     if need_restore:
+      self.owned.add(new_fd)
       self.cur_frame.saved.append((new_fd, fd2))
+    elif need_close:
+      self._PushClose(fd2)
     return True
 
   def _PushClose(self, fd):
@@ -234,34 +355,47 @@ class FdState(object):
   def _PushWait(self, proc, waiter):
     self.cur_frame.need_wait.append((proc, waiter))
 
+  def _OpenRedirectPath(self, r):
+    """Open the file for a PathRedirect.
+
+    Returns:
+      A descriptor, or -1 after printing an error.
+    """
+    if r.op_id in (Id.Redir_Great, Id.Redir_AndGreat):  # >   &>
+      # NOTE: This is different than >| because it respects noclobber, but
+      # that option is almost never used.  See test/wild.sh.
+      mode = posix.O_CREAT | posix.O_WRONLY | posix.O_TRUNC
+    elif r.op_id == Id.Redir_Clobber:  # >|
+      mode = posix.O_CREAT | posix.O_WRONLY | posix.O_TRUNC
+    elif r.op_id in (Id.Redir_DGreat, Id.Redir_AndDGreat):  # >>   &>>
+      mode = posix.O_CREAT | posix.O_WRONLY | posix.O_APPEND
+    elif r.op_id == Id.Redir_Less:  # <
+      mode = posix.O_RDONLY
+    else:
+      raise NotImplementedError(r.op_id)
+
+    # NOTE: 0666 is affected by umask, all shells use it.
+    try:
+      return posix.open(r.filename, mode, 0o666)
+    except OSError as e:
+      self.errfmt.Print(
+          "Can't open %r: %s", r.filename, posix.strerror(e.errno),
+          span_id=r.op_spid)
+      return -1
+
   def _ApplyRedirect(self, r, waiter):
     ok = True
 
     if r.tag == redirect_e.PathRedirect:
-      if r.op_id in (Id.Redir_Great, Id.Redir_AndGreat):  # >   &>
-        # NOTE: This is different than >| because it respects noclobber, but
-        # that option is almost never used.  See test/wild.sh.
-        mode = posix.O_CREAT | posix.O_WRONLY | posix.O_TRUNC
-      elif r.op_id == Id.Redir_Clobber:  # >|
-        mode = posix.O_CREAT | posix.O_WRONLY | posix.O_TRUNC
-      elif r.op_id in (Id.Redir_DGreat, Id.Redir_AndDGreat):  # >>   &>>
-        mode = posix.O_CREAT | posix.O_WRONLY | posix.O_APPEND
-      elif r.op_id == Id.Redir_Less:  # <
-        mode = posix.O_RDONLY
-      else:
-        raise NotImplementedError(r.op_id)
-
-      # NOTE: 0666 is affected by umask, all shells use it.
-      try:
-        target_fd = posix.open(r.filename, mode, 0o666)
-      except OSError as e:
-        self.errfmt.Print(
-            "Can't open %r: %s", r.filename, posix.strerror(e.errno),
-            span_id=r.op_spid)
+      target_fd = self._OpenRedirectPath(r)
+      if target_fd == -1:
         return False
 
       # Apply redirect
-      if not self._PushDup(target_fd, r.fd):
+      if target_fd == r.fd:
+        # e.g. 3>out when descriptor 3 wasn't open.  It's already in place.
+        self._PushClose(target_fd)
+      elif not self._PushDup(target_fd, r.fd):
         ok = False
 
       # Now handle the extra redirects for aliases &> and &>>.
@@ -283,7 +417,8 @@ class FdState(object):
           if not self._PushDup(r.fd, 2):
             ok = False
 
-      posix.close(target_fd)  # We already made a copy of it.
+      if target_fd != r.fd:
+        posix.close(target_fd)  # We already made a copy of it.
       # I don't think we need to close(0) because it will be restored from its
       # saved position (10), which closes it.
       #self._PushClose(r.fd)
@@ -302,42 +437,61 @@ class FdState(object):
         raise NotImplementedError
 
     elif r.tag == redirect_e.HereRedirect:
-      # NOTE: Do these descriptors have to be moved out of the range 0-9?
-      read_fd, write_fd = posix.pipe()
+      if len(r.body) <= _PIPE_SIZE:
+        # The common case.  Like dash and bash, write the whole body into the
+        # pipe before running the command, so there's no writer process.
+        read_fd, write_fd = posix.pipe()
+        _WriteAll(write_fd, r.body)
+        posix.close(write_fd)
+        ok = self._PushHereDocFd(read_fd, r.fd)  # stdin is now the pipe
 
-      if not self._PushDup(read_fd, r.fd):  # stdin is now the pipe
-        ok = False
+      else:
+        read_fd = _HereDocTempFile(r.body)
+        if read_fd != -1:
+          ok = self._PushHereDocFd(read_fd, r.fd)
+        else:
+          ok = self._PushHereDocWriter(r, waiter)
+
+    return ok
 
-      # We can't close like we do in the filename case above?  The writer can
-      # get a "broken pipe".
+  def _PushHereDocFd(self, read_fd, fd):
+    """Make 'fd' read from the here doc body in 'read_fd'."""
+    if read_fd == fd:
+      # e.g. cat 3<<EOF when descriptor 3 wasn't open.  It's already in place.
       self._PushClose(read_fd)
+      return True
 
-      thunk = _HereDocWriterThunk(write_fd, r.body)
+    ok = self._PushDup(read_fd, fd)
+    posix.close(read_fd)  # We already made a copy of it.
+    return ok
 
-      # TODO: Use PIPE_SIZE to save a process in the case of small here docs,
-      # which are the common case.  (dash does this.)
-      start_process = True
-      #start_process = False
+  def _PushHereDocWriter(self, r, waiter):
+    """Start a process that writes the here doc into a pipe.
 
-      if start_process:
-        here_proc = Process(thunk)
+    The fallback when we can't create a temp file.
+    """
+    read_fd, write_fd = posix.pipe()
 
-        # NOTE: we could close the read pipe here, but it doesn't really
-        # matter because we control the code.
-        # here_proc.StateChange()
-        pid = here_proc.Start()
-        # no-op callback
-        waiter.Register(pid, here_proc.WhenDone)
-        #log('Started %s as %d', here_proc, pid)
-        self._PushWait(here_proc, waiter)
+    ok = self._PushDup(read_fd, r.fd)  # stdin is now the pipe
 
-        # Now that we've started the child, close it in the parent.
-        posix.close(write_fd)
+    # We can't close like we do in the filename case above?  The writer can
+    # get a "broken pipe".
+    self._PushClose(read_fd)
 
-      else:
-        posix.write(write_fd, r.body)
-        posix.close(write_fd)
+    thunk = _HereDocWriterThunk(write_fd, r.body)
+    here_proc = Process(thunk)
 
+    # NOTE: we could close the read pipe here, but it doesn't really
+    # matter because we control the code.
+    # here_proc.StateChange()
+    pid = here_proc.Start()
+    # no-op callback
+    waiter.Register(pid, here_proc.WhenDone)
+    #log('Started %s as %d', here_proc, pid)
+    self._PushWait(here_proc, waiter)
+
+    # Now that we've started the child, close it in the parent.
+    posix.close(write_fd)
     return ok
 
   def Push(self, redirects, waiter):
@@ -357,6 +511,68 @@ class FdState(object):
     #log('done applying %d redirects', len(redirects))
     return True
 
+  def CanPushStdio(self, redirects):
+    """Can PushStdio() apply these redirects?
+
+    Only output redirects on stdout, to a file or to stderr.  Errors are
+    written to descriptor 2 in many ways, e.g. through ui.PrettyPrintError()
+    and util.log(), so stderr redirects always use Push().
+    """
+    for r in redirects:
+      if r.fd != 1:
+        return False
+      if r.tag == redirect_e.DescRedirect:
+        if r.op_id != Id.Redir_GreatAnd or r.target_fd not in (1, 2):
+          return False
+      elif r.tag == redirect_e.PathRedirect:
+        if r.op_id in (Id.Redir_Less, Id.Redir_AndGreat, Id.Redir_AndDGreat):
+          return False
+      else:
+        return False
+    return True
+
+  def PushStdio(self, redirects):
+    """Point sys.stdout at the redirect target.
+
+    A fast path for builtins that only write their output to that object, like
+    'echo hi >&2'.  It doesn't save and restore descriptors.
+
+    Returns:
+      success Bool.  On failure, there's nothing to Pop().
+    """
+    new_frame = _FdFrame()
+    target = sys.stdout
+    for r in redirects:
+      if r.tag == redirect_e.DescRedirect:  # e.g. 1>&2
+        if r.target_fd == 2:
+          target = sys.stderr
+        continue
+
+      fd = self._OpenRedirectPath(r)
+      if fd == -1:
+        for f, _ in new_frame.need_close_files:
+          f.close()
+        return False
+      target = posix.fdopen(fd, 'w')
+      new_frame.need_close_files.append((target, r.op_spid))
+
+    new_frame.saved_stdout = sys.stdout
+    sys.stdout = target
+
+    self.stack.append(new_frame)
+    self.cur_frame = new_frame
+    return True
+
+  def StdoutIsRedirectFile(self):
+    """Is sys.stdout a file that PushStdio() opened?
+
+    Pop() flushes and closes it, and reports write errors.
+    """
+    for f, _ in self.stack[-1].need_close_files:
+      if f is sys.stdout:
+        return True
+    return False
+
   def PushStdinFromPipe(self, r):
     """Save the current stdin and make it come from descriptor 'r'.
 
@@ -371,10 +587,30 @@ class FdState(object):
     return self._PushDup(r, 0)
 
   def MakePermanent(self):
+    # The saved descriptors won't be restored.
+    for saved, _ in self.cur_frame.saved:
+      posix.close(saved)
+      self.owned.remove(saved)
     self.cur_frame.Forget()
 
   def Pop(self):
+    """Undo the last Push() or PushStdio().
+
+    Returns:
+      False if writing buffered output to a redirect target failed, e.g.
+      'echo hi >/dev/full'.  The error was printed.
+    """
+    ok = True
     frame = self.stack.pop()
+    if frame.saved_stdout:  # from PushStdio()
+      sys.stdout = frame.saved_stdout
+      for f, span_id in frame.need_close_files:
+        try:
+          f.close()
+        except IOError as e:  # e.g. ENOSPC
+          self.errfmt.Print('write error: %s', posix.strerror(e.errno),
+                            span_id=span_id)
+          ok = False
     #log('< Pop %s', frame)
     for saved, orig in reversed(frame.saved):
       try:
@@ -385,6 +621,7 @@ class FdState(object):
         #posix.system('ls -l /proc/%s/fd' % posix.getpid())
         raise
       posix.close(saved)
+      self.owned.remove(saved)
       #log('dup2 %s %s', saved, orig)
 
     for fd in frame.need_close:
@@ -399,6 +636,8 @@ class FdState(object):
     for proc, waiter in frame.need_wait:
       unused_status = proc.WaitUntilDone(waiter)
 
+    return ok
+
 
 class ChildStateChange(object):
 
@@ -454,17 +693,67 @@ def _ShouldHijack(line):
 
 
 class ExternalProgram(object):
-  def __init__(self, hijack_shebang, fd_state, errfmt, debug_f):
+  def __init__(self, hijack_shebang, fd_state, search_path, errfmt, debug_f):
     """
     Args:
       hijack_shebang: The path of an interpreter to run instead of the one
         specified in the shebang line.  May be empty.
+      search_path: state.SearchPath, which caches the location of commands
     """
     self.hijack_shebang = hijack_shebang
     self.fd_state = fd_state
+    self.search_path = search_path
     self.errfmt = errfmt
     self.debug_f = debug_f
 
+  def _Resolve(self, name):
+    """Return the file to execute, or None if it's not in the table."""
+    if '/' in name:
+      return name
+    return self.search_path.CachedLookup(name, hit=True)
+
+  def _MaybeHijack(self, argv):
+    if not self.hijack_shebang:
+      return argv
+    try:
+      f = self.fd_state.Open(argv[0])
+    except OSError:
+      pass
+    else:
+      try:
+        line = f.read(40)
+        if _ShouldHijack(line):
+          self.debug_f.log('Hijacked: %s with %s', argv, self.hijack_shebang)
+          argv = [self.hijack_shebang] + argv
+        else:
+          #self.debug_f.log('Not hijacking %s (%r)', argv, line)
+          pass
+      finally:
+        f.close()
+    return argv
+
+  def Spawn(self, arg_vec, environ):
+    """Start a program with posix_spawn(), without forking the shell.
+
+    The cost of fork() grows with the size of the shell's heap.  Redirects
+    have already been applied to this process, so the child only needs the
+    signal handlers reset.
+
+    Returns:
+      The PID of the child, or -1 if the caller should fork() and Exec()
+      instead.  Errors like 'command not found' are reported that way.
+    """
+    argv = self._MaybeHijack(arg_vec.strs)
+    path = self._Resolve(argv[0])
+    if path is None:
+      return -1
+    try:
+      return posix.posix_spawn(path, argv, environ, _CHILD_DEFAULT_SIGNALS)
+    except OSError:
+      if path != argv[0]:
+        self.search_path.MaybeRemove(argv[0])  # e.g. the file was deleted
+      return -1
+
   def Exec(self, arg_vec, environ):
     """Execute a program and exit this process.
 
@@ -473,27 +762,17 @@ class ExternalProgram(object):
     exec ls /
     ( ls / )
     """
-    argv = arg_vec.strs
-    if self.hijack_shebang:
-      try:
-        f = self.fd_state.Open(argv[0])
-      except OSError as e:
-        pass
-      else:
-        try:
-          line = f.read(40)
-          if _ShouldHijack(line):
-            self.debug_f.log('Hijacked: %s with %s', argv, self.hijack_shebang)
-            argv = [self.hijack_shebang] + argv
-          else:
-            #self.debug_f.log('Not hijacking %s (%r)', argv, line)
-            pass
-        finally:
-          f.close()
+    argv = self._MaybeHijack(arg_vec.strs)
 
     # TODO: If there is an error, like the file isn't executable, then we should
     # exit, and the parent will reap it.  Should it capture stderr?
+    path = self._Resolve(argv[0])
     try:
+      if path is not None and path != argv[0]:
+        try:
+          posix.execve(path, argv, environ)
+        except OSError as e:
+          pass  # e.g. a stale table entry; search $PATH again below
       os_.execvpe(argv[0], argv, environ)
     except OSError as e:
       # TODO: Run with /bin/sh when ENOEXEC error (noshebang).  Because all
@@ -537,6 +816,9 @@ class ExternalThunk(object):
     """
     self.ext_prog.Exec(self.arg_vec, self.environ)
 
+  def Spawn(self):
+    return self.ext_prog.Spawn(self.arg_vec, self.environ)
+
 
 class SubProgramThunk(object):
   """A subprogram that can be executed in another process."""
@@ -655,6 +937,14 @@ class Process(Job):
     #
     # The whole job control mechanism is complicated and hacky.
 
+    # Fast path for a foreground external command.  A process in a pipeline has
+    # state changes to apply in the child, so it always forks.
+    if isinstance(self.thunk, ExternalThunk) and not self.state_changes:
+      pid = self.thunk.Spawn()
+      if pid != -1:
+        self.pid = pid
+        return pid
+
     pid = posix.fork()
     if pid < 0:
       # When does this happen?
@@ -663,6 +953,10 @@ class Process(Job):
     elif pid == 0:  # child
       SignalState_AfterForkingChild()
 
+      # We may have been forked while stdout was captured by an in-process
+      # command sub.  See Executor.RunCommandSub.
+      sys.stdout = sys.__stdout__
+
       # This doesn't make the child respond to Ctrl-Z?  Why not?  Is there
       # something at the Python level?  signalmodule.c has PyOS_AfterFork but
       # it seems OK.
@@ -682,11 +976,9 @@ class Process(Job):
     return pid
 
   def WaitUntilDone(self, waiter):
-    while True:
+    while self.state != process_state_e.Done:
       #log('WAITING')
-      if not waiter.Wait():
-        break
-      if self.state == process_state_e.Done:
+      if not waiter.WaitForPid(self.pid):
         break
     return self.status
 
@@ -804,13 +1096,11 @@ class Pipeline(Job):
     return self.pids[-1]  # the last PID is the job ID
 
   def WaitUntilDone(self, waiter):
-    while True:
+    for i, pid in enumerate(self.pids):
       #log('WAIT pipeline')
-      if not waiter.Wait():
-        break
-      if self.state == process_state_e.Done:
-        #log('Pipeline DONE')
-        break
+      while self.pipe_status[i] == -1:
+        if not waiter.WaitForPid(pid):
+          break
 
     return self.pipe_status
 
@@ -855,7 +1145,7 @@ class Pipeline(Job):
       self.status = self.pipe_status[-1]  # last one
       self.state = process_state_e.Done
       if self.job_state:
-        self.job_state.WhenDone(self.pipe_status[-1])
+        self.job_state.WhenDone(self.pids[-1])
 
 
 class JobState(object):
@@ -866,10 +1156,16 @@ class JobState(object):
     # A pipeline that is backgrounded is always run in a SubProgramThunk?  So
     # you can wait for it once?
     self.jobs = {}
+    self.running = set()  # job IDs that haven't finished
 
   def Register(self, pid, job):
     """ Used by 'sleep 1 &' """
     self.jobs[pid] = job
+    self.running.add(pid)
+
+  def NumRunning(self):
+    """Used to limit the number of background jobs."""
+    return len(self.running)
 
   def List(self):
     """Used by the 'jobs' builtin."""
@@ -900,7 +1196,7 @@ class JobState(object):
   def WhenDone(self, pid):
     """Process and Pipeline can call this."""
     log('JobState WhenDone %d', pid)
-    # TODO: Update the list
+    self.running.discard(pid)
 
 
 class Waiter(object):
@@ -932,10 +1228,17 @@ class Waiter(object):
     self.callbacks = {}  # pid -> callback
     self.last_status = 127  # wait -n error code
 
+    # Read end of the SIGCHLD self-pipe, set by SignalState.InitSigChld().
+    # When it's -1, or we're in a forked subshell, Poll() always calls
+    # waitpid().
+    self.sigchld_fd = -1
+    self.sigchld_pid = -1
+
   def Register(self, pid, callback):
     self.callbacks[pid] = callback
 
   def Wait(self):
+    """Wait for ANY child.  Used by the 'wait' builtin."""
     # This is a list of async jobs
     while True:
       try:
@@ -952,6 +1255,59 @@ class Waiter(object):
       else:
         break  # no exception thrown, so no need to retry
 
+    self._Dispatch(pid, status)
+    return True  # caller should keep waiting
+
+  def WaitForPid(self, pid):
+    """Wait for a specific child, so we don't reap unrelated background jobs.
+
+    Returns:
+      False if there's no such child, which means the caller should stop.
+    """
+    try:
+      pid, status = posix.waitpid(pid, 0)
+    except OSError as e:
+      if e.errno == errno.ECHILD:
+        return False
+      raise  # EINTR was handled by the 'posix' module
+    self._Dispatch(pid, status)
+    return True
+
+  def Poll(self):
+    """Reap children that have exited, without blocking.
+
+    Called before printing a prompt, by the 'jobs' builtin, and before each
+    command while background jobs are running.  If SIGCHLD hasn't arrived
+    since the last call, we don't make any system calls other than read().
+
+    Returns:
+      The number of children reaped.
+    """
+    if self.sigchld_fd != -1 and posix.getpid() == self.sigchld_pid:
+      try:
+        if not posix.read(self.sigchld_fd, 512):
+          return 0  # unreachable: the write end is never closed
+      except OSError as e:
+        if e.errno == errno.EAGAIN:
+          return 0  # no SIGCHLD
+        raise
+
+    n = 0
+    while True:
+      try:
+        pid, status = posix.waitpid(-1, posix.WNOHANG)
+      except OSError as e:
+        if e.errno == errno.ECHILD:
+          break
+        raise
+      if pid == 0:  # children exist, but none have exited
+        break
+      self._Dispatch(pid, status)
+      n += 1
+    return n
+
+  def _Dispatch(self, pid, status):
+    """Decode the status from wait() and call the registered callback."""
     #log('WAIT got %s %s', pid, status)
 
     # TODO: Also handle WIFSTOPPED case?
@@ -973,10 +1329,8 @@ class Waiter(object):
     # processes, so print a warning.
     if pid not in self.callbacks:
       ui.Stderr("osh: PID %d stopped, but osh didn't start it", pid)
-      return True  # caller should keep waiting
+      return
 
     callback = self.callbacks.pop(pid)
     callback(pid, status)
     self.last_status = status  # for wait -n
-
-    return True  # caller should keep waiting
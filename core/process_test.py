@@ -3,12 +3,17 @@
 process_test.py: Tests for process.py
 """
 
+import fcntl
 import os
+import signal
+import sys
 import unittest
 
+from asdl import const
 from _devbuild.gen.id_kind_asdl import Id
-from _devbuild.gen.runtime_asdl import redirect, arg_vector
+from _devbuild.gen.runtime_asdl import redirect, arg_vector, process_state_e
 from osh import builtin
+from osh import state
 from core import process  # module under test
 from core import ui
 from core import util
@@ -28,7 +33,9 @@ _WAITER = process.Waiter()
 _ARENA = test_lib.MakeArena('process_test.py')
 _ERRFMT = ui.ErrorFormatter(_ARENA)
 _FD_STATE = process.FdState(_ERRFMT)
-_EXT_PROG = process.ExternalProgram(False, _FD_STATE, _ERRFMT,
+_MEM = state.Mem('', [], {'PATH': '/nonexistent:/bin:/usr/bin'}, _ARENA)
+_SEARCH_PATH = state.SearchPath(_MEM)
+_EXT_PROG = process.ExternalProgram(False, _FD_STATE, _SEARCH_PATH, _ERRFMT,
                                     util.NullDebugFile())
 
 
@@ -68,6 +75,87 @@ class ProcessTest(unittest.TestCase):
     self.assertEqual('one\n', line1)
     self.assertEqual('one\n', line2)
 
+  def testHereDoc(self):
+    waiter = process.Waiter()
+    fd_state = process.FdState(_ERRFMT)
+
+    # Small bodies go through a pipe, and big ones through a temp file.
+    # Neither starts a process.
+    for body in ['one\ntwo\n', 'x' * 10000 + '\n']:
+      r = redirect.HereRedirect(0, body, -1)
+      fd_state.Push([r], waiter)
+      self.assertEqual([], fd_state.cur_frame.need_wait)
+      line = builtin.ReadLineFromStdin()
+      fd_state.Pop()
+      self.assertEqual(body.splitlines(True)[0], line)
+
+    fd = process._HereDocTempFile('body')
+    self.assertEqual('body', os.read(fd, 100))
+    os.close(fd)
+
+  def testSavedDescriptors(self):
+    fd_state = process.FdState(_ERRFMT)
+
+    # The saved stdout is owned by the shell
+    r = redirect.PathRedirect(Id.Redir_Great, 1, '/dev/null')
+    fd_state.Push([r], _WAITER)
+    self.assertEqual(1, len(fd_state.owned))
+    saved = list(fd_state.owned)[0]
+    self.assertEqual(True, saved >= 10)
+
+    # A redirect onto it moves it out of the way
+    r = redirect.DescRedirect(Id.Redir_GreatAnd, saved, 2)
+    fd_state.Push([r], _WAITER)
+    self.assertEqual(False, saved in fd_state.owned)
+    fd_state.Pop()
+
+    fd_state.Pop()
+    self.assertEqual(set(), fd_state.owned)
+    self.assertRaises(IOError, fcntl.fcntl, saved, fcntl.F_GETFD)
+
+  def testPushStdio(self):
+    fd_state = process.FdState(_ERRFMT)
+    stdout, stderr = sys.stdout, sys.stderr
+
+    PATH = '_tmp/push-stdio.txt'
+    redirects = [redirect.PathRedirect(Id.Redir_Great, 1, PATH)]
+    self.assertEqual(True, fd_state.CanPushStdio(redirects))
+    self.assertEqual(True, fd_state.PushStdio(redirects))
+    self.assertEqual([], fd_state.cur_frame.saved)  # no descriptors saved
+    self.assertEqual(stderr, sys.stderr)
+    sys.stdout.write('out\n')
+    fd_state.Pop()
+
+    self.assertEqual((stdout, stderr), (sys.stdout, sys.stderr))
+    with open(PATH) as f:
+      self.assertEqual('out\n', f.read())
+
+    # Pop() reports write errors, e.g. 'echo hi >/dev/full'
+    redirects = [redirect.PathRedirect(Id.Redir_Great, 1, '/dev/full',
+                                       const.NO_INTEGER)]
+    self.assertEqual(True, fd_state.PushStdio(redirects))
+    sys.stdout.write('out\n')
+    self.assertEqual(True, fd_state.StdoutIsRedirectFile())
+    self.assertEqual(False, fd_state.Pop())
+    self.assertEqual(False, fd_state.StdoutIsRedirectFile())
+    self.assertEqual(stdout, sys.stdout)
+
+    r = redirect.DescRedirect(Id.Redir_GreatAnd, 1, 2)
+    self.assertEqual(True, fd_state.CanPushStdio([r]))
+
+    # Errors aren't all written through sys.stderr, e.g. 'test 1 -eq x
+    # 2>/dev/null'
+    r = redirect.PathRedirect(Id.Redir_Great, 2, PATH)
+    self.assertEqual(False, fd_state.CanPushStdio([r]))
+    r = redirect.DescRedirect(Id.Redir_GreatAnd, 2, 1)
+    self.assertEqual(False, fd_state.CanPushStdio([r]))
+    r = redirect.PathRedirect(Id.Redir_AndGreat, 1, PATH)
+    self.assertEqual(False, fd_state.CanPushStdio([r]))
+    r = redirect.PathRedirect(Id.Redir_Less, 0, PATH)
+    self.assertEqual(False, fd_state.CanPushStdio([r]))
+    r = redirect.DescRedirect(Id.Redir_GreatAnd, 1, 3)
+    self.assertEqual(False, fd_state.CanPushStdio([r]))
+
   def testProcess(self):
 
     # 3 fds.  Does Python open it?  Shell seems to have it too.  Maybe it
@@ -148,6 +236,39 @@ class ProcessTest(unittest.TestCase):
     # Or technically we could fork the whole interpreter for foo|bar|baz and
     # capture stdout of that interpreter.
 
+  def testWaitForPid(self):
+    waiter = process.Waiter()
+
+    # The foreground process is reaped, but the background one isn't.
+    bg = _ExtProc(['sh', '-c', 'exit 3'])
+    bg.Start()
+    waiter.Register(bg.pid, bg.WhenDone)
+
+    p = _ExtProc(['sh', '-c', 'sleep 0.05; exit 4'])
+    self.assertEqual(4, p.Run(waiter))
+    self.assertEqual(process_state_e.Init, bg.State())
+
+    self.assertEqual(3, bg.WaitUntilDone(waiter))
+    self.assertEqual(False, waiter.WaitForPid(bg.pid))
+
+  def testPoll(self):
+    waiter = process.Waiter()
+    sig_state = process.SignalState()
+    sig_state.InitSigChld(waiter)
+    try:
+      self.assertEqual(0, waiter.Poll())  # nothing to do
+
+      p = _ExtProc(['sh', '-c', 'exit 5'])
+      p.Start()
+      waiter.Register(p.pid, p.WhenDone)
+      while p.State() != process_state_e.Done:
+        waiter.Poll()
+      self.assertEqual(5, p.status)
+      self.assertEqual(0, waiter.Poll())
+    finally:
+      signal.set_wakeup_fd(-1)
+      signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+
   def testOpen(self):
     fd_state = process.FdState(_ERRFMT)
 
@@ -158,6 +279,23 @@ class ProcessTest(unittest.TestCase):
     self.assertRaises(OSError, fd_state.Open, '_nonexistent_')
     self.assertRaises(OSError, fd_state.Open, 'metrics/')
 
+  def testSpawn(self):
+    # Started with posix_spawn(), found in the hash table
+    _SEARCH_PATH.ClearCache()
+    p = _ExtProc(['sh', '-c', 'exit 42'])
+    self.assertEqual(42, p.Run(_WAITER))
+    self.assertEqual([('sh', '/bin/sh', 1)], _SEARCH_PATH.CachedCommands())
+
+    # The caller has to fork() and report the error
+    arg_vec = arg_vector(['_nonexistent_'], [0])
+    self.assertEqual(-1, _EXT_PROG.Spawn(arg_vec, {}))
+
+    # A stale entry is removed
+    _SEARCH_PATH.Put('stale', '/nonexistent/stale')
+    arg_vec = arg_vector(['stale'], [0])
+    self.assertEqual(-1, _EXT_PROG.Spawn(arg_vec, {}))
+    self.assertEqual(None, _SEARCH_PATH.cache.get('stale'))
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -100,7 +100,8 @@ def MakeArena(source_name):
 
 def InitLexer(s, arena):
   """For tests only."""
-  line_lexer = lexer.LineLexer(match.MATCHER, '', arena)
+  line_lexer = lexer.LineLexer(match.MATCHER, '', arena,
+                               multi_match_func=match.MULTI_MATCHER)
   line_reader = reader.StringLineReader(s, arena)
   lx = lexer.Lexer(line_lexer, line_reader)
   return line_reader, lx
@@ -158,8 +159,11 @@ def InitExecutor(parse_ctx=None, comp_lookup=None, arena=None, mem=None,
   exec_deps.job_state = process.JobState()
   exec_deps.waiter = process.Waiter()
 
+  search_path = state.SearchPath(mem)
+  exec_deps.search_path = search_path
   exec_deps.ext_prog = \
-      ext_prog or process.ExternalProgram('', fd_state, errfmt, debug_f)
+      ext_prog or process.ExternalProgram('', fd_state, search_path, errfmt,
+                                          debug_f)
 
   exec_deps.dumper = dev.CrashDumper('')
   exec_deps.debug_f = debug_f
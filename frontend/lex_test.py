@@ -333,6 +333,44 @@ class LineLexerTest(unittest.TestCase):
     self.assertTokensEqual(
         token(Id.Op_LParen, '('), l.LookAhead(lex_mode_e.ShCommand))
 
+  def testMultiMatch(self):
+    if not match.MULTI_MATCHER:
+      return  # only with fastlex
+
+    line = 'echo "$x" foo\n'
+    expected = [
+        (lex_mode_e.ShCommand, Id.Lit_Chars, 'echo'),
+        (lex_mode_e.ShCommand, Id.WS_Space, ' '),
+        (lex_mode_e.ShCommand, Id.Left_DoubleQuote, '"'),
+        # Mode change invalidates the batch
+        (lex_mode_e.DQ, Id.VSub_DollarName, '$x'),
+        (lex_mode_e.DQ, Id.Right_DoubleQuote, '"'),
+        (lex_mode_e.ShCommand, Id.WS_Space, ' '),
+        (lex_mode_e.ShCommand, Id.Lit_Chars, 'foo'),
+        (lex_mode_e.ShCommand, Id.Op_Newline, '\n'),
+        (lex_mode_e.ShCommand, Id.Eol_Tok, ''),
+    ]
+
+    fast = LineLexer(match.MATCHER, line, self.arena,
+                     multi_match_func=match.MULTI_MATCHER)
+    slow = LineLexer(match.MATCHER, line, self.arena)
+    for lex_mode, id_, val in expected:
+      t1 = fast.Read(lex_mode)
+      t2 = slow.Read(lex_mode)
+      self.assertEqual(id_, t1.id)
+      self.assertEqual(val, t1.val)
+      self.assertEqual(t2.id, t1.id)
+      self.assertEqual(t2.val, t1.val)
+
+    # Unreading invalidates the batch too
+    l = LineLexer(match.MATCHER, 'a b', self.arena,
+                  multi_match_func=match.MULTI_MATCHER)
+    self.assertEqual('a', l.Read(lex_mode_e.ShCommand).val)
+    self.assertEqual(' ', l.Read(lex_mode_e.ShCommand).val)
+    self.assertTrue(l.MaybeUnreadOne())
+    self.assertEqual(' ', l.Read(lex_mode_e.ShCommand).val)
+    self.assertEqual('b', l.Read(lex_mode_e.ShCommand).val)
+
 
 class RegexTest(unittest.TestCase):
 
@@ -12,13 +12,14 @@ from _devbuild.gen.syntax_asdl import token, line_span
 from _devbuild.gen.types_asdl import lex_mode_t
 from _devbuild.gen.id_kind_asdl import Id_t, Id
 from asdl import const
+from core.meta import IdInstance
 from core.util import log
 
-from typing import Callable, List, Tuple, TYPE_CHECKING
+from typing import Callable, List, Tuple, Optional, TYPE_CHECKING
 if TYPE_CHECKING:
   from core.alloc import Arena
   from frontend.reader import _Reader
-  from frontend.match import MatchFunc
+  from frontend.match import MatchFunc, MultiMatchFunc
 
 
 def C(pat, tok_type):
@@ -34,9 +35,16 @@ def R(pat, tok_type):
 
 
 class LineLexer(object):
-  def __init__(self, match_func, line, arena):
-    # type: (MatchFunc, str, Arena) -> None
+  def __init__(self, match_func, line, arena, multi_match_func=None):
+    # type: (MatchFunc, str, Arena, Optional[MultiMatchFunc]) -> None
+    """
+    Args:
+      match_func: returns one (id, end_pos) pair
+      multi_match_func: optional; lexes the rest of the line in one mode, to
+        avoid calling into the match function for every token.
+    """
     self.match_func = match_func
+    self.multi_match_func = multi_match_func
     self.arena = arena
 
     self.arena_skip = False  # For MaybeUnreadOne
@@ -56,6 +64,13 @@ class LineLexer(object):
     self.line_id = line_id
     self.line_pos = line_pos
 
+    # Tokens from multi_match_func.  They're only valid if the next Read() is
+    # in the same mode, at the position where the last batched token ended.
+    self.batch = None  # type: List[int]
+    self.batch_index = 0
+    self.batch_mode = None  # type: lex_mode_t
+    self.batch_pos = -1
+
   def MaybeUnreadOne(self):
     # type: () -> bool
     """Return True if we can unread one character, or False otherwise.
@@ -119,7 +134,22 @@ class LineLexer(object):
     line = self.line
     line_pos = self.line_pos
 
-    tok_type, end_pos = self.match_func(lex_mode, line, line_pos)
+    if self.multi_match_func:
+      batch = self.batch
+      i = self.batch_index
+      if (line_pos != self.batch_pos or lex_mode is not self.batch_mode or
+          i >= len(batch)):
+        batch = self.multi_match_func(lex_mode, line, line_pos)
+        self.batch = batch
+        self.batch_mode = lex_mode
+        i = 0
+      tok_type = IdInstance(batch[i])
+      end_pos = batch[i+1]
+      self.batch_index = i + 2
+      self.batch_pos = end_pos
+    else:
+      tok_type, end_pos = self.match_func(lex_mode, line, line_pos)
+
     if tok_type == Id.Eol_Tok:  # Do NOT add a span for this sentinel!
       return token(tok_type, '', const.NO_INTEGER)
 
@@ -2,13 +2,17 @@
 match.py - match with generated re2c code or Python regexes.
 """
 
-from _devbuild.gen.id_kind_asdl import Id, Id_t
+import array
+
+from _devbuild.gen.id_kind_asdl import Id, Id_t, Kind
 from _devbuild.gen.types_asdl import lex_mode_t
 #from core import util
-from core.meta import IdInstance
+from core.meta import IdInstance, LookupKind, ID_INSTANCES
 from frontend import lex
 
-from typing import Iterator, Tuple, Callable, Dict, List, Any, TYPE_CHECKING
+from typing import (
+    Iterator, Tuple, Callable, Dict, List, Any, Optional, TYPE_CHECKING
+)
 
 # bin/osh should work without compiling fastlex?  But we want all the unit
 # tests to run with a known version of it.
@@ -27,6 +31,7 @@ else:
 if TYPE_CHECKING:
   SRE_Pattern = Any  # Do we need a .pyi file for re or _sre?
   MatchFunc = Callable[[lex_mode_t, str, int], Tuple[Id_t, int]]
+  MultiMatchFunc = Callable[[lex_mode_t, str, int], array.array]
   SimpleMatchFunc = Callable[[str, int], Tuple[Id_t, int]]
   LexerPairs = List[Tuple[SRE_Pattern, Id_t]]
 
@@ -85,6 +90,39 @@ def _MatchOshToken_Fast(lex_mode, line, start_pos):
   return IdInstance(tok_type), end_pos
 
 
+def _MakeStopTable():
+  # type: () -> str
+  """Ids after which the parser is likely to change lexer modes.
+
+  e.g. after $( or " we switch to a different mode, so lexing the rest of the
+  line in the current mode would be wasted work.  This is only a heuristic: the
+  LineLexer checks the mode and position before using any batched token.
+  """
+  stop_kinds = (Kind.Left, Kind.Right, Kind.Eof)
+  stop_ids = (Id.Op_DLeftParen, Id.Lit_ArrayLhsOpen)
+
+  table = ['\0'] * len(ID_INSTANCES)
+  for id_ in ID_INSTANCES:
+    if id_ is None:
+      continue
+    if LookupKind(id_) in stop_kinds or id_ in stop_ids:
+      table[id_.enum_id] = '\1'
+  return ''.join(table)
+
+
+def _MatchOshTokens_Fast(lex_mode, line, start_pos):
+  # type: (lex_mode_t, str, int) -> array.array
+  """Lex the rest of the line in one mode.
+
+  Returns:
+    An array of ints: id0, end_pos0, id1, end_pos1, ...
+
+  The last pair is either Eol_Tok or a token in _STOP_TABLE.
+  """
+  buf = fastlex.MatchOshTokens(lex_mode.enum_id, line, start_pos, _STOP_TABLE)
+  return array.array('i', buf)
+
+
 class SimpleLexer(object):
   """Lexer for echo -e, which interprets C-escaped strings."""
   def __init__(self, match_func):
@@ -146,7 +184,10 @@ def _MatchBraceRangeToken_Fast(line, start_pos):
 
 
 if fastlex:
+  _STOP_TABLE = _MakeStopTable()
+
   MATCHER = _MatchOshToken_Fast
+  MULTI_MATCHER = _MatchOshTokens_Fast  # type: Optional[MultiMatchFunc]
   ECHO_MATCHER = _MatchEchoToken_Fast
   GLOB_MATCHER = _MatchGlobToken_Fast
   PS1_MATCHER = _MatchPS1Token_Fast
@@ -155,6 +196,9 @@ if fastlex:
   IsValidVarName = fastlex.IsValidVarName
 else:
   MATCHER = _MatchOshToken_Slow(lex.LEXER_DEF)
+  # Batching only pays off in C, so the Python lexer matches one token at a
+  # time.
+  MULTI_MATCHER = None
   ECHO_MATCHER = _MatchTokenSlow(lex.ECHO_E_DEF)
   GLOB_MATCHER = _MatchTokenSlow(lex.GLOB_DEF)
   PS1_MATCHER = _MatchTokenSlow(lex.PS1_DEF)
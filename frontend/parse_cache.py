@@ -0,0 +1,635 @@
+"""
+parse_cache.py - Caches of parsed code.
+
+- ParseCache: on disk, for sourced files and rc files.
+- CodeCache: in memory, for strings passed to 'eval' and 'trap'.
+
+ParseCache
+----------
+
+Enabled by setting $OSH_PARSE_CACHE_DIR.  When a sourced file or rc file is
+unchanged since the last time it was parsed, we skip the lexer and parser and
+rebuild the LST from the cache.
+
+Each entry stores:
+
+- The key: path, size, mtime, a hash of the contents, and a hash of the
+  aliases defined when parsing started.
+- The lines of the file, which go back into the arena for error messages,
+  $LINENO, etc.
+- The spans referenced by the LST, renumbered densely from zero.
+- The LST nodes, encoded as nested tuples of marshal-able values.
+
+The file is still parsed and executed one command at a time, so that aliases
+defined in a file are respected.  Each command is encoded right after it's
+parsed, and the entry is written when the parser reaches EOF.  So nothing is
+written if there was a parse error, or if execution stopped early, e.g. with
+'return'.
+
+Nothing is written if an alias was expanded.  The expansion may depend on
+commands that ran while the file was parsed, like
+'if test -n "$MODE"; then alias greet=...; fi', which the key doesn't cover.
+A file that only defines aliases, like a typical rc file, is still cached.
+
+Lines that came from backticks are stored with their source_t, which is
+relocated like the rest of the LST.
+"""
+
+import hashlib
+import marshal
+import stat
+
+import posix_ as posix
+
+from _devbuild.gen import id_kind_asdl
+from _devbuild.gen import syntax_asdl
+from _devbuild.gen import types_asdl
+from _devbuild.gen.syntax_asdl import command__ExpandedAlias
+from asdl import const
+from asdl import runtime
+from frontend import reader
+from pylib import os_path
+
+from typing import Any, List, Dict, Tuple, Optional, IO, TYPE_CHECKING
+if TYPE_CHECKING:
+  from _devbuild.gen.syntax_asdl import command_t
+  from core.alloc import Arena
+  from frontend.parse_lib import ParseContext
+  from osh.cmd_parse import CommandParser
+
+
+# Bump this when the encoding changes.  Changes to the ASDL schema are
+# detected by the registry fingerprint.
+_FORMAT_VERSION = 1
+
+# How to relocate each field of an LST node.
+_PLAIN = 0
+_SPID = 1
+_SPID_LIST = 2
+_LINE_ID = 3
+
+
+def _FieldKind(name):
+  # type: (str) -> int
+  if name == 'spids':
+    return _SPID_LIST
+  if name in ('spid', 'span_id') or name.endswith('_spid') or \
+     name.endswith('_span_id'):
+    return _SPID
+  if name == 'line_id' or name.endswith('_line_id'):
+    return _LINE_ID
+  return _PLAIN
+
+
+class _Registry(object):
+  """Numbers every LST node class and enum value, for encoding."""
+
+  def __init__(self):
+    # type: () -> None
+    entries = []  # type: List[Tuple[str, Any]]
+    for mod in (id_kind_asdl, syntax_asdl, types_asdl):
+      for name, val in sorted(vars(mod).items()):
+        if not isinstance(val, type) or val.__module__ != mod.__name__:
+          continue
+        if issubclass(val, runtime.CompoundObj):
+          if '__init__' in val.__dict__:  # skip abstract sum types
+            entries.append((name, val))
+        else:  # e.g. class Id, class bool_arg_type_e
+          for attr, v in sorted(vars(val).items()):
+            if isinstance(v, runtime.SimpleObj):
+              entries.append(('%s.%s' % (name, attr), v))
+
+    # index -> class or enum value, and the kind of each field
+    self.entries = [val for _, val in entries]  # type: List[Any]
+    self.field_kinds = [
+        tuple(_FieldKind(f) for f in val.__slots__)
+        if isinstance(val, type) else None
+        for val in self.entries
+    ]  # type: List[Optional[Tuple[int, ...]]]
+
+    self.class_index = {}  # type: Dict[Any, int]
+    self.enum_index = {}  # type: Dict[runtime.SimpleObj, int]
+    for i, val in enumerate(self.entries):
+      if isinstance(val, type):
+        self.class_index[val] = i
+      else:
+        # SimpleObj defines __hash__ but not __eq__, so this is by identity.
+        self.enum_index[val] = i
+
+    names = '\n'.join(
+        '%s %s' % (name, ' '.join(val.__slots__))
+        if isinstance(val, type) else name
+        for name, val in entries)
+    self.fingerprint = hashlib.sha1(names).hexdigest()
+
+
+class _NotCacheable(Exception):
+  pass
+
+
+def _HasExpandedAlias(obj):
+  # type: (Any) -> bool
+  """Does this LST contain an alias expansion?  See module docstring."""
+  if isinstance(obj, list):
+    for x in obj:
+      if _HasExpandedAlias(x):
+        return True
+    return False
+
+  if isinstance(obj, command__ExpandedAlias):
+    return True
+
+  if isinstance(obj, runtime.CompoundObj):
+    for name in obj.__slots__:
+      if _HasExpandedAlias(getattr(obj, name)):
+        return True
+  return False
+
+
+class _Encoder(object):
+  """Encode LST nodes, collecting the lines and spans they refer to."""
+
+  def __init__(self, registry, arena, src):
+    # type: (_Registry, Arena, Any) -> None
+    self.registry = registry
+    self.arena = arena
+    self.src = src  # the source_t that every line must come from
+
+    self.lines = []  # type: List[Tuple[str, int, Any]]
+    self.spans = []  # type: List[int]  # flat (line index, col, length)
+    self.line_index = {}  # type: Dict[int, int]  # arena line_id -> index
+    self.span_index = {}  # type: Dict[int, int]  # arena span_id -> index
+
+  def _LineIndex(self, line_id):
+    # type: (int) -> int
+    try:
+      return self.line_index[line_id]
+    except KeyError:
+      pass
+    arena = self.arena
+    src = arena.GetLineSource(line_id)
+    if src is self.src:
+      enc_src = None
+    elif isinstance(src, runtime.CompoundObj):  # e.g. source.Backticks
+      enc_src = self.Encode(src)
+    else:
+      raise _NotCacheable()
+    # Look it up again, since encoding the source may have added it
+    try:
+      return self.line_index[line_id]
+    except KeyError:
+      pass
+    i = len(self.lines)
+    self.lines.append(
+        (arena.GetLine(line_id), arena.GetLineNumber(line_id), enc_src))
+    self.line_index[line_id] = i
+    return i
+
+  def _SpanIndex(self, span_id):
+    # type: (int) -> int
+    if span_id == const.NO_INTEGER:
+      return span_id
+    try:
+      return self.span_index[span_id]
+    except KeyError:
+      pass
+    arena = self.arena
+    line_i = self._LineIndex(arena.GetSpanLineId(span_id))
+    i = len(self.spans) // 3
+    self.spans.extend(
+        (line_i, arena.GetSpanCol(span_id), arena.GetSpanLength(span_id)))
+    self.span_index[span_id] = i
+    return i
+
+  def Encode(self, obj):
+    # type: (Any) -> Any
+    if isinstance(obj, list):
+      return [self.Encode(x) for x in obj]
+
+    if isinstance(obj, command__ExpandedAlias):
+      raise _NotCacheable()  # see module docstring
+
+    if isinstance(obj, runtime.CompoundObj):
+      registry = self.registry
+      try:
+        i = registry.class_index[obj.__class__]
+      except KeyError:
+        raise _NotCacheable()
+      out = [i]
+      for name, kind in zip(obj.__slots__, registry.field_kinds[i]):
+        val = getattr(obj, name)
+        if kind == _PLAIN:
+          out.append(self.Encode(val))
+        elif val is None:
+          out.append(None)
+        elif kind == _SPID:
+          out.append(self._SpanIndex(val))
+        elif kind == _SPID_LIST:
+          out.append([self._SpanIndex(spid) for spid in val])
+        else:
+          out.append(
+              val if val == const.NO_INTEGER else self._LineIndex(val))
+      return tuple(out)
+
+    if isinstance(obj, runtime.SimpleObj):
+      try:
+        return (self.registry.enum_index[obj],)
+      except KeyError:
+        raise _NotCacheable()
+
+    if obj is None or isinstance(obj, (str, int, long, bool, float)):
+      return obj
+
+    raise _NotCacheable()  # e.g. an Oil expression
+
+
+class _Decoder(object):
+  """Rebuild LST nodes, with span IDs relocated into the current arena."""
+
+  def __init__(self, registry, span_base):
+    # type: (_Registry, int) -> None
+    self.entries = registry.entries
+    self.field_kinds = registry.field_kinds
+    self.span_base = span_base
+    self.line_ids = []  # type: List[int]  # filled in as lines are added
+
+  def Decode(self, obj):
+    # type: (Any) -> Any
+    # NOTE: This is the hot loop when loading, so it avoids zip() and slicing.
+    t = type(obj)
+    if t is list:
+      return [self.Decode(x) for x in obj]
+    if t is not tuple:
+      return obj
+
+    i = obj[0]
+    kinds = self.field_kinds[i]
+    if kinds is None:  # enum value
+      return self.entries[i]
+
+    span_base = self.span_base
+    args = []
+    j = 1
+    for kind in kinds:
+      x = obj[j]
+      j += 1
+      if kind == _PLAIN:
+        t = type(x)
+        if t is list or t is tuple:
+          x = self.Decode(x)
+        args.append(x)
+      elif x is None or x == const.NO_INTEGER:
+        args.append(x)
+      elif kind == _SPID:
+        args.append(x + span_base)
+      elif kind == _SPID_LIST:
+        args.append(
+            [s if s == const.NO_INTEGER else s + span_base for s in x])
+      else:
+        args.append(self.line_ids[x])
+    return self.entries[i](*args)
+
+
+class NodeListParser(object):
+  """Hands out nodes like CommandParser.ParseLogicalLine().
+
+  It has the subset of the CommandParser interface that main_loop.Batch()
+  uses.
+  """
+
+  def __init__(self, nodes):
+    # type: (Optional[List[command_t]]) -> None
+    self.nodes = nodes
+    self.pos = 0
+
+  def ParseLogicalLine(self):
+    # type: () -> Optional[command_t]
+    if self.pos == len(self.nodes):
+      return None
+    node = self.nodes[self.pos]
+    self.pos += 1
+    return node
+
+  def CheckForPendingHereDocs(self):
+    # type: () -> None
+    pass
+
+  def Reset(self):
+    # type: () -> None
+    pass
+
+  def ResetInputObjects(self):
+    # type: () -> None
+    pass
+
+
+class NodeRecorder(object):
+  """Wraps a CommandParser, and saves the nodes it returns.
+
+  If the parser reached EOF without an error, 'complete' is set, and 'nodes'
+  can be replayed with NodeListParser.
+  """
+
+  def __init__(self, c_parser):
+    # type: (CommandParser) -> None
+    self.c_parser = c_parser
+    self.nodes = []  # type: List[command_t]
+    self.at_eof = False
+    self.complete = False
+
+  def ParseLogicalLine(self):
+    # type: () -> Optional[command_t]
+    node = self.c_parser.ParseLogicalLine()
+    if node is None:
+      self.at_eof = True
+    else:
+      self.nodes.append(node)
+    return node
+
+  def CheckForPendingHereDocs(self):
+    # type: () -> None
+    self.c_parser.CheckForPendingHereDocs()  # can raise ParseError
+    self.complete = self.at_eof
+
+  def Reset(self):
+    # type: () -> None
+    self.c_parser.Reset()
+
+  def ResetInputObjects(self):
+    # type: () -> None
+    self.c_parser.ResetInputObjects()
+
+
+class _CachedParser(NodeListParser):
+  """Hands out nodes from an on-disk cache entry."""
+
+  def __init__(self, registry, arena, entry):
+    # type: (_Registry, Arena, Tuple[Any, ...]) -> None
+    NodeListParser.__init__(self, None)
+    self.registry = registry
+    self.arena = arena
+    self.entry = entry
+
+  def _Load(self):
+    # type: () -> None
+    """Add lines and spans to the arena, under the current source."""
+    lines, spans, encoded = self.entry
+    arena = self.arena
+    dec = _Decoder(self.registry, arena.LastSpanId())
+
+    line_ids = dec.line_ids
+    for line, line_num, enc_src in lines:
+      if enc_src is None:
+        line_ids.append(arena.AddLine(line, line_num))
+      else:
+        arena.PushSource(dec.Decode(enc_src))
+        line_ids.append(arena.AddLine(line, line_num))
+        arena.PopSource()
+
+    for i in xrange(0, len(spans), 3):
+      arena.AddLineSpan(line_ids[spans[i]], spans[i+1], spans[i+2])
+    # The nodes are rebuilt up front, so the spans must outlive the first
+    # command even with shopt -s reclaim_arena.
+    arena.Retain()
+
+    self.nodes = [dec.Decode(node) for node in encoded]
+    self.entry = None
+
+  def ParseLogicalLine(self):
+    # type: () -> Optional[command_t]
+    if self.nodes is None:
+      self._Load()
+    return NodeListParser.ParseLogicalLine(self)
+
+
+class _RecordingParser(object):
+  """Wraps a CommandParser, and writes a cache entry when it reaches EOF."""
+
+  def __init__(self, cache, c_parser, arena, entry_path, key):
+    # type: (ParseCache, CommandParser, Arena, str, Tuple[Any, ...]) -> None
+    self.cache = cache
+    self.c_parser = c_parser
+    self.arena = arena
+    self.entry_path = entry_path
+    self.key = key
+
+    self.encoder = None  # type: Optional[_Encoder]
+    self.encoded = []  # type: List[Any]
+    self.cacheable = True
+    self.at_eof = False
+
+  def ParseLogicalLine(self):
+    # type: () -> Optional[command_t]
+    if self.encoder is None:
+      # The source is pushed by the caller after we're created.
+      self.encoder = _Encoder(self.cache.registry, self.arena,
+                              self.arena.source_instances[-1])
+
+    node = self.c_parser.ParseLogicalLine()
+    if node is None:
+      self.at_eof = True
+    elif self.cacheable:
+      # Encode it before it's executed, since the arena may be reclaimed.
+      try:
+        self.encoded.append(self.encoder.Encode(node))
+      except _NotCacheable:
+        self.cacheable = False
+        self.encoded = []
+    return node
+
+  def CheckForPendingHereDocs(self):
+    # type: () -> None
+    self.c_parser.CheckForPendingHereDocs()  # can raise ParseError
+    if self.at_eof and self.cacheable:
+      enc = self.encoder
+      self.cache._Write(self.entry_path,
+                        self.key + (enc.lines, enc.spans, self.encoded))
+
+  def Reset(self):
+    # type: () -> None
+    self.c_parser.Reset()
+    if self.encoder:
+      # The arena may have been reclaimed, and it hands out the same IDs again.
+      self.encoder.line_index.clear()
+      self.encoder.span_index.clear()
+
+  def ResetInputObjects(self):
+    # type: () -> None
+    self.c_parser.ResetInputObjects()
+
+
+class ParseCache(object):
+  """Makes parsers for files, which may use a cached LST."""
+
+  def __init__(self, cache_dir):
+    # type: (str) -> None
+    self.cache_dir = cache_dir
+    self.registry = _Registry()
+
+    # For benchmarks and tests
+    self.num_hits = 0
+    self.num_misses = 0
+
+  def _AliasHash(self, aliases):
+    # type: (Dict[str, Any]) -> str
+    """The LST depends on which aliases were defined when parsing started."""
+    h = hashlib.sha1()
+    for name in sorted(aliases):
+      h.update('%s\0%s\0' % (name, aliases[name]))
+    return h.hexdigest()
+
+  def _Read(self, entry_path):
+    # type: (str) -> Optional[Tuple[Any, ...]]
+    try:
+      with open(entry_path, 'rb') as f:
+        return marshal.load(f)
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+      return None
+
+  def _Write(self, entry_path, entry):
+    # type: (str, Tuple[Any, ...]) -> None
+    tmp_path = '%s.%d' % (entry_path, posix.getpid())
+    try:
+      with open(tmp_path, 'wb') as f:
+        marshal.dump(entry, f)
+      posix.rename(tmp_path, entry_path)  # atomic
+    except (IOError, OSError):
+      pass  # the cache is best-effort
+
+  def MakeParser(self, parse_ctx, f, path):
+    # type: (ParseContext, IO[str], str) -> Optional[Any]
+    """Return a parser for the file, or None if it can't be cached.
+
+    The parser has the subset of the CommandParser interface that
+    main_loop.Batch() uses.
+    """
+    try:
+      st = posix.fstat(f.fileno())
+    except (OSError, AttributeError):
+      return None
+    if not stat.S_ISREG(st.st_mode):
+      return None
+
+    contents = f.read()
+    abs_path = os_path.abspath(path)
+    key = (
+        _FORMAT_VERSION, self.registry.fingerprint, abs_path, st.st_size,
+        st.st_mtime, hashlib.sha1(contents).hexdigest(),
+        self._AliasHash(parse_ctx.aliases)
+    )
+    entry_path = '%s/%s' % (self.cache_dir,
+                            hashlib.sha1(abs_path).hexdigest())
+    arena = parse_ctx.arena
+
+    entry = self._Read(entry_path)
+    n = len(key)
+    if isinstance(entry, tuple) and len(entry) == n + 3 and entry[:n] == key:
+      self.num_hits += 1
+      return _CachedParser(self.registry, arena, entry[n:])
+
+    self.num_misses += 1
+    line_reader = reader.BufferLineReader(contents, arena)
+    c_parser = parse_ctx.MakeOshParser(line_reader)
+    return _RecordingParser(self, c_parser, arena, entry_path, key)
+
+
+class _LruEntry(object):
+  """A node in the doubly linked list of CodeCache entries."""
+  __slots__ = ('prev', 'next', 'key', 'value')
+
+
+class CodeCache(object):
+  """An in-memory LRU cache from code strings to parsed nodes.
+
+  Used for 'eval' and 'trap', which are often called with the same string in
+  a loop.  Aliases are expanded at parse time, so the cache is cleared
+  whenever the set of aliases changes.
+
+  Like ParseCache, code where an alias was expanded isn't cached, since the
+  expansion may depend on commands that ran while it was parsed.  Neither is
+  code that changed the aliases.
+  """
+
+  def __init__(self, aliases, max_size=256):
+    # type: (Dict[str, Any], int) -> None
+    self.aliases = aliases
+    self.alias_snapshot = dict(aliases)
+    self.max_size = max_size
+
+    self.entries = {}  # type: Dict[Any, _LruEntry]
+    # Sentinel of a circular list.  root.next is the least recently used.
+    self.root = _LruEntry()
+    self.root.prev = self.root.next = self.root
+
+    self.num_hits = 0
+    self.num_misses = 0
+    self.num_invalidations = 0
+
+  def _CheckAliases(self):
+    # type: () -> bool
+    """Clear the cache if the aliases changed.  Returns whether they did."""
+    if self.aliases == self.alias_snapshot:
+      return False
+    self.entries.clear()
+    self.root.prev = self.root.next = self.root
+    self.alias_snapshot = dict(self.aliases)
+    self.num_invalidations += 1
+    return True
+
+  def _Unlink(self, e):
+    # type: (_LruEntry) -> None
+    e.prev.next = e.next
+    e.next.prev = e.prev
+
+  def _Append(self, e):
+    # type: (_LruEntry) -> None
+    """Make it the most recently used entry."""
+    root = self.root
+    e.prev = root.prev
+    e.next = root
+    root.prev.next = e
+    root.prev = e
+
+  def Get(self, key):
+    # type: (Any) -> Any
+    """Return the cached value, or None."""
+    self._CheckAliases()
+    e = self.entries.get(key)
+    if e is None:
+      self.num_misses += 1
+      return None
+    self.num_hits += 1
+    self._Unlink(e)
+    self._Append(e)
+    return e.value
+
+  def Put(self, key, value):
+    # type: (Any, Any) -> None
+    """Cache a value that was parsed since the last Get().
+
+    Nothing is stored if the aliases changed in between, e.g. because the
+    code ran, or if an alias was expanded.
+    """
+    if self._CheckAliases() or _HasExpandedAlias(value):
+      return
+    e = self.entries.get(key)
+    if e is not None:
+      self._Unlink(e)
+    else:
+      if len(self.entries) >= self.max_size:
+        oldest = self.root.next
+        self._Unlink(oldest)
+        del self.entries[oldest.key]
+      e = _LruEntry()
+      e.key = key
+      self.entries[key] = e
+    e.value = value
+    self._Append(e)
+
+  def Stats(self):
+    # type: () -> str
+    total = self.num_hits + self.num_misses
+    rate = 100.0 * self.num_hits / total if total else 0.0
+    return '%d hits, %d misses (%.1f%%), %d invalidations, %d entries' % (
+        self.num_hits, self.num_misses, rate, self.num_invalidations,
+        len(self.entries))
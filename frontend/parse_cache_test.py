@@ -0,0 +1,240 @@
+#!/usr/bin/env python2
+"""
+parse_cache_test.py: Tests for parse_cache.py
+"""
+
+import os
+import shutil
+import unittest
+
+from _devbuild.gen.syntax_asdl import source, token
+from asdl import runtime
+from core import alloc
+from core import main_loop
+from frontend import parse_cache  # module under test
+from frontend import parse_lib
+from frontend import reader
+
+CODE = """\
+f() {
+  echo "$1 $LINENO" ${x:-default}
+}
+x=$(echo `echo sub`)
+cat <<EOF
+here $x
+EOF
+case $x in sub) f arm ;; esac
+[[ $x == s* ]] && echo $(( 1 + 2 ))
+"""
+
+
+def _Tokens(node, out):
+  """Collect all tokens in the tree."""
+  if isinstance(node, list):
+    for child in node:
+      _Tokens(child, out)
+  elif isinstance(node, token):
+    out.append(node)
+  elif isinstance(node, runtime.CompoundObj):
+    for name in node.__slots__:
+      _Tokens(getattr(node, name), out)
+
+
+def _Summary(nodes, arena):
+  """Return token IDs, values, and the location each span points to."""
+  tokens = []
+  _Tokens(nodes, tokens)
+  result = []
+  for tok in tokens:
+    span_id = tok.span_id
+    if span_id == -1:
+      loc = None
+    else:
+      line_id = arena.GetSpanLineId(span_id)
+      loc = (arena.GetLineNumber(line_id), arena.GetSpanCol(span_id),
+             arena.GetLine(line_id))
+    result.append((tok.id, tok.val, loc))
+  return result
+
+
+class ParseCacheTest(unittest.TestCase):
+
+  def setUp(self):
+    self.cache_dir = '_tmp/parse_cache_test'
+    if os.path.exists(self.cache_dir):
+      shutil.rmtree(self.cache_dir)
+    os.makedirs(self.cache_dir)
+
+    self.path = '_tmp/parse_cache_test.sh'
+    with open(self.path, 'w') as f:
+      f.write(CODE)
+
+  def _Parse(self, cache, aliases=None):
+    arena = alloc.Arena()
+    parse_ctx = parse_lib.ParseContext(arena, aliases or {}, None,
+                                       parse_cache=cache)
+    nodes = []
+    arena.PushSource(source.SourcedFile(self.path, -1))
+    with open(self.path) as f:
+      c_parser = parse_ctx.MakeOshFileParser(f, self.path)
+      main_loop.Batch(None, c_parser, arena, nodes_out=nodes)
+    arena.PopSource()
+    return nodes, arena
+
+  def testHitAndMiss(self):
+    cache = parse_cache.ParseCache(self.cache_dir)
+
+    expected = _Summary(*self._Parse(None))
+
+    nodes, arena = self._Parse(cache)
+    self.assertEqual((0, 1), (cache.num_hits, cache.num_misses))
+    self.assertEqual(expected, _Summary(nodes, arena))
+
+    nodes, arena = self._Parse(cache)
+    self.assertEqual((1, 1), (cache.num_hits, cache.num_misses))
+    self.assertEqual(expected, _Summary(nodes, arena))
+
+    # Enum values are singletons, which the executor compares by identity.
+    self.assertEqual(True, all(a[0] is b[0] for a, b in
+                               zip(expected, _Summary(nodes, arena))))
+
+    # Different aliases could change the LST
+    self._Parse(cache, aliases={'ls': 'ls -l'})
+    self.assertEqual((1, 2), (cache.num_hits, cache.num_misses))
+
+    # Changing the file is a miss
+    with open(self.path, 'a') as f:
+      f.write('echo more\n')
+    self._Parse(cache)
+    self.assertEqual((1, 3), (cache.num_hits, cache.num_misses))
+
+  def testParseErrorIsNotCached(self):
+    with open(self.path, 'w') as f:
+      f.write('echo hi\nif true; then\n')
+
+    cache = parse_cache.ParseCache(self.cache_dir)
+    self._Parse(cache)
+    self.assertEqual([], os.listdir(self.cache_dir))
+
+  def testExpandedAliasIsNotCached(self):
+    # The expansion could depend on commands that ran while parsing.
+    with open(self.path, 'w') as f:
+      f.write('e hi\n')
+
+    cache = parse_cache.ParseCache(self.cache_dir)
+    self._Parse(cache, aliases={'e': 'echo'})
+    self.assertEqual([], os.listdir(self.cache_dir))
+
+  def testFileDefiningAliasIsCached(self):
+    # Like an rc file.  The key covers the aliases when parsing started.
+    with open(self.path, 'w') as f:
+      f.write("alias ll='ls -l'\nf() { echo hi; }\n")
+
+    aliases = {}
+    arena = alloc.Arena()
+    parse_ctx = parse_lib.ParseContext(arena, aliases, None,
+                                       parse_cache=parse_cache.ParseCache(
+                                           self.cache_dir))
+    arena.PushSource(source.SourcedFile(self.path, -1))
+    with open(self.path) as f:
+      c_parser = parse_ctx.MakeOshFileParser(f, self.path)
+      while c_parser.ParseLogicalLine() is not None:
+        aliases['ll'] = 'ls -l'  # as if the 'alias' command ran
+      c_parser.CheckForPendingHereDocs()
+    arena.PopSource()
+    self.assertEqual(1, len(os.listdir(self.cache_dir)))
+
+  def testBadEntry(self):
+    cache = parse_cache.ParseCache(self.cache_dir)
+    self._Parse(cache)
+    entries = os.listdir(self.cache_dir)
+    self.assertEqual(1, len(entries))
+
+    with open(os.path.join(self.cache_dir, entries[0]), 'w') as f:
+      f.write('garbage')
+    nodes, _ = self._Parse(cache)
+    self.assertEqual((0, 2), (cache.num_hits, cache.num_misses))
+    self.assertEqual(5, len(nodes))
+
+
+class CodeCacheTest(unittest.TestCase):
+
+  def testLru(self):
+    cache = parse_cache.CodeCache({}, max_size=2)
+    cache.Put('a', 1)
+    cache.Put('b', 2)
+    self.assertEqual(1, cache.Get('a'))  # now b is the oldest
+    cache.Put('c', 3)
+    self.assertEqual(None, cache.Get('b'))
+    self.assertEqual(1, cache.Get('a'))
+    self.assertEqual(3, cache.Get('c'))
+
+    cache.Put('c', 4)  # replace
+    self.assertEqual(4, cache.Get('c'))
+    self.assertEqual(2, len(cache.entries))
+
+    self.assertEqual((4, 1), (cache.num_hits, cache.num_misses))
+    print(cache.Stats())
+
+  def testAliasesInvalidate(self):
+    aliases = {}
+    cache = parse_cache.CodeCache(aliases)
+    cache.Put('ls', 1)
+    self.assertEqual(1, cache.Get('ls'))
+
+    aliases['ls'] = 'ls --color'
+    self.assertEqual(None, cache.Get('ls'))
+    self.assertEqual(1, cache.num_invalidations)
+
+    cache.Put('ls', 2)
+    self.assertEqual(2, cache.Get('ls'))
+    del aliases['ls']
+    self.assertEqual(None, cache.Get('ls'))
+    self.assertEqual(2, cache.num_invalidations)
+
+  def testNotCached(self):
+    aliases = {}
+    cache = parse_cache.CodeCache(aliases)
+
+    # The aliases changed while the code ran
+    self.assertEqual(None, cache.Get('alias'))
+    aliases['e'] = 'echo'
+    cache.Put('alias', 1)
+    self.assertEqual(None, cache.Get('alias'))
+
+    # An alias was expanded
+    arena = alloc.Arena()
+    arena.PushSource(source.MainFile('<test>'))
+    parse_ctx = parse_lib.ParseContext(arena, aliases, None)
+    line_reader = reader.StringLineReader('e hi\n', arena)
+    recorder = parse_cache.NodeRecorder(parse_ctx.MakeOshParser(line_reader))
+    main_loop.Batch(None, recorder, arena, nodes_out=[])
+    cache.Put('e hi', recorder.nodes)
+    self.assertEqual(None, cache.Get('e hi'))
+    self.assertEqual(0, len(cache.entries))
+
+  def testRecorder(self):
+    arena = alloc.Arena()
+    arena.PushSource(source.MainFile('<test>'))
+    parse_ctx = parse_lib.ParseContext(arena, {}, None)
+
+    line_reader = reader.StringLineReader('echo 1; echo 2\necho 3\n', arena)
+    recorder = parse_cache.NodeRecorder(parse_ctx.MakeOshParser(line_reader))
+    nodes = []
+    main_loop.Batch(None, recorder, arena, nodes_out=nodes)
+    self.assertEqual(True, recorder.complete)
+    self.assertEqual(nodes, recorder.nodes)
+
+    replayed = []
+    main_loop.Batch(None, parse_cache.NodeListParser(recorder.nodes), arena,
+                    nodes_out=replayed)
+    self.assertEqual(nodes, replayed)
+
+    line_reader = reader.StringLineReader('echo 1\nif true', arena)
+    recorder = parse_cache.NodeRecorder(parse_ctx.MakeOshParser(line_reader))
+    main_loop.Batch(None, recorder, arena, nodes_out=[])
+    self.assertEqual(False, recorder.complete)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -26,6 +26,7 @@ if TYPE_CHECKING:
   from core.alloc import Arena
   from core.util import DebugFile
   from frontend.lexer import Lexer
+  from frontend.parse_cache import ParseCache
   from frontend.reader import _Reader
   from frontend.tdop import TdopParser
   from osh.word_parse import WordParser
@@ -198,10 +199,12 @@ class ParseContext(object):
   In constrast, STATE is stored in the CommandParser and WordParser instances.
   """
 
-  def __init__(self, arena, aliases, oil_grammar, trail=None, one_pass_parse=False):
-    # type: (Arena, Dict[str, Any], Grammar, Optional[_BaseTrail], bool) -> None
+  def __init__(self, arena, aliases, oil_grammar, trail=None,
+               one_pass_parse=False, parse_cache=None):
+    # type: (Arena, Dict[str, Any], Grammar, Optional[_BaseTrail], bool, Optional[ParseCache]) -> None
     self.arena = arena
     self.aliases = aliases
+    self.parse_cache = parse_cache  # for sourced files and rc files
 
     self.e_parser = expr_parse.ExprParser(oil_grammar)
     # NOTE: The transformer is really a pure function.
@@ -225,7 +228,8 @@ class ParseContext(object):
     NOTE: I tried to combine the LineLexer and Lexer, and it didn't perform
     better.
     """
-    line_lexer = lexer.LineLexer(match.MATCHER, '', self.arena)
+    line_lexer = lexer.LineLexer(match.MATCHER, '', self.arena,
+                                  multi_match_func=match.MULTI_MATCHER)
     return lexer.Lexer(line_lexer, line_reader)
 
   def MakeOshParser(self, line_reader, emit_comp_dummy=False,
@@ -239,6 +243,19 @@ class ParseContext(object):
                                        aliases_in_flight=aliases_in_flight)
     return c_parser
 
+  def MakeOshFileParser(self, f, path):
+    # type: (IO[str], str) -> Any
+    """Make a parser for a sourced file or rc file.
+
+    It may hand out nodes from the parse cache instead of parsing.
+    """
+    if self.parse_cache:
+      c_parser = self.parse_cache.MakeParser(self, f, path)
+      if c_parser:
+        return c_parser
+    line_reader = reader.FileReader(f, self.arena)
+    return self.MakeOshParser(line_reader)
+
   def MakeOilParser(self, line_reader):
     # type: (_Reader) -> None
     # Same lexer as Oil?  It just doesn't start in the OUTER state?
@@ -10,6 +10,9 @@ reader.py - Read lines of input.
 
 import cStringIO
 import signal
+import stat
+
+import posix_ as posix
 
 from typing import Optional, Tuple, List, IO, Any, TYPE_CHECKING
 if TYPE_CHECKING:
@@ -132,9 +135,56 @@ class FileLineReader(_Reader):
     return line
 
 
+class BufferLineReader(_Reader):
+  """Hand out lines of a string that's already in memory.
+
+  The buffer is split into lines with a single C-level scan up front, so
+  there's no per-line I/O or buffer management.  The arena stores the same
+  line objects, so there's no extra copy either.
+  """
+
+  def __init__(self, buf, arena):
+    # type: (str, Arena) -> None
+    _Reader.__init__(self, arena)
+    # NOTE: Not str.splitlines(), because it also splits on a lone \r.
+    self.lines = cStringIO.StringIO(buf).readlines()
+    self.pos = 0
+
+  def GetLine(self):
+    # type: () -> Tuple[int, Optional[str], int]
+    pos = self.pos
+    if pos == len(self.lines):
+      return -1, None, 0
+    line = self.lines[pos]
+    self.pos = pos + 1
+
+    line_id = self.arena.AddLine(line, self.line_num)
+    self.line_num += 1
+    return line_id, line, 0
+
+
 def StringLineReader(s, arena):
-  # type: (str, Arena) -> FileLineReader
-  return FileLineReader(cStringIO.StringIO(s), arena)
+  # type: (str, Arena) -> BufferLineReader
+  return BufferLineReader(s, arena)
+
+
+def FileReader(f, arena):
+  # type: (IO[str], Arena) -> _Reader
+  """Return a line reader for a script or sourced file.
+
+  Regular files are read with a single read() call.  Other files like pipes
+  and terminals are read a line at a time, since there may be another reader,
+  or the data may not be available yet.
+  """
+  try:
+    st = posix.fstat(f.fileno())
+  except (OSError, AttributeError):  # AttributeError for cStringIO
+    return FileLineReader(f, arena)
+
+  if stat.S_ISREG(st.st_mode):
+    return BufferLineReader(f.read(), arena)
+  else:
+    return FileLineReader(f, arena)
 
 
 # C++ ownership notes:
@@ -4,6 +4,7 @@ reader_test.py: Tests for reader.py
 """
 
 import cStringIO
+import os
 import unittest
 
 from _devbuild.gen.syntax_asdl import source
@@ -34,16 +35,45 @@ class ReaderTest(unittest.TestCase):
     lines = [(0, 'one\n', 0), (1, 'two', 0)]
     r3 = reader.VirtualLineReader(lines, a3)
 
-    for a in [a1, a2, a3]:
+    a4 = alloc.Arena()
+    r4 = reader.BufferLineReader('one\ntwo', a4)
+
+    for a in [a1, a2, a3, a4]:
       a.PushSource(source.MainFile('reader_test.py'))
 
-    for r in [r1, r2, r3]:
+    for r in [r1, r2, r3, r4]:
       print(r)
       # Lines are added to the arena with a line_id.
       self.assertEqual((0, 'one\n', 0), r.GetLine())
       self.assertEqual((1, 'two', 0), r.GetLine())
       self.assertEqual((-1, None, 0), r.GetLine())
 
+  def testFileReader(self):
+    arena = test_lib.MakeArena('<reader_test.py>')
+
+    path = '_tmp/reader_test.txt'
+    with open(path, 'w') as f:
+      f.write('one\n\ntwo\n')
+
+    with open(path) as f:
+      r = reader.FileReader(f, arena)
+      self.assertTrue(isinstance(r, reader.BufferLineReader), r)
+      self.assertEqual((0, 'one\n', 0), r.GetLine())
+      self.assertEqual((1, '\n', 0), r.GetLine())
+      self.assertEqual((2, 'two\n', 0), r.GetLine())
+      self.assertEqual((-1, None, 0), r.GetLine())
+
+    # Not a regular file, so it's read a line at a time.
+    r_fd, w_fd = os.pipe()
+    os.write(w_fd, 'one\n')
+    os.close(w_fd)
+    f = os.fdopen(r_fd)
+    r = reader.FileReader(f, arena)
+    self.assertTrue(isinstance(r, reader.FileLineReader), r)
+    self.assertEqual((3, 'one\n', 0), r.GetLine())
+    self.assertEqual((-1, None, 0), r.GetLine())
+    f.close()
+
 
 if __name__ == '__main__':
   unittest.main()
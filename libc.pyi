@@ -1 +1,15 @@
+from typing import List, Optional, Tuple
+
 def gethostname() -> str: ...
+def cpu_count() -> int: ...
+
+REG_ICASE: int
+
+class Regex:
+    def match(self, s: str) -> Optional[List[str]]: ...
+    def first_group_match(self, s: str, pos: int) -> Optional[Tuple[int, int]]: ...
+    def replace_all(self, s: str, rep: str) -> str: ...
+
+def regex_compile(pattern: str, cflags: int = ...) -> Regex: ...
+def regex_affix(ere: str, s: str, is_suffix: bool, longest: bool) -> int: ...
+def regex_cache_size() -> int: ...
@@ -52,6 +52,76 @@ fastlex_MatchOshToken(PyObject *self, PyObject *args) {
   return Py_BuildValue("(ii)", id, end_pos);
 }
 
+// Lex the rest of a line in a single lexer mode, so the caller crosses the
+// Python/C boundary once per line instead of once per token.
+//
+// Returns a string of packed native ints: (id, end_pos) pairs.  Lexing stops
+// after Eol_Tok, or after a token whose entry in stop_table is nonzero.  Those
+// are tokens after which the parser is likely to switch modes, so the rest of
+// the line would be thrown away anyway.
+static PyObject *
+fastlex_MatchOshTokens(PyObject *self, PyObject *args) {
+  int lex_mode;
+
+  unsigned char* line;
+  int line_len;
+
+  int start_pos;
+
+  const char* stop_table;
+  int stop_table_len;
+
+  if (!PyArg_ParseTuple(args, "is#is#",
+                        &lex_mode, &line, &line_len, &start_pos,
+                        &stop_table, &stop_table_len)) {
+    return NULL;
+  }
+
+  if (start_pos > line_len) {
+    PyErr_Format(PyExc_ValueError,
+                 "Invalid MatchOshTokens call (start_pos = %d, line_len = %d)",
+                 start_pos, line_len);
+    return NULL;
+  }
+
+  // Every token except Eol_Tok consumes at least one byte, so there are at
+  // most (line_len - start_pos + 1) pairs.
+  Py_ssize_t max_pairs = line_len - start_pos + 1;
+  PyObject* result = PyString_FromStringAndSize(
+      NULL, max_pairs * 2 * sizeof(int));
+  if (result == NULL) {
+    return NULL;
+  }
+  int* out = (int*)PyString_AS_STRING(result);
+
+  int pos = start_pos;
+  Py_ssize_t n = 0;
+  for (;;) {
+    int id;
+    int end_pos;
+    MatchOshToken(lex_mode, line, line_len, pos, &id, &end_pos);
+    out[2*n] = id;
+    out[2*n + 1] = end_pos;
+    n++;
+
+    if (id == id__Eol_Tok) {
+      break;
+    }
+    if (id < stop_table_len && stop_table[id]) {
+      break;
+    }
+    if (n == max_pairs) {  // can't happen, but don't overrun the buffer
+      break;
+    }
+    pos = end_pos;
+  }
+
+  if (_PyString_Resize(&result, n * 2 * sizeof(int)) < 0) {
+    return NULL;
+  }
+  return result;
+}
+
 static PyObject *
 fastlex_MatchEchoToken(PyObject *self, PyObject *args) {
   unsigned char* line;
@@ -201,6 +271,8 @@ fastlex_IsPlainWord(PyObject *self, PyObject *args) {
 static PyMethodDef methods[] = {
   {"MatchOshToken", fastlex_MatchOshToken, METH_VARARGS,
    "(lexer mode, line, start_pos) -> (id, end_pos)."},
+  {"MatchOshTokens", fastlex_MatchOshTokens, METH_VARARGS,
+   "(lexer mode, line, start_pos, stop_table) -> packed (id, end_pos) pairs."},
   {"MatchEchoToken", fastlex_MatchEchoToken, METH_VARARGS,
    "(line, start_pos) -> (id, end_pos)."},
   {"MatchGlobToken", fastlex_MatchGlobToken, METH_VARARGS,
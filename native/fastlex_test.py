@@ -10,6 +10,7 @@ fastlex_test.py: Tests for fastlex
 """
 from __future__ import print_function
 
+import array
 import unittest
 
 #from core.util import log
@@ -69,6 +70,42 @@ class LexTest(unittest.TestCase):
 
     self.assertEqual(expected, tok_type)
 
+  def testMatchOshTokens(self):
+    stop_table = '\0' * 256
+    line = 'echo hi\n'
+    buf = fastlex.MatchOshTokens(
+        lex_mode_e.ShCommand.enum_id, line, 0, stop_table)
+    pairs = array.array('i', buf)
+    self.assertEqual(
+        [Id.Lit_Chars, Id.WS_Space, Id.Lit_Chars, Id.Op_Newline, Id.Eol_Tok],
+        [IdInstance(i) for i in pairs[::2]])
+    self.assertEqual([4, 5, 7, 8, 8], list(pairs[1::2]))
+
+    # Same tokens as calling MatchOshToken repeatedly
+    pos = 0
+    for i in xrange(0, len(pairs), 2):
+      self.assertEqual((IdInstance(pairs[i]), pairs[i+1]),
+                       MatchOshToken(lex_mode_e.ShCommand, line, pos))
+      pos = pairs[i+1]
+
+    # Stop after the space
+    stop_list = ['\0'] * 256
+    stop_list[Id.WS_Space.enum_id] = '\1'
+    stop_table = ''.join(stop_list)
+    buf = fastlex.MatchOshTokens(
+        lex_mode_e.ShCommand.enum_id, line, 0, stop_table)
+    pairs = array.array('i', buf)
+    self.assertEqual([Id.Lit_Chars.enum_id, 4, Id.WS_Space.enum_id, 5],
+                     list(pairs))
+
+    # Starting at the end
+    buf = fastlex.MatchOshTokens(
+        lex_mode_e.ShCommand.enum_id, line, len(line), stop_table)
+    self.assertEqual([Id.Eol_Tok.enum_id, 8], list(array.array('i', buf)))
+
+    self.assertRaises(ValueError, fastlex.MatchOshTokens,
+        lex_mode_e.ShCommand.enum_id, line, len(line) + 1, stop_table)
+
   def testIsValidVarName(self):
     self.assertEqual(True, fastlex.IsValidVarName('abc'))
     self.assertEqual(True, fastlex.IsValidVarName('foo_bar'))
@@ -6,7 +6,9 @@
 #include <stdio.h>  // printf
 #include <limits.h>
 #include <stdlib.h>
+#include <string.h>  // memcpy
 #include <sys/ioctl.h>
+#include <unistd.h>  // sysconf
 
 // Enable GNU extensions in fnmatch.h.
 // TODO: Need a configure option for this.
@@ -158,20 +160,8 @@ func_glob(PyObject *self, PyObject *args) {
   return matches;
 }
 
-static PyObject *
-func_regex_parse(PyObject *self, PyObject *args) {
-  const char* pattern;
-  if (!PyArg_ParseTuple(args, "s", &pattern)) {
-    return NULL;
-  }
-  regex_t pat;
-  // This is an extended regular expression rather than a basic one, i.e. we
-  // use 'a*' instaed of 'a\*'.
-  int ret = regcomp(&pat, pattern, REG_EXTENDED);
-  regfree(&pat);
-
-  // Copied from man page
-
+// Return an error message for a regcomp() return value, or NULL on success.
+static const char* regcomp_error_str(int ret) {
   const char *err_str = NULL;
   switch (ret) {
   case 0:  // success
@@ -241,42 +231,142 @@ func_regex_parse(PyObject *self, PyObject *args) {
     /* TODO: Add the integer to error message */
     err_str = "Unknown error compiling regex";
   }
+  return err_str;
 
-  if (err_str) {
-    // When the regex contains a variable, it can't be checked at compile-time.
-    PyErr_SetString(PyExc_RuntimeError, err_str);
-    return NULL;
+}
+
+//
+// Compiled regexes
+//
+// regcomp() is much more expensive than regexec(), and shell scripts often
+// match the same regex in a loop.  So compiled regexes are libc.Regex objects,
+// which are kept in an LRU cache keyed by (pattern, cflags).
+//
+
+typedef struct RegexObject {
+  PyObject_HEAD
+  regex_t pat;
+  int compiled;  // whether pat needs regfree()
+  PyObject* key;  // (pattern, cflags)
+
+  // Doubly linked LRU list.  The cache dict owns the references.
+  int in_cache;
+  struct RegexObject* prev;  // more recently used
+  struct RegexObject* next;  // less recently used
+} RegexObject;
+
+static PyTypeObject Regex_Type;
+
+#define REGEX_CACHE_SIZE 128
+
+static PyObject* regex_cache = NULL;  // (pattern, cflags) -> Regex
+static RegexObject* lru_head = NULL;  // most recently used
+static RegexObject* lru_tail = NULL;  // least recently used
+
+static void lru_unlink(RegexObject* r) {
+  if (r->prev) {
+    r->prev->next = r->next;
+  } else {
+    lru_head = r->next;
+  }
+  if (r->next) {
+    r->next->prev = r->prev;
   } else {
-    Py_RETURN_TRUE;
+    lru_tail = r->prev;
   }
+  r->prev = r->next = NULL;
 }
 
-static PyObject *
-func_regex_match(PyObject *self, PyObject *args) {
-  const char* pattern;
-  const char* str;
-  if (!PyArg_ParseTuple(args, "ss", &pattern, &str)) {
+static void lru_push_front(RegexObject* r) {
+  r->prev = NULL;
+  r->next = lru_head;
+  if (lru_head) {
+    lru_head->prev = r;
+  }
+  lru_head = r;
+  if (lru_tail == NULL) {
+    lru_tail = r;
+  }
+}
+
+static void
+Regex_dealloc(RegexObject* self) {
+  if (self->compiled) {
+    regfree(&self->pat);
+  }
+  Py_XDECREF(self->key);
+  PyObject_Del(self);
+}
+
+// Return a new reference to a compiled regex, or NULL with RuntimeError set.
+static RegexObject* regex_compile_cached(const char* pattern, int cflags) {
+  PyObject* key = Py_BuildValue("(si)", pattern, cflags);
+  if (key == NULL) {
     return NULL;
   }
 
-  regex_t pat;
-  if (regcomp(&pat, pattern, REG_EXTENDED) != 0) {
-    // When the regex contains a variable, it can't be checked at compile-time.
-    PyErr_SetString(PyExc_RuntimeError, "Invalid regex syntax (func_regex_match)");
+  RegexObject* r = (RegexObject*)PyDict_GetItem(regex_cache, key);  // borrowed
+  if (r != NULL) {
+    Py_DECREF(key);
+    if (r != lru_head) {
+      lru_unlink(r);
+      lru_push_front(r);
+    }
+    Py_INCREF(r);
+    return r;
+  }
+
+  r = PyObject_New(RegexObject, &Regex_Type);
+  if (r == NULL) {
+    Py_DECREF(key);
+    return NULL;
+  }
+  r->compiled = 0;
+  r->key = key;  // steal the reference
+  r->in_cache = 0;
+  r->prev = r->next = NULL;
+
+  int ret = regcomp(&r->pat, pattern, cflags);
+  if (ret != 0) {
+    // When the regex contains a variable, it can't be checked at parse time.
+    PyErr_SetString(PyExc_RuntimeError, regcomp_error_str(ret));
+    Py_DECREF(r);
     return NULL;
   }
+  r->compiled = 1;
+
+  if (PyDict_Size(regex_cache) >= REGEX_CACHE_SIZE) {
+    RegexObject* oldest = lru_tail;
+    lru_unlink(oldest);
+    oldest->in_cache = 0;
+    // May free it, if no caller holds a reference.
+    if (PyDict_DelItem(regex_cache, oldest->key) < 0) {
+      Py_DECREF(r);
+      return NULL;
+    }
+  }
 
-  int outlen = pat.re_nsub + 1;
-  PyObject *ret = PyList_New(outlen);
+  if (PyDict_SetItem(regex_cache, key, (PyObject*)r) < 0) {
+    Py_DECREF(r);
+    return NULL;
+  }
+  r->in_cache = 1;
+  lru_push_front(r);
+  return r;  // the dict has its own reference
+}
 
+// Returns a list of the whole match and groups, or None if it doesn't match.
+static PyObject* regex_match_impl(RegexObject* r, const char* str) {
+  int outlen = r->pat.re_nsub + 1;
+  PyObject *ret = PyList_New(outlen);
   if (ret == NULL) {
-    regfree(&pat);
     return NULL;
   }
 
   int match;
   regmatch_t *pmatch = (regmatch_t*) malloc(sizeof(regmatch_t) * outlen);
-  if (match = (regexec(&pat, str, outlen, pmatch, 0) == 0)) {
+  match = regexec(&r->pat, str, outlen, pmatch, 0) == 0;
+  if (match) {
     int i;
     for (i = 0; i < outlen; i++) {
       int len = pmatch[i].rm_eo - pmatch[i].rm_so;
@@ -284,14 +374,12 @@ func_regex_match(PyObject *self, PyObject *args) {
       PyList_SetItem(ret, i, v);
     }
   }
-
   free(pmatch);
-  regfree(&pat);
 
   if (!match) {
+    Py_DECREF(ret);
     Py_RETURN_NONE;
   }
-
   return ret;
 }
 
@@ -302,6 +390,197 @@ func_regex_match(PyObject *self, PyObject *args) {
 
 #define NMATCH 2
 
+static PyObject* regex_first_group_match_impl(
+    RegexObject* r, const char* str, int pos) {
+  regmatch_t m[NMATCH];
+
+  debug("first_group_match str %s pos %d", str, pos);
+
+  // Match at offset 'pos'
+  int result = regexec(&r->pat, str + pos, NMATCH, m, 0 /*flags*/);
+  if (result != 0) {
+    Py_RETURN_NONE;  // no match
+  }
+
+  // Assume there is a match
+  regoff_t start = m[1].rm_so;
+  regoff_t end = m[1].rm_eo;
+  return Py_BuildValue("(i,i)", pos + start, pos + end);
+}
+
+// Replace every match of the regex's first group, scanning left to right.  An
+// empty match stops the scan, so ${x//''/y} leaves x alone like bash.
+static PyObject* regex_replace_all_impl(
+    RegexObject* r, const char* str, int len, const char* rep, int rep_len) {
+  regmatch_t m[NMATCH];
+  int group = r->pat.re_nsub >= 1 ? 1 : 0;
+
+  // The result is at least as long as the input in the common case of
+  // replacing with a string of the same length.
+  size_t cap = len + 1;
+  size_t out_len = 0;
+  char* out = (char*)malloc(cap);
+  if (out == NULL) {
+    return PyErr_NoMemory();
+  }
+
+  int pos = 0;
+  while (pos < len) {
+    if (regexec(&r->pat, str + pos, NMATCH, m, 0) != 0) {
+      break;
+    }
+    int start = pos + m[group].rm_so;
+    int end = pos + m[group].rm_eo;
+    if (end == start) {
+      break;
+    }
+
+    size_t needed = out_len + (start - pos) + rep_len + (len - end) + 1;
+    if (needed > cap) {
+      cap = needed > 2 * cap ? needed : 2 * cap;
+      char* bigger = (char*)realloc(out, cap);
+      if (bigger == NULL) {
+        free(out);
+        return PyErr_NoMemory();
+      }
+      out = bigger;
+    }
+    memcpy(out + out_len, str + pos, start - pos);
+    out_len += start - pos;
+    memcpy(out + out_len, rep, rep_len);
+    out_len += rep_len;
+    pos = end;
+  }
+
+  // The rest of the string.  The buffer always has room for it.
+  memcpy(out + out_len, str + pos, len - pos);
+  out_len += len - pos;
+
+  PyObject* result = PyString_FromStringAndSize(out, out_len);
+  free(out);
+  return result;
+}
+
+static PyObject *
+Regex_match(RegexObject* self, PyObject *args) {
+  const char* str;
+  if (!PyArg_ParseTuple(args, "s", &str)) {
+    return NULL;
+  }
+  return regex_match_impl(self, str);
+}
+
+static PyObject *
+Regex_first_group_match(RegexObject* self, PyObject *args) {
+  const char* str;
+  int pos;
+  if (!PyArg_ParseTuple(args, "si", &str, &pos)) {
+    return NULL;
+  }
+  return regex_first_group_match_impl(self, str, pos);
+}
+
+static PyObject *
+Regex_replace_all(RegexObject* self, PyObject *args) {
+  const char* str;
+  int len;
+  const char* rep;
+  int rep_len;
+  if (!PyArg_ParseTuple(args, "s#s#", &str, &len, &rep, &rep_len)) {
+    return NULL;
+  }
+  return regex_replace_all_impl(self, str, len, rep, rep_len);
+}
+
+static PyMethodDef Regex_methods[] = {
+  {"match", (PyCFunction)Regex_match, METH_VARARGS,
+   "(str) -> list of the match and groups, or None."},
+  {"first_group_match", (PyCFunction)Regex_first_group_match, METH_VARARGS,
+   "(str, pos) -> (start, end) of the first group, or None."},
+  {"replace_all", (PyCFunction)Regex_replace_all, METH_VARARGS,
+   "(str, rep) -> str with every match of the first group replaced."},
+  {NULL, NULL},
+};
+
+static PyTypeObject Regex_Type = {
+  PyVarObject_HEAD_INIT(NULL, 0)
+  "libc.Regex",              /* tp_name */
+  sizeof(RegexObject),       /* tp_basicsize */
+  0,                         /* tp_itemsize */
+  (destructor)Regex_dealloc, /* tp_dealloc */
+  0,                         /* tp_print */
+  0,                         /* tp_getattr */
+  0,                         /* tp_setattr */
+  0,                         /* tp_compare */
+  0,                         /* tp_repr */
+  0,                         /* tp_as_number */
+  0,                         /* tp_as_sequence */
+  0,                         /* tp_as_mapping */
+  0,                         /* tp_hash */
+  0,                         /* tp_call */
+  0,                         /* tp_str */
+  0,                         /* tp_getattro */
+  0,                         /* tp_setattro */
+  0,                         /* tp_as_buffer */
+  Py_TPFLAGS_DEFAULT,        /* tp_flags */
+  "A compiled POSIX extended regex.",  /* tp_doc */
+  0,                         /* tp_traverse */
+  0,                         /* tp_clear */
+  0,                         /* tp_richcompare */
+  0,                         /* tp_weaklistoffset */
+  0,                         /* tp_iter */
+  0,                         /* tp_iternext */
+  Regex_methods,             /* tp_methods */
+};
+
+static PyObject *
+func_regex_parse(PyObject *self, PyObject *args) {
+  const char* pattern;
+  if (!PyArg_ParseTuple(args, "s", &pattern)) {
+    return NULL;
+  }
+  // This is an extended regular expression rather than a basic one, i.e. we
+  // use 'a*' instaed of 'a\*'.
+  RegexObject* r = regex_compile_cached(pattern, REG_EXTENDED);
+  if (r == NULL) {
+    return NULL;
+  }
+  Py_DECREF(r);
+  Py_RETURN_TRUE;
+}
+
+static PyObject *
+func_regex_compile(PyObject *self, PyObject *args) {
+  const char* pattern;
+  int cflags = 0;
+  if (!PyArg_ParseTuple(args, "s|i", &pattern, &cflags)) {
+    return NULL;
+  }
+  return (PyObject*)regex_compile_cached(pattern, REG_EXTENDED | cflags);
+}
+
+static PyObject *
+func_regex_cache_size(PyObject *self, PyObject *unused) {
+  return PyInt_FromLong(PyDict_Size(regex_cache));
+}
+
+static PyObject *
+func_regex_match(PyObject *self, PyObject *args) {
+  const char* pattern;
+  const char* str;
+  if (!PyArg_ParseTuple(args, "ss", &pattern, &str)) {
+    return NULL;
+  }
+
+  RegexObject* r = regex_compile_cached(pattern, REG_EXTENDED);
+  if (r == NULL) {
+    return NULL;
+  }
+  PyObject* ret = regex_match_impl(r, str);
+  Py_DECREF(r);
+  return ret;
+}
+
 static PyObject *
 func_regex_first_group_match(PyObject *self, PyObject *args) {
   const char* pattern;
@@ -311,32 +590,132 @@ func_regex_first_group_match(PyObject *self, PyObject *args) {
     return NULL;
   }
 
-  regex_t pat;
-  regmatch_t m[NMATCH];
-
   // Could have been checked by regex_parse for [[ =~ ]], but not for glob
   // patterns like ${foo/x*/y}.
+  RegexObject* r = regex_compile_cached(pattern, REG_EXTENDED);
+  if (r == NULL) {
+    return NULL;
+  }
+  PyObject* ret = regex_first_group_match_impl(r, str, pos);
+  Py_DECREF(r);
+  return ret;
+}
 
-  if (regcomp(&pat, pattern, REG_EXTENDED) != 0) {
-    PyErr_SetString(PyExc_RuntimeError,
-                    "Invalid regex syntax (func_regex_first_group_match)");
+// Compile a variant of an ERE, like ^(ERE).  Returns a new reference.
+static RegexObject* regex_compile_fmt(const char* fmt, const char* ere) {
+  PyObject* pattern = PyString_FromFormat(fmt, ere);
+  if (pattern == NULL) {
     return NULL;
   }
+  RegexObject* r = regex_compile_cached(PyString_AS_STRING(pattern),
+                                        REG_EXTENDED);
+  Py_DECREF(pattern);
+  return r;
+}
 
-  debug("first_group_match pat %s str %s pos %d", pattern, str, pos);
+// Returns the length of the longest match of an ^ anchored regex in
+// str[0:len], or -1.
+static int regex_longest_prefix(RegexObject* r, const char* str, int len,
+                                char* buf) {
+  regmatch_t m[1];
+  int status;
+#ifdef REG_STARTEND
+  (void)buf;
+  m[0].rm_so = 0;
+  m[0].rm_eo = len;
+  status = regexec(&r->pat, str, 1, m, REG_STARTEND);
+#else
+  memcpy(buf, str, len);
+  buf[len] = '\0';
+  status = regexec(&r->pat, buf, 1, m, 0);
+#endif
+  return status == 0 ? m[0].rm_eo : -1;
+}
 
-  // Match at offset 'pos'
-  int result = regexec(&pat, str + pos, NMATCH, m, 0 /*flags*/);
-  regfree(&pat);
+// For ${x#pat} ${x##pat} ${x%pat} ${x%%pat}, where the glob pat has been
+// translated to an unanchored ERE.
+//
+// For a prefix, returns the length of the shortest or longest non-empty prefix
+// of str that the ERE matches.  For a suffix, returns the start position of
+// the shortest or longest non-empty suffix.  Returns -1 if nothing matches.
+//
+// POSIX regexec() finds the leftmost-longest match, so the longest cases take
+// one call.  The shortest cases make that call first, and return -1 when
+// nothing matches.  Then they try each boundary from the short end up to the
+// longest match, with the ERE anchored at both ends, and stop at the first
+// match.
+static PyObject *
+func_regex_affix(PyObject *self, PyObject *args) {
+  const char* ere;
+  const char* str;
+  int len;
+  int is_suffix;
+  int longest;
+  if (!PyArg_ParseTuple(args, "ss#ii", &ere, &str, &len, &is_suffix,
+                        &longest)) {
+    return NULL;
+  }
 
-  if (result != 0) {
-    Py_RETURN_NONE;  // no match
+  RegexObject* r = regex_compile_fmt(is_suffix ? "(%s)$" : "^(%s)", ere);
+  if (r == NULL) {
+    return NULL;
+  }
+  RegexObject* exact = NULL;  // anchored at both ends, for the shortest cases
+  if (!longest) {
+    exact = regex_compile_fmt("^(%s)$", ere);
+    if (exact == NULL) {
+      Py_DECREF(r);
+      return NULL;
+    }
   }
 
-  // Assume there is a match
-  regoff_t start = m[1].rm_so;
-  regoff_t end = m[1].rm_eo;
-  return Py_BuildValue("(i,i)", pos + start, pos + end);
+  int result = -1;
+  if (is_suffix) {
+    // The leftmost start of a match anchored with $.  The tail of the string
+    // is already NUL-terminated.
+    regmatch_t m[1];
+    if (regexec(&r->pat, str, 1, m, 0) == 0 && m[0].rm_so < len) {
+      result = m[0].rm_so;
+    }
+    if (exact != NULL && result != -1) {
+      int first = result;
+      int start;
+      for (start = len - 1; start > first; --start) {
+        if (regexec(&exact->pat, str + start, 0, m, 0) == 0) {
+          result = start;
+          break;
+        }
+      }
+    }
+  } else {
+    char* buf = NULL;
+#ifndef REG_STARTEND
+    buf = (char*)malloc(len + 1);
+    if (buf == NULL) {
+      Py_DECREF(r);
+      Py_XDECREF(exact);
+      return PyErr_NoMemory();
+    }
+#endif
+    // The longest match anchored with ^.
+    int n = regex_longest_prefix(r, str, len, buf);
+    if (n > 0) {  // not an empty match
+      result = n;
+    }
+    if (exact != NULL && result != -1) {
+      int end;
+      for (end = 1; end < n; ++end) {
+        if (regex_longest_prefix(exact, str, end, buf) != -1) {
+          result = end;
+          break;
+        }
+      }
+    }
+    free(buf);
+  }
+  Py_DECREF(r);
+  Py_XDECREF(exact);
+  return PyInt_FromLong(result);
 }
 
 // We do this in C so we can remove '%f' % 0.1 from the CPython build.  That
@@ -383,6 +762,15 @@ func_get_terminal_width(PyObject *self, PyObject *unused) {
   return PyLong_FromLong(w.ws_col);
 }
 
+static PyObject *
+func_cpu_count(PyObject *self, PyObject *unused) {
+  long n = sysconf(_SC_NPROCESSORS_ONLN);
+  if (n < 1) {
+    n = 1;  // unknown
+  }
+  return PyInt_FromLong(n);
+}
+
 
 #ifdef OVM_MAIN
 #include "native/libc.c/methods.def"
@@ -411,6 +799,18 @@ static PyMethodDef methods[] = {
   // the regex is invalid.
   {"regex_first_group_match", func_regex_first_group_match, METH_VARARGS, ""},
 
+  // Return a compiled libc.Regex, from the cache if possible.  The optional
+  // second arg is extra cflags, like REG_ICASE.  Raises RuntimeError if the
+  // regex is invalid.
+  {"regex_compile", func_regex_compile, METH_VARARGS, ""},
+
+  // For ${x#pat} and family: (ere, str, is_suffix, longest) -> boundary
+  // position of the matching prefix or suffix, or -1.
+  {"regex_affix", func_regex_affix, METH_VARARGS, ""},
+
+  // Number of compiled regexes in the cache, for tests.
+  {"regex_cache_size", func_regex_cache_size, METH_NOARGS, ""},
+
   // "Print three floating point values for the 'time' builtin.
   {"print_time", func_print_time, METH_VARARGS, ""},
 
@@ -418,12 +818,27 @@ static PyMethodDef methods[] = {
 
   // ioctl() to get the terminal width.
   {"get_terminal_width", func_get_terminal_width, METH_NOARGS, ""},
+
+  // Number of online CPUs, for sizing worker pools.
+  {"cpu_count", func_cpu_count, METH_NOARGS, ""},
   {NULL, NULL},
 };
 #endif
 
 void initlibc(void) {
-  Py_InitModule("libc", methods);
+  PyObject* module = Py_InitModule("libc", methods);
+  if (module == NULL) {
+    return;
+  }
+
+  if (PyType_Ready(&Regex_Type) < 0) {
+    return;
+  }
+  Py_INCREF(&Regex_Type);
+  PyModule_AddObject(module, "Regex", (PyObject*)&Regex_Type);
+  PyModule_AddIntConstant(module, "REG_ICASE", REG_ICASE);
+
+  regex_cache = PyDict_New();
   errno_error = PyErr_NewException("libc.error",
                                     PyExc_IOError, NULL);
 }
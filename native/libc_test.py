@@ -175,6 +175,70 @@ class LibcTest(unittest.TestCase):
     # Consistent with GNU
     self.assertEqual(None, libc.realpath('_tmp/nonexistent/supernonexistent'))
 
+  def testRegexCompile(self):
+    r = libc.regex_compile(r'^(a+)(b?)$')
+    self.assertEqual(['aab', 'aa', 'b'], r.match('aab'))
+    self.assertEqual(None, r.match('abc'))
+
+    # Compiled regexes are cached
+    self.assertTrue(r is libc.regex_compile(r'^(a+)(b?)$'))
+    self.assertTrue(r is not libc.regex_compile(r'^(a+)(b?)$', libc.REG_ICASE))
+    self.assertEqual(['AB', 'A', 'B'],
+                     libc.regex_compile('^(a+)(b?)$', libc.REG_ICASE).match('AB'))
+
+    g = libc.regex_compile('(X.)')
+    self.assertEqual((3, 5), g.first_group_match('abcXbX', 0))
+    self.assertEqual(None, g.first_group_match('abcXbX', 4))
+
+    self.assertRaises(RuntimeError, libc.regex_compile, r'*')
+
+  def testRegexCacheIsBounded(self):
+    r = libc.regex_compile('first')
+    for i in xrange(1000):
+      libc.regex_compile('x%d' % i)
+    self.assertTrue(libc.regex_cache_size() <= 128, libc.regex_cache_size())
+
+    # An evicted regex is still usable
+    self.assertEqual(['first'], r.match('the first'))
+    self.assertTrue(r is not libc.regex_compile('first'))
+
+  def testRegexReplaceAll(self):
+    r = libc.regex_compile('(X.)')
+    self.assertEqual('o_o_ooX', r.replace_all('oXooXoooX', '_'))
+    self.assertEqual('o', r.replace_all('oXoXo', ''))
+    self.assertEqual('abc', r.replace_all('abc', '_'))  # no match
+    self.assertEqual('', r.replace_all('', '_'))
+
+    # Replacement that's longer than the input
+    self.assertEqual('<long><long>', r.replace_all('XXXo', '<long>'))
+
+    # An empty match stops, so this doesn't loop forever
+    self.assertEqual('abc', libc.regex_compile('()').replace_all('abc', '_'))
+
+  def testRegexAffix(self):
+    # (ere, s, is_suffix, longest, expected)
+    CASES = [
+        ('a.*', 'abab', False, False, 1),
+        ('a.*', 'abab', False, True, 4),
+        ('.*b', 'abab', True, False, 3),
+        ('.*b', 'abab', True, True, 0),
+        ('b', 'abab', False, False, -1),
+        ('a', 'abab', True, True, -1),
+        ('.*', '', False, True, -1),  # the match must be non-empty
+        ('.*', '', True, False, -1),
+        ('/.*', 'a/b/c', True, False, 3),
+        ('.*/', 'a/b/c', False, False, 2),
+        ('.*/', 'aaaa', False, False, -1),  # no match takes one call
+        ('/.*', 'aaaa', True, False, -1),
+        ('.*/', 'aaa/', False, False, 4),  # only the longest match
+        ('/.*', '/aaa', True, False, 0),
+    ]
+    for ere, s, is_suffix, longest, expected in CASES:
+      self.assertEqual(expected,
+                       libc.regex_affix(ere, s, is_suffix, longest))
+
+    self.assertRaises(RuntimeError, libc.regex_affix, '(', 'x', False, False)
+
   def testPrintTime(self):
     libc.print_time(0.1, 0.2, 0.3)
 
@@ -189,6 +253,10 @@ class LibcTest(unittest.TestCase):
     else:
       print('width % d' % width)
 
+  def testCpuCount(self):
+    n = libc.cpu_count()
+    self.assertTrue(n >= 1, n)
+
 
 if __name__ == '__main__':
   unittest.main()
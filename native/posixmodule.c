@@ -52,6 +52,9 @@ corresponding Unix manual entries for more information on calls.");
 #include <fcntl.h>
 #endif /* HAVE_FCNTL_H */
 
+/* OVM_MAIN: for posix_spawn() */
+#include <spawn.h>
+
 /* sys/resource.h is needed for at least: wait3(), wait4(), broken nice. */
 #if defined(HAVE_SYS_RESOURCE_H)
 #include <sys/resource.h>
@@ -1140,6 +1143,81 @@ posix_execv(PyObject *self, PyObject *args)
 }
 
 
+/* Returns a NULL-terminated array of "key=value" strings from a mapping like
+   posix.environ, and its length in *envc_ptr.  Shared by execve() and
+   posix_spawn(). */
+static char **
+parse_envlist(PyObject *env, Py_ssize_t *envc_ptr)
+{
+    char **envlist;
+    PyObject *key, *val, *keys=NULL, *vals=NULL;
+    Py_ssize_t i, pos, envc;
+
+    i = PyMapping_Size(env);
+    if (i < 0)
+        return NULL;
+    envlist = PyMem_NEW(char *, i + 1);
+    if (envlist == NULL) {
+        PyErr_NoMemory();
+        return NULL;
+    }
+    envc = 0;
+    keys = PyMapping_Keys(env);
+    vals = PyMapping_Values(env);
+    if (!keys || !vals)
+        goto fail;
+    if (!PyList_Check(keys) || !PyList_Check(vals)) {
+        PyErr_SetString(PyExc_TypeError,
+                        "env.keys() or env.values() is not a list");
+        goto fail;
+    }
+
+    for (pos = 0; pos < i; pos++) {
+        char *p, *k, *v;
+        size_t len;
+
+        key = PyList_GetItem(keys, pos);
+        val = PyList_GetItem(vals, pos);
+        if (!key || !val)
+            goto fail;
+
+        if (!PyArg_Parse(
+                    key,
+                    "s;env contains a non-string key",
+                    &k) ||
+            !PyArg_Parse(
+                val,
+                "s;env contains a non-string value",
+                &v))
+        {
+            goto fail;
+        }
+
+        len = PyString_Size(key) + PyString_Size(val) + 2;
+        p = PyMem_NEW(char, len);
+        if (p == NULL) {
+            PyErr_NoMemory();
+            goto fail;
+        }
+        PyOS_snprintf(p, len, "%s=%s", k, v);
+        envlist[envc++] = p;
+    }
+    envlist[envc] = 0;
+    Py_DECREF(vals);
+    Py_DECREF(keys);
+
+    *envc_ptr = envc;
+    return envlist;
+
+  fail:
+    while (--envc >= 0)
+        PyMem_DEL(envlist[envc]);
+    PyMem_DEL(envlist);
+    Py_XDECREF(vals);
+    Py_XDECREF(keys);
+    return NULL;
+}
+
 PyDoc_STRVAR_remove(posix_execve__doc__,
 "execve(path, args, env)\n\n\
 Execute a path with arguments and environment, replacing current process.\n\
@@ -1155,8 +1233,7 @@ posix_execve(PyObject *self, PyObject *args)
     PyObject *argv, *env;
     char **argvlist;
     char **envlist;
-    PyObject *key, *val, *keys=NULL, *vals=NULL;
-    Py_ssize_t i, pos, argc, envc;
+    Py_ssize_t i, argc, envc;
     PyObject *(*getitem)(PyObject *, Py_ssize_t);
     Py_ssize_t lastarg = 0;
 
@@ -1205,76 +1282,141 @@ posix_execve(PyObject *self, PyObject *args)
     lastarg = argc;
     argvlist[argc] = NULL;
 
-    i = PyMapping_Size(env);
-    if (i < 0)
-        goto fail_1;
-    envlist = PyMem_NEW(char *, i + 1);
-    if (envlist == NULL) {
-        PyErr_NoMemory();
+    envlist = parse_envlist(env, &envc);
+    if (envlist == NULL)
         goto fail_1;
+
+    execve(path, argvlist, envlist);
+
+    /* If we get here it's definitely an error */
+
+    (void) posix_error();
+
+    while (--envc >= 0)
+        PyMem_DEL(envlist[envc]);
+    PyMem_DEL(envlist);
+  fail_1:
+    free_string_array(argvlist, lastarg);
+  fail_0:
+    PyMem_Free(path);
+    return NULL;
+}
+#endif /* HAVE_EXECV */
+
+/* OVM_MAIN: posix_spawn() starts external commands without copying the
+   shell's page tables with fork().  The shell applies redirects to its own
+   descriptors before running a command, so the child only needs the signal
+   dispositions reset. */
+
+PyDoc_STRVAR_remove(posix_posix_spawn__doc__,
+"posix_spawn(path, args, env, setsigdef) -> pid\n\n\
+Execute the program specified by path in a new process.\n\
+\n\
+    path: path of executable file\n\
+    args: tuple or list of strings\n\
+    env: dictionary of strings mapping to strings\n\
+    setsigdef: list of signals to reset to their default handlers");
+
+static PyObject *
+posix_posix_spawn(PyObject *self, PyObject *args)
+{
+    char *path;
+    PyObject *argv, *env, *setsigdef;
+    char **argvlist = NULL;
+    char **envlist = NULL;
+    Py_ssize_t i, argc, envc = 0;
+    PyObject *(*getitem)(PyObject *, Py_ssize_t);
+    Py_ssize_t lastarg = 0;
+    posix_spawnattr_t attr;
+    sigset_t sigdefault;
+    pid_t pid;
+    int err;
+    PyObject *result = NULL;
+
+    if (!PyArg_ParseTuple(args, "etOOO!:posix_spawn",
+                          Py_FileSystemDefaultEncoding,
+                          &path, &argv, &env, &PyList_Type, &setsigdef))
+        return NULL;
+    if (PyList_Check(argv)) {
+        argc = PyList_Size(argv);
+        getitem = PyList_GetItem;
     }
-    envc = 0;
-    keys = PyMapping_Keys(env);
-    vals = PyMapping_Values(env);
-    if (!keys || !vals)
-        goto fail_2;
-    if (!PyList_Check(keys) || !PyList_Check(vals)) {
+    else if (PyTuple_Check(argv)) {
+        argc = PyTuple_Size(argv);
+        getitem = PyTuple_GetItem;
+    }
+    else {
         PyErr_SetString(PyExc_TypeError,
-                        "execve(): env.keys() or env.values() is not a list");
-        goto fail_2;
+                        "posix_spawn() arg 2 must be a tuple or list");
+        goto fail_0;
+    }
+    if (!PyMapping_Check(env)) {
+        PyErr_SetString(PyExc_TypeError,
+                        "posix_spawn() arg 3 must be a mapping object");
+        goto fail_0;
     }
 
-    for (pos = 0; pos < i; pos++) {
-        char *p, *k, *v;
-        size_t len;
-
-        key = PyList_GetItem(keys, pos);
-        val = PyList_GetItem(vals, pos);
-        if (!key || !val)
-            goto fail_2;
-
-        if (!PyArg_Parse(
-                    key,
-                    "s;execve() arg 3 contains a non-string key",
-                    &k) ||
-            !PyArg_Parse(
-                val,
-                "s;execve() arg 3 contains a non-string value",
-                &v))
-        {
-            goto fail_2;
+    sigemptyset(&sigdefault);
+    for (i = 0; i < PyList_GET_SIZE(setsigdef); i++) {
+        long sig = PyInt_AsLong(PyList_GET_ITEM(setsigdef, i));
+        if (sig == -1 && PyErr_Occurred())
+            goto fail_0;
+        if (sigaddset(&sigdefault, (int)sig) < 0) {
+            posix_error();
+            goto fail_0;
         }
+    }
 
-        len = PyString_Size(key) + PyString_Size(val) + 2;
-        p = PyMem_NEW(char, len);
-        if (p == NULL) {
-            PyErr_NoMemory();
-            goto fail_2;
+    argvlist = PyMem_NEW(char *, argc+1);
+    if (argvlist == NULL) {
+        PyErr_NoMemory();
+        goto fail_0;
+    }
+    for (i = 0; i < argc; i++) {
+        if (!PyArg_Parse((*getitem)(argv, i),
+                         "et;posix_spawn() arg 2 must contain only strings",
+                         Py_FileSystemDefaultEncoding,
+                         &argvlist[i]))
+        {
+            lastarg = i;
+            goto fail_1;
         }
-        PyOS_snprintf(p, len, "%s=%s", k, v);
-        envlist[envc++] = p;
     }
-    envlist[envc] = 0;
-
-    execve(path, argvlist, envlist);
+    lastarg = argc;
+    argvlist[argc] = NULL;
 
-    /* If we get here it's definitely an error */
+    envlist = parse_envlist(env, &envc);
+    if (envlist == NULL)
+        goto fail_1;
 
-    (void) posix_error();
+    /* glibc implements this with clone(CLONE_VFORK), and reports exec()
+       errors like ENOENT as the return value. */
+    err = posix_spawnattr_init(&attr);
+    if (err == 0) {
+        err = posix_spawnattr_setsigdefault(&attr, &sigdefault);
+        if (err == 0)
+            err = posix_spawnattr_setflags(&attr, POSIX_SPAWN_SETSIGDEF);
+        if (err == 0)
+            err = posix_spawn(&pid, path, NULL, &attr, argvlist, envlist);
+        posix_spawnattr_destroy(&attr);
+    }
+    if (err != 0) {
+        errno = err;
+        posix_error();
+    }
+    else {
+        result = PyInt_FromLong((long)pid);
+    }
 
-  fail_2:
     while (--envc >= 0)
         PyMem_DEL(envlist[envc]);
     PyMem_DEL(envlist);
   fail_1:
     free_string_array(argvlist, lastarg);
-    Py_XDECREF(vals);
-    Py_XDECREF(keys);
   fail_0:
     PyMem_Free(path);
-    return NULL;
+    return result;
 }
-#endif /* HAVE_EXECV */
 
 #ifdef HAVE_FORK
 PyDoc_STRVAR_remove(posix_fork__doc__,
@@ -1727,11 +1869,30 @@ posix_waitpid(PyObject *self, PyObject *args)
 
     if (!PyArg_ParseTuple(args, PARSE_PID "i:waitpid", &pid, &options))
         return NULL;
-    Py_BEGIN_ALLOW_THREADS
-    pid = waitpid(pid, &status, options);
-    Py_END_ALLOW_THREADS
-    if (pid == -1)
-        return posix_error();
+
+    // OVM_MAIN patch: Retry on EINTR, like wait().
+    while (1) {
+        pid_t result;
+        int saved_errno;
+
+        Py_BEGIN_ALLOW_THREADS
+        result = waitpid(pid, &status, options);
+        Py_END_ALLOW_THREADS
+
+        if (result != -1) {  // success, or 0 for WNOHANG
+            pid = result;
+            break;
+        }
+        saved_errno = errno;
+        if (PyErr_CheckSignals()) {
+            return NULL;  // Propagate KeyboardInterrupt
+        }
+        if (saved_errno != EINTR) {  // e.g. ECHILD
+            errno = saved_errno;
+            return posix_error();
+        }
+        // Otherwise, try again on EINTR.
+    }
 
     return Py_BuildValue("Ni", PyLong_FromPid(pid), WAIT_STATUS_INT(status));
 }
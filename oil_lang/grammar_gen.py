@@ -102,7 +102,8 @@ class OilTokenDef(object):
 def MakeOilLexer(code_str, arena):
   arena.PushSource(source.MainFile('pgen2_main'))
   line_reader = reader.StringLineReader(code_str, arena)
-  line_lexer = lexer.LineLexer(match.MATCHER, '', arena)
+  line_lexer = lexer.LineLexer(match.MATCHER, '', arena,
+                               multi_match_func=match.MULTI_MATCHER)
   lex = lexer.Lexer(line_lexer, line_reader)
   return lex
 
@@ -113,6 +113,7 @@ _NORMAL_BUILTINS = {
 
     "command": builtin_e.COMMAND,
     "type": builtin_e.TYPE,
+    "hash": builtin_e.HASH,
     "help": builtin_e.HELP,
     "history": builtin_e.HISTORY,
 
@@ -329,10 +330,12 @@ class Wait(object):
 
 class Jobs(object):
   """List jobs."""
-  def __init__(self, job_state):
+  def __init__(self, job_state, waiter):
     self.job_state = job_state
+    self.waiter = waiter
 
   def __call__(self, arg_vec):
+    self.waiter.Poll()  # update the state of jobs that have exited
     self.job_state.List()
     return 0
 
@@ -971,16 +974,13 @@ class Unset(object):
     return 0
 
 
-def _ParsePath(path_val):
-  if path_val.tag == value_e.Str:
-    return path_val.s.split(':')
-  else:
-    return []  # treat as empty path
-
-
-def _ResolveFile(name, path_list):
+def _ResolveFile(name, search_path):
   # Now look for files.
-  for path_dir in path_list:
+  full_path = search_path.CachedLookup(name)
+  if full_path is not None:
+    return ('file', full_path)
+  # Like bash, report a file that isn't executable, but don't cache it.
+  for path_dir in search_path.Dirs():
     full_path = os_path.join(path_dir, name)
     if path_stat.exists(full_path):
       return ('file', full_path)
@@ -988,9 +988,8 @@ def _ResolveFile(name, path_list):
   return (None, None)
 
 
-def _ResolveNames(names, funcs, aliases, path_val):
+def _ResolveNames(names, funcs, aliases, search_path):
   results = []
-  path_list = _ParsePath(path_val)
   for name in names:
     if name in funcs:
       kind = ('function', name)
@@ -1005,7 +1004,7 @@ def _ResolveNames(names, funcs, aliases, path_val):
     elif lex.IsKeyword(name):
       kind = ('keyword', name)
     else:
-      kind = _ResolveFile(name, path_list)
+      kind = _ResolveFile(name, search_path)
     results.append(kind)
 
   return results
@@ -1017,20 +1016,19 @@ COMMAND_SPEC.ShortFlag('-v')
 
 
 class Command(object):
-  def __init__(self, ex, funcs, aliases, mem):
+  def __init__(self, ex, funcs, aliases, search_path):
     self.ex = ex
     self.funcs = funcs
     self.aliases = aliases
-    self.mem = mem
+    self.search_path = search_path
 
   def __call__(self, arg_vec, fork_external):
     arg, arg_index = COMMAND_SPEC.ParseVec(arg_vec)
     if arg.v:
-      path_val = self.mem.GetVar('PATH')
       status = 0
       names = arg_vec.strs[arg_index:]
       for kind, arg in _ResolveNames(names, self.funcs, self.aliases,
-                                     path_val):
+                                     self.search_path):
         if kind is None:
           status = 1  # nothing printed, but we fail
         else:
@@ -1051,14 +1049,13 @@ TYPE_SPEC.ShortFlag('-P')
 
 
 class Type(object):
-  def __init__(self, funcs, aliases, mem):
+  def __init__(self, funcs, aliases, search_path):
     self.funcs = funcs
     self.aliases = aliases
-    self.mem = mem
+    self.search_path = search_path
 
   def __call__(self, arg_vec):
     arg, i = TYPE_SPEC.ParseVec(arg_vec)
-    path_val = self.mem.GetVar('PATH')
 
     if arg.f:
       funcs = []
@@ -1066,7 +1063,8 @@ class Type(object):
       funcs = self.funcs
 
     status = 0
-    r = _ResolveNames(arg_vec.strs[i:], funcs, self.aliases, path_val)
+    r = _ResolveNames(arg_vec.strs[i:], funcs, self.aliases,
+                      self.search_path)
     for kind, name in r:
       if kind is None:
         status = 1  # nothing printed, but we fail
@@ -1080,7 +1078,7 @@ class Type(object):
           if kind == 'file':
             print(name)
           else:
-            kind, path = _ResolveFile(name, _ParsePath(path_val))
+            kind, path = _ResolveFile(name, self.search_path)
             if kind is None:
               status = 1
             else:
@@ -1099,6 +1097,73 @@ class Type(object):
     return status
 
 
+HASH_SPEC = _Register('hash')
+HASH_SPEC.ShortFlag('-r')
+HASH_SPEC.ShortFlag('-d')
+HASH_SPEC.ShortFlag('-p', args.Str)
+HASH_SPEC.ShortFlag('-t')
+
+
+class Hash(object):
+  """The table of command locations, which is a state.SearchPath."""
+
+  def __init__(self, search_path, errfmt):
+    self.search_path = search_path
+    self.errfmt = errfmt
+
+  def __call__(self, arg_vec):
+    arg, i = HASH_SPEC.ParseVec(arg_vec)
+    names = arg_vec.strs[i:]
+
+    if arg.r:
+      self.search_path.ClearCache()
+
+    if arg.p is not None:
+      if len(names) != 1:
+        raise args.UsageError('hash -p expected a path and one name')
+      self.search_path.Put(names[0], arg.p)
+      return 0
+
+    if not names:
+      if arg.r:
+        return 0
+      if arg.d or arg.t:
+        raise args.UsageError('expected one or more names')
+      commands = self.search_path.CachedCommands()
+      if not commands:
+        print('hash: hash table empty')
+        return 0
+      print('hits\tcommand')
+      for _, full_path, hits in commands:
+        print('%4d\t%s' % (hits, full_path))
+      return 0
+
+    status = 0
+    for name in names:
+      if arg.d:
+        found = self.search_path.MaybeRemove(name)
+      elif arg.t:
+        full_path = self.search_path.GetCached(name)
+        found = full_path is not None
+        if found:
+          if len(names) == 1:
+            print(full_path)
+          else:
+            print('%s\t%s' % (name, full_path))
+      elif '/' in name:  # bash doesn't look these up
+        found = True
+      elif (Resolve(name) != builtin_e.NONE or
+            ResolveSpecial(name) != builtin_e.NONE):
+        found = True  # builtins aren't in the table
+      else:
+        found = self.search_path.CachedLookup(name) is not None
+
+      if not found:
+        self.errfmt.Print('hash: %r not found', name)
+        status = 1
+    return status
+
+
 DECLARE_SPEC = _Register('declare')
 DECLARE_SPEC.ShortFlag('-f')
 DECLARE_SPEC.ShortFlag('-F')
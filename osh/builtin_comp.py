@@ -135,7 +135,7 @@ class SpecBuilder(object):
         actions.append(completion.FileSystemAction(exec_only=True))
 
         # Look on the file system.
-        a = completion.ExternalCommandAction(ex.mem)
+        a = completion.ExternalCommandAction(ex.search_path)
 
       elif name == 'directory':
         a = completion.FileSystemAction(dirs_only=True)
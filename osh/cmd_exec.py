@@ -15,18 +15,20 @@ This just does head?  Last one wins.
 """
 from __future__ import print_function
 
+import cStringIO
 import resource
 import time
 import sys
 
 from _devbuild.gen.id_kind_asdl import Id
 from _devbuild.gen.syntax_asdl import (
-    command_e, redir_e, lhs_expr_e, lhs_expr_t, assign_op_e, source
+    command_e, redir_e, lhs_expr_e, lhs_expr_t, assign_op_e, source, word_e,
+    word_part_e,
 )
 from _devbuild.gen.syntax_asdl import word as osh_word  # TODO: Rename
 from _devbuild.gen.runtime_asdl import (
-    lvalue, redirect, value, value_e, value_t, scope_e, var_flags_e, builtin_e,
-    arg_vector
+    lvalue, lvalue_e, redirect, value, value_e, value_t, scope_e, var_flags_e,
+    builtin_e, arg_vector
 )
 from _devbuild.gen.types_asdl import redir_arg_type_e
 
@@ -40,6 +42,7 @@ from core.util import log, e_die
 from core.meta import REDIR_ARG_TYPES, REDIR_DEFAULT_FD
 
 from frontend import args
+from frontend import parse_cache
 from frontend import reader
 
 from osh import braces
@@ -56,6 +59,133 @@ except ImportError:
   from benchmarks import fake_libc as libc  # type: ignore
 
 
+# Builtins that only write to stdout or change variables, which are restored.
+# With shopt -s inline_command_sub, command subs that only use these run in
+# the shell process.
+_INLINE_BUILTINS = frozenset(
+    ['echo', 'printf', 'true', 'false', ':', 'test', '[', 'pwd', 'type'])
+
+# test -t looks at the real descriptor, which FdState.PushStdio() leaves alone.
+_STDIO_BUILTINS = _INLINE_BUILTINS - frozenset(['test', '['])
+
+
+def _WritesOnlyToStdio(node, funcs):
+  """Is this a builtin that only writes its output through sys.stdout?
+
+  Its redirects can then be applied with FdState.PushStdio().
+  """
+  if node.tag != command_e.SimpleCommand or not node.words:
+    return False
+  ok, name, _ = word.StaticEval(node.words[0])
+  return ok and name in _STDIO_BUILTINS and name not in funcs
+
+
+def _CanRunInline(node, funcs, seen):
+  """Can a command sub body run in the shell process, without forking?
+
+  Anything with redirects, pipelines, function definitions, or commands other
+  than _INLINE_BUILTINS and functions that use them must fork.
+
+  Args:
+    seen: names of functions being checked, for recursion.
+  """
+  tag = node.tag
+  if tag == command_e.SimpleCommand:
+    if node.redirects or not node.words:
+      return False
+    ok, name, _ = word.StaticEval(node.words[0])
+    if not ok:
+      return False
+
+    func_node = funcs.get(name)
+    if func_node is not None:
+      if name in seen:
+        return True
+      if func_node.redirects:
+        return False
+      seen.add(name)
+      return _CanRunInline(func_node.body, funcs, seen)
+
+    if name == 'command':  # command -v is common
+      if len(node.words) < 2:
+        return False
+      ok, flag, _ = word.StaticEval(node.words[1])
+      return ok and flag == '-v'
+
+    return name in _INLINE_BUILTINS
+
+  if tag in (command_e.Assignment, command_e.ControlFlow, command_e.NoOp):
+    return True
+
+  if tag == command_e.Sentence:
+    return _CanRunInline(node.child, funcs, seen)
+
+  if tag == command_e.ExpandedAlias:
+    return (not node.redirects and
+            _CanRunInline(node.child, funcs, seen))
+
+  if tag == command_e.Pipeline:  # only ! foo, since pipelines fork
+    return (len(node.children) == 1 and
+            _CanRunInline(node.children[0], funcs, seen))
+
+  if tag in (command_e.CommandList, command_e.AndOr):
+    children = node.children
+  elif tag in (command_e.BraceGroup, command_e.DoGroup):
+    if node.redirects:
+      return False
+    children = node.children
+  elif tag in (command_e.DParen, command_e.DBracket):
+    return not node.redirects
+  elif tag in (command_e.ForEach, command_e.ForExpr):
+    if node.redirects:
+      return False
+    children = [node.body] if node.body else []
+  elif tag == command_e.WhileUntil:
+    if node.redirects:
+      return False
+    children = node.cond + [node.body]
+  elif tag == command_e.If:
+    if node.redirects:
+      return False
+    children = list(node.else_action)
+    for arm in node.arms:
+      children.extend(arm.cond)
+      children.extend(arm.action)
+  elif tag == command_e.Case:
+    if node.redirects:
+      return False
+    children = []
+    for arm in node.arms:
+      children.extend(arm.action)
+  else:
+    return False  # Subshell, FuncDef, TimeBlock, etc.
+
+  for child in children:
+    if not _CanRunInline(child, funcs, seen):
+      return False
+  return True
+
+
+def _CollectCommandSubs(words, out):
+  """Append the command sub nodes that are always evaluated with 'words'.
+
+  Command subs inside ${x:-$(cmd)}, arithmetic, etc. may not be evaluated, so
+  they're skipped.
+  """
+  for w in words:
+    if w.tag == word_e.CompoundWord:
+      _CollectCommandSubParts(w.parts, out)
+
+
+def _CollectCommandSubParts(parts, out):
+  for part in parts:
+    if part.tag == word_part_e.CommandSubPart:
+      if part.left_token.id in (Id.Left_DollarParen, Id.Left_Backtick):
+        out.append(part.command_list)
+    elif part.tag == word_part_e.DoubleQuotedPart:
+      _CollectCommandSubParts(part.parts, out)
+
+
 class _ControlFlow(RuntimeError):
   """Internal execption for control flow.
 
@@ -101,6 +231,7 @@ class Deps(object):
     self.prompt_ev = None
 
     self.ext_prog = None
+    self.search_path = None
 
     self.dumper = None
     self.tracer = None
@@ -144,6 +275,8 @@ class Executor(object):
     self.parse_ctx = parse_ctx
     self.arena = parse_ctx.arena
     self.aliases = parse_ctx.aliases  # alias name -> string
+    # eval and trap strings -> LST
+    self.code_cache = parse_cache.CodeCache(self.aliases)
 
     self.dumper = exec_deps.dumper
     self.errfmt = exec_deps.errfmt
@@ -155,6 +288,7 @@ class Executor(object):
     self.bool_ev = exec_deps.bool_ev
 
     self.ext_prog = exec_deps.ext_prog
+    self.search_path = exec_deps.search_path
     self.traps = exec_deps.traps
     self.trap_nodes = exec_deps.trap_nodes
 
@@ -171,6 +305,9 @@ class Executor(object):
     self.loop_level = 0  # for detecting bad top-level break/continue
     self.check_command_sub_status = False  # a hack
 
+    # For shopt -s parallel_command_sub: command_list node -> (status, chunks)
+    self.cmd_sub_results = {}
+
   def _EvalHelper(self, c_parser, src):
     self.arena.PushSource(src)
     try:
@@ -183,18 +320,39 @@ class Executor(object):
     # - set -o sane-eval should change eval to take a single string.
     code_str = ' '.join(arg_vec.strs[1:])
     eval_spid = arg_vec.spids[0]
+    src = source.EvalArg(eval_spid)
 
-    line_reader = reader.StringLineReader(code_str, self.arena)
-    c_parser = self.parse_ctx.MakeOshParser(line_reader)
+    # With reclaim_arena, the spans of the cached nodes would be discarded.
+    if self.exec_opts.reclaim_arena:
+      line_reader = reader.StringLineReader(code_str, self.arena)
+      c_parser = self.parse_ctx.MakeOshParser(line_reader)
+      return self._EvalHelper(c_parser, src)
 
-    src = source.EvalArg(eval_spid)
-    return self._EvalHelper(c_parser, src)
+    # The location is part of the key, so errors point to the right 'eval'.
+    key = ('eval', code_str, eval_spid)
+    nodes = self.code_cache.Get(key)
+    if nodes is not None:
+      return self._EvalHelper(parse_cache.NodeListParser(nodes), src)
+
+    line_reader = reader.StringLineReader(code_str, self.arena)
+    recorder = parse_cache.NodeRecorder(
+        self.parse_ctx.MakeOshParser(line_reader))
+    try:
+      return self._EvalHelper(recorder, src)
+    finally:
+      if recorder.complete:
+        self.code_cache.Put(key, recorder.nodes)
 
   def ParseTrapCode(self, code_str):
     """
     Returns:
       A node, or None if the code is invalid.
     """
+    key = ('trap', code_str)
+    node = self.code_cache.Get(key)
+    if node is not None:
+      return node
+
     line_reader = reader.StringLineReader(code_str, self.arena)
     c_parser = self.parse_ctx.MakeOshParser(line_reader)
 
@@ -210,6 +368,8 @@ class Executor(object):
     finally:
       self.arena.PopSource()
 
+    self.arena.Retain()  # the trap handler outlives the current command
+    self.code_cache.Put(key, node)
     return node
 
   def _Source(self, arg_vec):
@@ -229,8 +389,7 @@ class Executor(object):
       return 1
 
     try:
-      line_reader = reader.FileLineReader(f, self.arena)
-      c_parser = self.parse_ctx.MakeOshParser(line_reader)
+      c_parser = self.parse_ctx.MakeOshFileParser(f, path)
 
       # A sourced module CAN have a new arguments array, but it always shares
       # the same variable scope as the caller.  The caller could be at either a
@@ -292,7 +451,7 @@ class Executor(object):
     elif builtin_id == builtin_e.COMMAND:
       # TODO: How do we hadnle fork_external?  It doesn't fit the common
       # signature.
-      b = builtin.Command(self, self.funcs, self.aliases, self.mem)
+      b = builtin.Command(self, self.funcs, self.aliases, self.search_path)
       status = b(arg_vec, fork_external)
 
     elif builtin_id == builtin_e.BUILTIN:  # NOTE: uses early return style
@@ -333,11 +492,13 @@ class Executor(object):
       status = 2  # consistent error code for usage error
     finally:
       # Flush stdout after running ANY builtin.  This is very important!
-      # Silence errors like we did from 'echo'.
-      try:
-        sys.stdout.flush()
-      except IOError as e:
-        pass
+      # Silence errors like we did from 'echo'.  A redirect target from
+      # PushStdio() is flushed by Pop(), which reports errors.
+      if not self.fd_state.StdoutIsRedirectFile():
+        try:
+          sys.stdout.flush()
+        except IOError as e:
+          pass
 
       self.errfmt.PopLocation()
     return status
@@ -573,6 +734,30 @@ class Executor(object):
 
     return status
 
+  def _MaxJobs(self):
+    """Return the limit on background jobs in $OSH_MAX_JOBS, or 0."""
+    val = self.mem.GetVar('OSH_MAX_JOBS')
+    if val.tag != value_e.Str or not val.s:
+      return 0
+    try:
+      max_jobs = int(val.s)
+    except ValueError:
+      max_jobs = -1
+    if max_jobs < 0:
+      e_die('OSH_MAX_JOBS should be a non-negative integer, got %r', val.s)
+    return max_jobs
+
+  def _WaitForJobSlot(self):
+    """Block until fewer than $OSH_MAX_JOBS background jobs are running."""
+    max_jobs = self._MaxJobs()
+    if max_jobs == 0:
+      return
+    while self.job_state.NumRunning() >= max_jobs:
+      # Any child that exits may free a slot.  A finished job that hasn't been
+      # reaped yet is still counted, so this doesn't block in that case.
+      if not self.waiter.Wait():
+        break  # no children, e.g. jobs started by our parent shell
+
   def _RunJobInBackground(self, node):
     # Special case for pipeline.  There is some evidence here:
     # https://www.gnu.org/software/libc/manual/html_node/Launching-Jobs.html#Launching-Jobs
@@ -582,6 +767,8 @@ class Executor(object):
     #  ancestor of all the other processes in that group. The sample shell
     #  program presented in this chapter uses the first approach because it
     #  makes bookkeeping somewhat simpler."
+    self._WaitForJobSlot()
+
     if node.tag == command_e.Pipeline:
       pi = process.Pipeline()
       for child in node.children:
@@ -650,6 +837,10 @@ class Executor(object):
       # - line numbers for every command would be very nice.  But then you have
       # to print the filename too.
 
+      if self.exec_opts.parallel_command_sub:
+        self._StartCommandSubs(
+            node.words + [env_pair.val for env_pair in node.more_env])
+
       words = braces.BraceExpandWords(node.words)
       arg_vec = self.word_ev.EvalWordSequence2(words)
       argv = arg_vec.strs
@@ -755,6 +946,9 @@ class Executor(object):
       else:
         raise AssertionError(node.keyword)
 
+      if self.exec_opts.parallel_command_sub:
+        self._StartCommandSubs([pair.rhs for pair in node.pairs if pair.rhs])
+
       for pair in node.pairs:
         # Use the spid of each pair.
         self.mem.SetCurrentSpanId(pair.spids[0])
@@ -762,6 +956,15 @@ class Executor(object):
         if pair.op == assign_op_e.PlusEqual:
           assert pair.rhs, pair.rhs  # I don't think a+= is valid?
           val = self.word_ev.EvalRhsWord(pair.rhs)
+
+          # s+=x appends in place, without copying s.
+          if (pair.lhs.tag == lhs_expr_e.LhsName and val.tag == value_e.Str and
+              lookup_mode == scope_e.Dynamic and not flags and
+              self.mem.AppendString(pair.lhs.name, val.s)):
+            lval = lvalue.LhsName(pair.lhs.name)
+            self.tracer.OnAssignment(lval, pair.op, val, flags, lookup_mode)
+            continue
+
           old_val, lval = expr_eval.EvalLhsAndLookup(pair.lhs, self.arith_ev,
                                                      self.mem, self.exec_opts)
           sig = (old_val.tag, val.tag)
@@ -773,10 +976,19 @@ class Executor(object):
             val = value.Str(old_val.s + val.s)
           elif sig == (value_e.Str, value_e.StrArray):
             e_die("Can't append array to string")
-          elif sig == (value_e.StrArray, value_e.Str):
+          elif sig in ((value_e.StrArray, value_e.Str),
+                       (value_e.SparseArray, value_e.Str)):
             e_die("Can't append string to array")
           elif sig == (value_e.StrArray, value_e.StrArray):
             val = value.StrArray(old_val.strs + val.strs)
+          elif sig == (value_e.SparseArray, value_e.StrArray):
+            # New entries go after the last one, like in bash.
+            d = dict(old_val.d)
+            i = old_val.max_index
+            for s in val.strs:
+              i += 1
+              d[i] = s
+            val = value.SparseArray(d, i)
 
         else:  # plain assignment
           spid = pair.spids[0]  # Source location for tracing
@@ -784,7 +996,17 @@ class Executor(object):
 
           # RHS can be a string or array.
           if pair.rhs:
-            val = self.word_ev.EvalRhsWord(pair.rhs)
+            anode = word.ArithSubExpr(pair.rhs)
+            if anode and lval.tag == lvalue_e.LhsName:
+              # i=$((i + 1)) stores the integer, so arithmetic doesn't have to
+              # parse it.
+              i = self.arith_ev.Eval(anode)
+              if isinstance(i, list):
+                val = value.Str(str(i))
+              else:
+                val = value.Int(i)
+            else:
+              val = self.word_ev.EvalRhsWord(pair.rhs)
             assert isinstance(val, value_t), val
 
           else:  # e.g. 'readonly x' or 'local x'
@@ -1011,6 +1233,7 @@ class Executor(object):
       # NOTE: Would it make sense to evaluate the redirects BEFORE entering?
       # It will save time on function calls.
       self.funcs[node.name] = node
+      self.arena.Retain()  # the body's spans are needed when it's called
       status = 0
 
     elif node.tag == command_e.If:
@@ -1100,6 +1323,12 @@ class Executor(object):
       for node in to_run:
         self._Execute(node)
 
+    # Reap background jobs that have exited, so a script that starts many of
+    # them doesn't accumulate zombies.  Poll() usually just reads the SIGCHLD
+    # pipe.
+    if self.job_state.NumRunning():
+      self.waiter.Poll()
+
     # These nodes have no redirects.  NOTE: Function definitions have
     # redirects, but we do NOT want to evaluate them yet!  They're evaluated
     # on every invocation.
@@ -1123,11 +1352,19 @@ class Executor(object):
       status = 1
 
     elif redirects:
-      if self.fd_state.Push(redirects, self.waiter):
+      if (self.fd_state.CanPushStdio(redirects) and
+          _WritesOnlyToStdio(node, self.funcs)):
+        ok = self.fd_state.PushStdio(redirects)  # fast path
+      else:
+        ok = self.fd_state.Push(redirects, self.waiter)
+
+      if ok:
         try:
           status, check_errexit = self._Dispatch(node, fork_external)
         finally:
-          self.fd_state.Pop()
+          popped = self.fd_state.Pop()
+        if not popped:  # e.g. 'echo hi >/dev/full'
+          status = 1
         #log('_dispatch returned %d', status)
       else:  # Error applying redirects, e.g. bad file descriptor.
         status = 1
@@ -1238,7 +1475,58 @@ class Executor(object):
     else:
       return False  # nothing run, don't use its status
 
-  def RunCommandSub(self, node):
+  def _RunCommandSubInline(self, node):
+    """Run a command sub in the shell process, capturing stdout.
+
+    Like a subshell, variable assignments and the status stack are restored
+    afterward.  Options can't change, because 'set' and 'shopt' aren't
+    allowed.
+
+    Returns:
+      (status, stdout string)
+    """
+    snapshot = self.mem.Snapshot()
+    errexit = self.exec_opts.errexit
+    saved_errexit = (errexit.errexit, list(errexit.stack))
+    if not self.exec_opts.strict_errexit:
+      errexit.Disable()
+
+    # Commands in the body start their own parallel command subs, and must not
+    # clobber the ones the enclosing command already started.
+    saved_results = self.cmd_sub_results
+    self.cmd_sub_results = {}
+
+    saved_stdout = sys.stdout
+    saved_stdout.flush()
+    buf = cStringIO.StringIO()
+    sys.stdout = buf
+    pid = posix.getpid()
+    try:
+      try:
+        self.ExecuteAndCatch(node, fork_external=True)
+        status = self.mem.LastStatus()
+      except SystemExit as e:  # e.g. from ${x?}, which would exit a subshell
+        if posix.getpid() != pid:
+          raise  # a child process forked by the command sub is exiting
+        status = e.code
+    finally:
+      sys.stdout = saved_stdout
+      errexit.errexit, errexit.stack[:] = saved_errexit
+      self.mem.Restore(snapshot)
+      self.cmd_sub_results = saved_results
+
+    return status, buf.getvalue()
+
+  def _CanRunCommandSubInline(self, node):
+    return (self.exec_opts.inline_command_sub and
+            _CanRunInline(node, self.funcs, set()))
+
+  def _StartCommandSub(self, node):
+    """Fork a process for a command sub.
+
+    Returns:
+      The process and the read end of the pipe connected to its stdout.
+    """
     p = self._MakeProcess(node,
                           disable_errexit=not self.exec_opts.strict_errexit)
 
@@ -1247,9 +1535,16 @@ class Executor(object):
     pid = p.Start()
     #log('Command sub started %d', pid)
     self.waiter.Register(pid, p.WhenDone)
+    posix.close(w)  # not going to write
+    return p, r
+
+  def _WaitCommandSub(self, p, r):
+    """Read a command sub's output until EOF, and wait for it.
 
+    Returns:
+      (status, list of output chunks)
+    """
     chunks = []
-    posix.close(w)  # not going to write
     while True:
       byte_str = posix.read(r, 4096)
       if not byte_str:
@@ -1258,7 +1553,44 @@ class Executor(object):
     posix.close(r)
 
     status = p.WaitUntilDone(self.waiter)
+    return status, chunks
+
+  def _StartCommandSubs(self, words):
+    """For shopt -s parallel_command_sub.
+
+    Run the command subs in these words concurrently, and save their results
+    for RunCommandSub().  They all start before any assignment in the command
+    takes effect.
+    """
+    nodes = []
+    _CollectCommandSubs(words, nodes)
+    nodes = [n for n in nodes if not self._CanRunCommandSubInline(n)]
+    if len(nodes) < 2:
+      return
+
+    self.cmd_sub_results.clear()  # in case an error left some behind
+    started = [self._StartCommandSub(node) for node in nodes]
+    # Each process writes to its own pipe, so reading them in order can't
+    # deadlock.
+    for node, (p, r) in zip(nodes, started):
+      self.cmd_sub_results[node] = self._WaitCommandSub(p, r)
+
+  def RunCommandSub(self, node):
+    if self.cmd_sub_results and self.exec_opts.parallel_command_sub:
+      result = self.cmd_sub_results.pop(node, None)
+      if result is not None:
+        status, chunks = result
+        return self._FinishCommandSub(node, status, chunks)
+
+    if self._CanRunCommandSubInline(node):
+      status, stdout = self._RunCommandSubInline(node)
+      return self._FinishCommandSub(node, status, [stdout])
+
+    p, r = self._StartCommandSub(node)
+    status, chunks = self._WaitCommandSub(p, r)
+    return self._FinishCommandSub(node, status, chunks)
 
+  def _FinishCommandSub(self, node, status, chunks):
     # OSH has the concept of aborting in the middle of a WORD.  We're not
     # waiting until the command is over!
     if self.exec_opts.strict_errexit:
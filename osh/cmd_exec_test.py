@@ -15,6 +15,7 @@ from _devbuild.gen.id_kind_asdl import Id
 from _devbuild.gen.syntax_asdl import suffix_op, word_part, token
 from _devbuild.gen.syntax_asdl import word as osh_word
 from core import test_lib
+from osh import cmd_exec  # module under test
 from osh import state
 
 
@@ -38,6 +39,50 @@ class ExpansionTest(unittest.TestCase):
     #print(ex._ExpandWords(node.words))
 
 
+class InlineCommandSubTest(unittest.TestCase):
+
+  def testCanRunInline(self):
+    arena = test_lib.MakeArena('<cmd_exec_test.py>')
+    funcs = {}
+    for code_str in ['f() { printf "%s" x; }', 'g() { f; ls; }',
+                     'h() { h; }', 'r() { echo; } > out.txt']:
+      node = test_lib.InitCommandParser(code_str, arena=arena).ParseLogicalLine()
+      funcs[node.name] = node
+
+    CASES = [
+        ('echo hi; printf "%s\n" x', True),
+        ('x=1; local y; (( i++ )); [[ -n $x ]]', True),
+        ('if true; then f; else for i in 1 2; do echo $i; done; fi', True),
+        ('command -v sh', True),
+        ('! false && h', True),
+
+        ('ls', False),
+        ('g', False),
+        ('r', False),
+        ('echo hi > out.txt', False),
+        ('echo hi | cat', False),
+        ('( echo hi )', False),
+        ('$cmd', False),
+        ('command sh -c true', False),
+        ('set -e; echo', False),
+        ('f2() { echo; }', False),
+    ]
+    for code_str, expected in CASES:
+      c_parser = test_lib.InitCommandParser(code_str, arena=arena)
+      node = c_parser.ParseCommandSub()
+      self.assertEqual(expected,
+                       cmd_exec._CanRunInline(node, funcs, set()), code_str)
+
+
+  def testCollectCommandSubs(self):
+    arena = test_lib.MakeArena('<cmd_exec_test.py>')
+    code_str = 'echo $(a) "x$(b)" `c` ${x:-$(d)} $(( $(e) )) <(f)'
+    node = test_lib.InitCommandParser(code_str, arena=arena).ParseLogicalLine()
+    nodes = []
+    cmd_exec._CollectCommandSubs(node.words, nodes)
+    self.assertEqual(3, len(nodes))
+
+
 class VarOpTest(unittest.TestCase):
 
   def testVarOps(self):
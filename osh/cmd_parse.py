@@ -415,7 +415,8 @@ class CommandParser(object):
     # type: () -> None
     """Reset our own internal state.
 
-    Called by the interactive loop.
+    Called by the interactive loop, and by Batch() with shopt -s
+    reclaim_arena.
     """
     # Cursor state set by _Peek()
     self.next_lex_mode = lex_mode_e.ShCommand
@@ -13,10 +13,10 @@ import stat
 
 from _devbuild.gen.id_kind_asdl import Id
 from _devbuild.gen.runtime_asdl import (
-    lvalue, value, value_e, value_t, scope_e,
+    lvalue, lvalue_e, value, value_e, value_t, scope_e,
 )
 from _devbuild.gen.syntax_asdl import (
-    arith_expr_e, lhs_expr_e, lhs_expr_t, bool_expr_e,
+    arith_expr_e, lhs_expr_e, lhs_expr_t, bool_expr_e, word_e, word_part_e,
 )
 from _devbuild.gen.types_asdl import bool_arg_type_e
 from asdl import const
@@ -32,6 +32,9 @@ try:
 except ImportError:
   from benchmarks import fake_libc as libc  # type: ignore
 
+# The number of distinct constants like the 1 in (( i += 1 )) to remember.
+_MAX_LITERAL_INTS = 1000
+
 
 def _StringToInteger(s, span_id=const.NO_INTEGER):
   """Use bash-like rules to coerce a string to an integer.
@@ -198,6 +201,13 @@ def EvalLhsAndLookup(node, arith_ev, mem, exec_opts):
         assert isinstance(item, str), item
         val = value.Str(item)
 
+    elif val.tag == value_e.SparseArray:
+      item = state.SparseLookup(val, index)
+      if item is None:
+        val = value.Str('')
+      else:
+        val = value.Str(item)
+
     elif val.tag == value_e.AssocArray:  # declare -A a; a['x']+=1
       # TODO: Also need IsAssocArray() check?
       index = arith_ev.Eval(node.index, int_coerce=False)
@@ -215,10 +225,36 @@ def EvalLhsAndLookup(node, arith_ev, mem, exec_opts):
 
 class ArithEvaluator(_ExprEvaluator):
 
+  def __init__(self, mem, exec_opts, word_ev, errfmt):
+    _ExprEvaluator.__init__(self, mem, exec_opts, word_ev, errfmt)
+    self.literal_ints = {}  # constant string -> int
+
+  def _LiteralToInteger(self, w):
+    """Return the value of a constant word like 1 or 0xff, or None.
+
+    Constants are parsed once, like variables that hold a value.Int.
+    """
+    if (w.tag != word_e.CompoundWord or len(w.parts) != 1 or
+        w.parts[0].tag != word_part_e.LiteralPart):
+      return None
+    s = w.parts[0].token.val
+    i = self.literal_ints.get(s)
+    if i is None:
+      try:
+        i = _StringToInteger(s)
+      except util.FatalRuntimeError:
+        return None  # the caller reports the error
+      if len(self.literal_ints) < _MAX_LITERAL_INTS:
+        self.literal_ints[s] = i
+    return i
+
   def _ValToArith(self, val, span_id, int_coerce=True):
     """Convert value_t to a Python int or list of strings."""
     assert isinstance(val, value_t), '%r %r' % (val, type(val))
 
+    if val.tag == value_e.Int:  # stored by arithmetic, so it isn't parsed
+      return val.i if int_coerce else str(val.i)
+
     if int_coerce:
       if val.tag == value_e.Undef:  # 'nounset' already handled before got here
         # Happens upon a[undefined]=42, which unfortunately turns into a[0]=42.
@@ -234,6 +270,12 @@ class ArithEvaluator(_ExprEvaluator):
       if val.tag == value_e.StrArray:  # array is valid on RHS, but not on left
         return val.strs
 
+      if val.tag == value_e.SparseArray:  # like ${a[0]}
+        s = state.SparseLookup(val, 0)
+        if s is None:
+          return 0
+        return _StringToInteger(s, span_id=span_id)
+
       if val.tag == value_e.AssocArray:
         return val.d
 
@@ -248,6 +290,10 @@ class ArithEvaluator(_ExprEvaluator):
     if val.tag == value_e.StrArray:  # array is valid on RHS, but not on left
       return val.strs
 
+    if val.tag == value_e.SparseArray:
+      s = state.SparseLookup(val, 0)
+      return '' if s is None else s
+
     if val.tag == value_e.AssocArray:
       return val.d
 
@@ -269,7 +315,21 @@ class ArithEvaluator(_ExprEvaluator):
     return i
 
   def _LookupVar(self, name):
-    return _LookupVar(name, self.mem, self.exec_opts)
+    val = self.mem.GetArithVar(name)
+    if val.tag == value_e.Undef and self.exec_opts.nounset:
+      e_die('Undefined variable %r', name)  # TODO: need token
+    return val
+
+  def _EvalIndexed(self, node):
+    """Evaluate the left side of a[i].
+
+    A SparseArray is coerced to its first entry by Eval(), so look it up here.
+    """
+    if node.tag == arith_expr_e.ArithVarRef:
+      val = self._LookupVar(node.token.val)
+      if val.tag == value_e.SparseArray:
+        return val
+    return self.Eval(node)
 
   def _EvalLhsAndLookupArith(self, node):
     """
@@ -278,9 +338,13 @@ class ArithEvaluator(_ExprEvaluator):
     Returns:
       int or list of strings, lvalue_t
     """
-    val, lval = EvalLhsAndLookup(node, self, self.mem, self.exec_opts)
+    if node.tag == lhs_expr_e.LhsName:  # (( i++ )) doesn't make a string
+      lval = lvalue.LhsName(node.name)
+      val = self._LookupVar(node.name)
+    else:
+      val, lval = EvalLhsAndLookup(node, self, self.mem, self.exec_opts)
 
-    if val.tag == value_e.StrArray:
+    if val.tag in (value_e.StrArray, value_e.SparseArray):
       e_die("Can't use assignment like ++ or += on arrays")
 
     # TODO: attribute a span ID here.  There are a few cases, like UnaryAssign
@@ -316,7 +380,10 @@ class ArithEvaluator(_ExprEvaluator):
     raise AssertionError(node.tag)
 
   def _Store(self, lval, new_int):
-    val = value.Str(str(new_int))
+    if lval.tag == lvalue_e.LhsName and not isinstance(new_int, list):
+      val = value.Int(new_int)
+    else:
+      val = value.Str(str(new_int))  # array entries are strings
     self.mem.SetVar(lval, val, (), scope_e.Dynamic)
 
   def Eval(self, node, int_coerce=True):
@@ -338,6 +405,10 @@ class ArithEvaluator(_ExprEvaluator):
                                      span_id=tok.span_id)
 
     if node.tag == arith_expr_e.ArithWord:  # $(( $x )) $(( ${x}${y} )), etc.
+      if int_coerce:
+        i = self._LiteralToInteger(node.w)
+        if i is not None:
+          return i
       val = self.word_ev.EvalWordToString(node.w)
       return self._ValToArithOrError(val, int_coerce=int_coerce, blame_word=node.w)
 
@@ -429,7 +500,10 @@ class ArithEvaluator(_ExprEvaluator):
     if node.tag == arith_expr_e.ArithBinary:
       op_id = node.op_id
 
-      lhs = self.Eval(node.left)
+      if op_id == Id.Arith_LBracket:
+        lhs = self._EvalIndexed(node.left)
+      else:
+        lhs = self.Eval(node.left)
 
       # Short-circuit evaluation for || and &&.
       if op_id == Id.Arith_DPipe:
@@ -448,13 +522,18 @@ class ArithEvaluator(_ExprEvaluator):
       rhs = self.Eval(node.right)  # eager evaluation for the rest
 
       if op_id == Id.Arith_LBracket:
-        if not isinstance(lhs, list):
+        if isinstance(lhs, list):
+          try:
+            item = lhs[rhs]
+          except IndexError:
+            item = None
+        elif isinstance(lhs, value.SparseArray):
+          item = state.SparseLookup(lhs, rhs)
+        else:
           # TODO: Add error context
           e_die('Expected array in index expression, got %s', lhs)
 
-        try:
-          item = lhs[rhs]
-        except IndexError:
+        if item is None:
           if self.exec_opts.nounset:
             e_die('Index out of bounds')
           else:
@@ -717,12 +796,13 @@ class BoolEvaluator(_ExprEvaluator):
           # TODO: This should go to --debug-file
           #log('Matching %r against regex %r', s1, s2)
           try:
-            matches = libc.regex_match(s2, s1)
+            regex = libc.regex_compile(s2)  # cached
           except RuntimeError:
             # Status 2 indicates a regex parse error.  This is fatal in OSH but
             # not in bash, which treats [[ like a command with an exit code.
             e_die("Invalid regex %r", s2, word=node.right, status=2)
 
+          matches = regex.match(s1)
           if matches is None:
             return False
 
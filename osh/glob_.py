@@ -79,6 +79,35 @@ def ExtendedRegexEscape(s):
   return util.BackslashEscape(s, ERE_META_CHARS)
 
 
+def GlobToLiteral(s):
+  """Return the string that a glob without operators matches, or None.
+
+  Unlike GlobUnescape, any escaped character is allowed, since fnmatch()
+  treats \\f as f.  Returns None for a glob, or a trailing backslash, which
+  never matches.
+
+  Used for the ${x//pat/replace} fast path.
+  """
+  if LooksLikeGlob(s):
+    return None
+  if '\\' not in s:
+    return s
+
+  chars = []
+  i = 0
+  n = len(s)
+  while i < n:
+    c = s[i]
+    if c == '\\':
+      if i == n - 1:
+        return None
+      i += 1
+      c = s[i]
+    chars.append(c)
+    i += 1
+  return ''.join(chars)
+
+
 def GlobUnescape(s):  # used by cmd_exec
   """Remove glob escaping from a string.
 
@@ -173,7 +202,7 @@ class _GlobParser(object):
       if id1 in (Id.Glob_Bang, Id.Glob_Caret):
         negated = True
         tokens = tokens[1:]
-    return [glob_part.CharClass(negated, [s for _, s in tokens])]
+    return [glob_part.CharClass(negated, [s for _id, s in tokens])]
 
   def Parse(self):
     """
@@ -56,6 +56,20 @@ class GlobEscapeTest(unittest.TestCase):
       self.assertEqual(expected, glob_.LooksLikeGlob(pat),
                        '%s: expected %r' % (pat, expected))
 
+  def testGlobToLiteral(self):
+    CASES = [
+        (',', ','),
+        ('', ''),
+        (r'\*.sh', '*.sh'),
+        (r'a\[b', 'a[b'),
+        (r'\f', 'f'),  # like fnmatch()
+        ('a\\', None),  # trailing backslash
+        ('*.sh', None),
+        ('[ab]', None),
+    ]
+    for pat, expected in CASES:
+      self.assertEqual(expected, glob_.GlobToLiteral(pat))
+
   def testGlobStripRegexes(self):
     s = 'aabbccdd'
 
@@ -11,12 +11,12 @@ from __future__ import print_function
 
 import cStringIO
 
-from typing import List
+from typing import Dict, List
 
 from _devbuild.gen.id_kind_asdl import Id
 from _devbuild.gen.syntax_asdl import lhs_expr
 from _devbuild.gen.runtime_asdl import (
-    value, value_e, lvalue_e, scope_e, var_flags_e, value__Str
+    value, value_e, value_t, lvalue_e, scope_e, var_flags_e, value__Str
 )
 from _devbuild.gen import runtime_asdl  # for cell
 from asdl import const
@@ -24,6 +24,8 @@ from core import util
 from core.util import log, e_die
 from frontend import args
 from osh import split
+from pylib import os_path
+from pylib import path_stat
 
 import libc
 import posix_ as posix
@@ -35,6 +37,15 @@ import posix_ as posix
 # Used in both core/competion.py and osh/state.py
 _READLINE_DELIMS = ' \t\n"\'><=;|&(:'
 
+# An indexed array becomes a SparseArray when an assignment leaves a gap bigger
+# than both this and the array's size.  It becomes dense again when more than
+# half of its slots are filled.
+_SPARSE_MIN_GAP = 1024
+
+# Values that are stored in cells, but turned into a Str before anything
+# outside of Mem sees them.
+_LAZY_STR_TAGS = (value_e.StrBuffer, value_e.Int)
+
 
 class _ErrExit(object):
   """Manages the errexit setting.
@@ -110,7 +121,10 @@ SET_OPTION_NAMES = set(name for _, name in SET_OPTIONS)
 
 SHOPT_OPTION_NAMES = (
     'nullglob', 'failglob', 'expand_aliases', 'extglob', 'progcomp',
-    'histappend', 'hostcomplete', 'lastpipe')
+    'histappend', 'hostcomplete', 'lastpipe',
+    # OSH-specific
+    'reclaim_arena', 'inline_command_sub', 'parallel_command_sub',
+)
 
 
 class ExecOpts(object):
@@ -180,6 +194,20 @@ class ExecOpts(object):
     self.vi = False
     self.emacs = False
 
+    # OSH-specific shopt options.
+
+    # Discard the lines and spans of each top-level command after it runs.
+    # See core/alloc.py.
+    self.reclaim_arena = False
+
+    # Run command subs that only use certain builtins without forking.  See
+    # Executor.RunCommandSub.
+    self.inline_command_sub = False
+
+    # Start all the command subs in a simple command or assignment at once.
+    # See Executor.RunCommandSub.
+    self.parallel_command_sub = False
+
     #
     # OSH-specific options that are NOT YET IMPLEMENTED.
     #
@@ -340,6 +368,17 @@ class _ArgFrame(object):
     self.num_shifted = 0
 
 
+def _MakeStr(cell):
+  """Replace the StrBuffer or Int in a cell with a Str, and return it."""
+  val = cell.val
+  if val.tag == value_e.StrBuffer:
+    val = value.Str(''.join(val.parts))
+  else:
+    val = value.Str(str(val.i))
+  cell.val = val
+  return val
+
+
 def _DumpVarFrame(frame):
   """Dump the stack frame as reasonably compact and readable JSON."""
 
@@ -356,6 +395,8 @@ def _DumpVarFrame(frame):
       cell_json['flags'] = flags
 
     # For compactness, just put the value right in the cell.
+    if cell.val.tag in _LAZY_STR_TAGS:
+      _MakeStr(cell)
     tag = cell.val.tag
     if tag == value_e.Undef:
       cell_json['type'] = 'Undef'
@@ -365,6 +406,9 @@ def _DumpVarFrame(frame):
     elif tag == value_e.StrArray:
       cell_json['type'] = 'StrArray'
       cell_json['value'] = cell.val.strs
+    elif tag == value_e.SparseArray:
+      cell_json['type'] = 'SparseArray'
+      cell_json['value'] = cell.val.d
 
     vars_json[name] = cell_json
 
@@ -395,6 +439,98 @@ class DirStack(object):
     return reversed(self.stack)
 
 
+class SearchPath(object):
+  """For looking up executables in $PATH.
+
+  Found paths are cached in a table like bash's, which the 'hash' builtin
+  exposes.  Assigning $PATH, even to the same string, invalidates the table.
+  """
+  def __init__(self, mem):
+    self.mem = mem
+    # Every assignment creates a new value, including temporary bindings like
+    # PATH=/bin ls, so we compare by identity.
+    self.path_val = None
+    self.path_dirs = []
+    self.cache = {}  # type: Dict[str, str]  # name -> full path
+    self.hits = {}  # type: Dict[str, int]  # name -> times executed
+
+  def _CheckPath(self):
+    val = self.mem.GetVar('PATH')
+    if val is not self.path_val:
+      self.path_val = val
+      if val.tag == value_e.Str:
+        self.path_dirs = val.s.split(':')
+      else:
+        self.path_dirs = []  # treat as empty path
+      self.ClearCache()
+
+  def Dirs(self):
+    """Return the directories in $PATH."""
+    self._CheckPath()
+    return self.path_dirs
+
+  def Lookup(self, name):
+    """Search $PATH for an executable file, without the cache.
+
+    Returns:
+      The full path, or None if it wasn't found.
+    """
+    for path_dir in self.Dirs():
+      full_path = os_path.join(path_dir, name)
+      if (posix.access(full_path, posix.X_OK) and
+          not path_stat.isdir(full_path)):
+        return full_path
+    return None
+
+  def CachedLookup(self, name, hit=False):
+    """Like Lookup, but use and fill the table.
+
+    Args:
+      hit: Whether we're about to execute it, which is counted.
+    """
+    self._CheckPath()
+    full_path = self.cache.get(name)
+    if full_path is None:
+      full_path = self.Lookup(name)
+      if full_path is None:
+        return None
+      self.cache[name] = full_path
+      self.hits[name] = 0
+    if hit:
+      self.hits[name] += 1
+    return full_path
+
+  def GetCached(self, name):
+    """Returns the full path in the table, or None."""
+    self._CheckPath()
+    return self.cache.get(name)
+
+  def Put(self, name, full_path):
+    """For hash -p."""
+    self._CheckPath()
+    self.cache[name] = full_path
+    self.hits[name] = 0
+
+  def MaybeRemove(self, name):
+    """Returns whether the name was in the table."""
+    self._CheckPath()
+    if name not in self.cache:
+      return False
+    del self.cache[name]
+    del self.hits[name]
+    return True
+
+  def ClearCache(self):
+    self.cache.clear()
+    self.hits.clear()
+
+  def CachedCommands(self):
+    """Returns a sorted list of (name, full path, hits)."""
+    self._CheckPath()
+    return sorted((name, full_path, self.hits[name])
+                  for name, full_path in self.cache.iteritems())
+
+
 def _FormatStack(var_stack):
   """Temporary debugging.
 
@@ -426,6 +562,14 @@ class Mem(object):
     self.argv_stack = [_ArgFrame(argv)]
     self.var_stack = [{}]
 
+    # name -> list of frames in var_stack that bind it, from bottom to top.
+    # Dynamic scope lookup is then O(1) instead of O(depth).
+    self.bindings = {}  # type: Dict[str, List[Dict[str, runtime_asdl.cell]]]
+
+    # Cache for GetExported().  It's set to None whenever an exported cell is
+    # created, changed, unset, or popped off the stack.
+    self.exported = None  # type: Dict[str, str]
+
     # The debug_stack isn't strictly necessary for execution.  We use it for
     # crash dumps and for 3 parallel arrays: FUNCNAME, CALL_SOURCE,
     # BASH_LINENO.  The First frame points at the global vars and argv.
@@ -443,6 +587,22 @@ class Mem(object):
     self.source_name = value.Str('')
     self.line_num = value.Str('')
 
+    # name -> function that returns the value of a special variable.
+    self.computed_vars = {
+        'PIPESTATUS': self._PipeStatus,
+        'FUNCNAME': lambda: self._CachedArray('FUNCNAME', self._FuncName),
+        'BASH_SOURCE':
+            lambda: self._CachedArray('BASH_SOURCE', self._BashSource),
+        'CALL_SOURCE':
+            lambda: self._CachedArray('CALL_SOURCE', self._CallSource),
+        'BASH_LINENO':
+            lambda: self._CachedArray('BASH_LINENO', self._BashLineNo),
+        'LINENO': self._LineNo,
+        'SOURCE_NAME': self._SourceName,
+    }
+    # Arrays computed from the call stack, cleared when it changes.
+    self.frame_cache = {}  # type: Dict[str, value_t]
+
     self.last_status = [0]  # type: List[int]  # a stack
     self.pipe_status = [[]]  # type: List[List[int]]  # stack
     self.last_job_id = -1  # Uninitialized value mutable public variable
@@ -480,8 +640,7 @@ class Mem(object):
 
       d['call_spid'] = call_spid
       if call_spid != const.NO_INTEGER:  # first frame has this issue
-        span = self.arena.GetLineSpan(call_spid)
-        line_id = span.line_id
+        line_id = self.arena.GetSpanLineId(call_spid)
         d['call_source'] = self.arena.GetLineSourceString(line_id)
         d['call_line_num'] = self.arena.GetLineNumber(line_id)
         d['call_line'] = self.arena.GetLine(line_id)
@@ -565,6 +724,14 @@ class Mem(object):
       return
     self.current_spid = span_id
 
+  def RestoreCurrentSpanId(self, span_id):
+    # type: (int) -> None
+    """Like SetCurrentSpanId, but span_id may be NO_INTEGER.
+
+    Used by main_loop.Batch() after the arena discards spans.
+    """
+    self.current_spid = span_id
+
   def CurrentSpanId(self):
     # type: () -> int
     return self.current_spid
@@ -611,15 +778,15 @@ class Mem(object):
     # bash uses this order: top of stack first.
     self._PushDebugStack(func_name, None)
 
-    span = self.arena.GetLineSpan(def_spid)
-    source_str = self.arena.GetLineSourceString(span.line_id)
+    line_id = self.arena.GetSpanLineId(def_spid)
+    source_str = self.arena.GetLineSourceString(line_id)
     self.bash_source.append(source_str)
 
   def PopCall(self):
     self.bash_source.pop()
     self._PopDebugStack()
 
-    self.var_stack.pop()
+    self._PopVarFrame()
     self.argv_stack.pop()
 
   def PushSource(self, source_name, argv):
@@ -645,7 +812,22 @@ class Mem(object):
 
   def PopTemp(self):
     self._PopDebugStack()
-    self.var_stack.pop()
+    self._PopVarFrame()
+
+  def _PopVarFrame(self):
+    frame = self.var_stack.pop()
+    bindings = self.bindings
+    for name in frame:
+      frames = bindings[name]
+      frames.pop()  # it's the top frame, so it's last
+      if not frames:
+        del bindings[name]
+
+    if self.exported is not None:
+      for cell in frame.itervalues():
+        if cell.exported:
+          self.exported = None
+          break
 
   def _PushDebugStack(self, func_name, source_name):
     # self.current_spid is set before every SimpleCommand, Assignment, [[, ((,
@@ -660,9 +842,11 @@ class Mem(object):
     self.debug_stack.append(
         (func_name, source_name, self.current_spid, argv_i, var_i)
     )
+    self.frame_cache.clear()
 
   def _PopDebugStack(self):
     self.debug_stack.pop()
+    self.frame_cache.clear()
 
   #
   # Argv
@@ -738,11 +922,10 @@ class Mem(object):
       namespace: The namespace it should be set to or deleted from.
     """
     if lookup_mode == scope_e.Dynamic:
-      for i in xrange(len(self.var_stack) - 1, -1, -1):
-        namespace = self.var_stack[i]
-        if name in namespace:
-          cell = namespace[name]
-          return cell, namespace
+      frames = self.bindings.get(name)
+      if frames:
+        namespace = frames[-1]  # the innermost binding
+        return namespace[name], namespace
       return None, self.var_stack[0]  # set in global namespace
 
     elif lookup_mode == scope_e.LocalOnly:
@@ -756,6 +939,28 @@ class Mem(object):
     else:
       raise AssertionError(lookup_mode)
 
+  def _Bind(self, namespace, name, cell):
+    """Put a cell in a namespace, and keep self.bindings in sync.
+
+    A new name is only bound in the global or the innermost namespace.
+    """
+    if name not in namespace:
+      frames = self.bindings.get(name)
+      if frames is None:
+        self.bindings[name] = [namespace]
+      elif namespace is self.var_stack[0]:
+        frames.insert(0, namespace)  # e.g. declare -g, shadowed by a local
+      else:
+        assert namespace is self.var_stack[-1], name
+        frames.append(namespace)
+    namespace[name] = cell
+
+  def _RebuildBindings(self):
+    self.bindings.clear()
+    for frame in self.var_stack:
+      for name in frame:
+        self.bindings.setdefault(name, []).append(frame)
+
   def IsAssocArray(self, name, lookup_mode):
     """Returns whether a name resolve to a cell with an associative array.
     
@@ -827,7 +1032,11 @@ class Mem(object):
             # TODO: error context
             e_die("Can't assign to readonly value %r", lval.name)
           cell.val = val
+          if cell.exported:
+            self.exported = None
         if var_flags_e.Exported in new_flags:
+          if not cell.exported:
+            self.exported = None
           cell.exported = True
         if var_flags_e.ReadOnly in new_flags:
           cell.readonly = True
@@ -841,9 +1050,12 @@ class Mem(object):
                                  var_flags_e.Exported in new_flags,
                                  var_flags_e.ReadOnly in new_flags,
                                  var_flags_e.AssocArray in new_flags)
-        namespace[lval.name] = cell
+        self._Bind(namespace, lval.name, cell)
+        if cell.exported:
+          self.exported = None
 
-      if (cell.val is not None and cell.val.tag == value_e.StrArray and
+      if (cell.val is not None and
+          cell.val.tag in (value_e.StrArray, value_e.SparseArray) and
           cell.exported):
         e_die("Can't export array")  # TODO: error context
 
@@ -868,6 +1080,8 @@ class Mem(object):
         self._BindNewArrayWithEntry(namespace, lval, val, new_flags)
         return
 
+      if cell.val.tag in _LAZY_STR_TAGS:
+        _MakeStr(cell)
       cell_tag = cell.val.tag
       if cell_tag == value_e.Str:
         # s=x
@@ -898,10 +1112,33 @@ class Mem(object):
           #
           # TODO: strict-array for Oil arrays won't auto-fill.
           n = lval.index - len(strs) + 1
+          # Bigger than both the minimum and the array's size
+          if n > max(_SPARSE_MIN_GAP, len(strs)):
+            d = dict((i, s) for i, s in enumerate(strs) if s is not None)
+            d[lval.index] = val.s
+            cell.val = value.SparseArray(d, lval.index)
+            return
           strs.extend([None] * n)
           strs[lval.index] = val.s
         return
 
+      if cell_tag == value_e.SparseArray:
+        sparse = cell.val
+        index = lval.index
+        if index < 0:
+          index += sparse.max_index + 1
+          if index < 0:
+            e_die("Index %d is out of range", lval.index, span_id=left_spid)
+        sparse.d[index] = val.s
+        if index > sparse.max_index:
+          sparse.max_index = index
+        if len(sparse.d) * 2 > sparse.max_index + 1:
+          strs = [None] * (sparse.max_index + 1)
+          for i, s in sparse.d.iteritems():
+            strs[i] = s
+          cell.val = value.StrArray(strs)
+        return
+
       if cell_tag == value_e.AssocArray:
         cell.val.d[lval.index] = val.s
         return
@@ -911,13 +1148,17 @@ class Mem(object):
 
   def _BindNewArrayWithEntry(self, namespace, lval, val, new_flags):
     """Fill 'namespace' with a new indexed array entry."""
-    items = [None] * lval.index
-    items.append(val.s)
-    new_value = value.StrArray(items)
+    if lval.index > _SPARSE_MIN_GAP:
+      new_value = value.SparseArray({lval.index: val.s}, lval.index)
+    else:
+      items = [None] * lval.index
+      items.append(val.s)
+      new_value = value.StrArray(items)
 
     # arrays can't be exported; can't have AssocArray flag
     readonly = var_flags_e.ReadOnly in new_flags
-    namespace[lval.name] = runtime_asdl.cell(new_value, False, readonly, False)
+    self._Bind(namespace, lval.name,
+               runtime_asdl.cell(new_value, False, readonly, False))
 
   def _BindNewAssocArrayWithEntry(self, namespace, lval, val, new_flags):
     """Fill 'namespace' with a new indexed array entry."""
@@ -926,7 +1167,8 @@ class Mem(object):
 
     # associative arrays can't be exported; don't need AssocArray flag
     readonly = var_flags_e.ReadOnly in new_flags
-    namespace[lval.name] = runtime_asdl.cell(new_value, False, readonly, False)
+    self._Bind(namespace, lval.name,
+               runtime_asdl.cell(new_value, False, readonly, False))
 
   def InternalSetGlobal(self, name, new_val):
     """For setting read-only globals internally.
@@ -941,95 +1183,145 @@ class Mem(object):
     """
     cell = self.var_stack[0][name]
     cell.val = new_val
+    if cell.exported:
+      self.exported = None
 
   def GetVar(self, name, lookup_mode=scope_e.Dynamic):
     assert isinstance(name, str), name
 
-    # TODO: Short-circuit down to _FindCellAndNamespace by doing a single hash
-    # lookup:
-    # COMPUTED_VARS = {'PIPESTATUS': 1, 'FUNCNAME': 1, ...}
-    # if name not in COMPUTED_VARS: ...
-
-    if name == 'PIPESTATUS':
-      return value.StrArray([str(i) for i in self.pipe_status[-1]])
-
-    # Do lookup of system globals before looking at user variables.  Note: we
-    # could optimize this at compile-time like $?.  That would break
-    # ${!varref}, but it's already broken for $?.
-    if name == 'FUNCNAME':
-      # bash wants it in reverse order.  This is a little inefficient but we're
-      # not depending on deque().
-      strs = []
-      for func_name, source_name, _, _, _ in reversed(self.debug_stack):
-        if func_name:
-          strs.append(func_name)
-        if source_name:
-          strs.append('source')  # bash doesn't give name
-        # Temp stacks are ignored
-
-      if self.has_main:
-        strs.append('main')  # bash does this
-      return value.StrArray(strs)  # TODO: Reuse this object too?
+    # One hash lookup for all the special variables.  Do it before looking at
+    # user variables.  Note: we could optimize this at compile-time like $?.
+    # That would break ${!varref}, but it's already broken for $?.
+    handler = self.computed_vars.get(name)
+    if handler:
+      return handler()
 
-    # This isn't the call source, it's the source of the function DEFINITION
-    # (or the sourced # file itself).
-    if name == 'BASH_SOURCE':
-      return value.StrArray(list(reversed(self.bash_source)))
+    cell, _ = self._FindCellAndNamespace(name, lookup_mode, writing=False)
 
-    # This is how bash source SHOULD be defined, but it's not!
-    if name == 'CALL_SOURCE':
-      strs = []
-      for func_name, source_name, call_spid, _, _ in reversed(self.debug_stack):
-        # should only happen for the first entry
-        if call_spid == const.NO_INTEGER:
-          continue
-        span = self.arena.GetLineSpan(call_spid)
-        source_str = self.arena.GetLineSourceString(span.line_id)
-        strs.append(source_str)
-      if self.has_main:
-        strs.append('-')  # Bash does this to line up with main?
-      return value.StrArray(strs)  # TODO: Reuse this object too?
-
-    if name == 'BASH_LINENO':
-      strs = []
-      for _, _, call_spid, _, _ in reversed(self.debug_stack):
-        # should only happen for the first entry
-        if call_spid == const.NO_INTEGER:
-          continue
-        span = self.arena.GetLineSpan(call_spid)
-        line_num = self.arena.GetLineNumber(span.line_id)
-        strs.append(str(line_num))
-      if self.has_main:
-        strs.append('0')  # Bash does this to line up with main?
-      return value.StrArray(strs)  # TODO: Reuse this object too?
-
-    if name == 'LINENO':
-      span = self.arena.GetLineSpan(self.current_spid)
-      # TODO: maybe use interned GetLineNumStr?
-      s = str(self.arena.GetLineNumber(span.line_id))
-
-      # Perf bug: why is this slow?  Commenting it out reduces line count by
-      if 1:
-        self.line_num.s = s  # Python's configure takes 75 seconds!
-      else:
-        # WTF this does not show the per bug?
-        self.line_num.s2 = s  # Python's configure takes 13 seconds!
-      return self.line_num
+    if cell:
+      val = cell.val
+      if val.tag in _LAZY_STR_TAGS:
+        val = _MakeStr(cell)
+      return val
 
-    # This is OSH-specific.  Get rid of it in favor of ${BASH_SOURCE[0]} ?
-    if name == 'SOURCE_NAME':
-      # Update and reuse an object.
-      span = self.arena.GetLineSpan(self.current_spid)
-      self.source_name.s = self.arena.GetLineSourceString(span.line_id)
-      return self.source_name
+    return value.Undef()
 
-    cell, _ = self._FindCellAndNamespace(name, lookup_mode, writing=False)
+  def GetArithVar(self, name):
+    """Like GetVar(), but a value.Int is returned as is, for arithmetic."""
+    handler = self.computed_vars.get(name)
+    if handler:
+      return handler()
+
+    cell, _ = self._FindCellAndNamespace(name, scope_e.Dynamic, writing=False)
 
     if cell:
-      return cell.val
+      val = cell.val
+      if val.tag == value_e.StrBuffer:
+        val = _MakeStr(cell)
+      return val
 
     return value.Undef()
 
+  def AppendString(self, name, s):
+    """Append to a string variable in place, for s+=x.
+
+    The parts are joined when the variable is read, so building a string in a
+    loop takes linear time.  Exported and readonly variables aren't handled.
+
+    Returns:
+      Whether it appended.  If not, the caller should assign the concatenated
+      value with SetVar().
+    """
+    if name in self.computed_vars:
+      return False
+    cell, _ = self._FindCellAndNamespace(name, scope_e.Dynamic)
+    if not cell or cell.exported or cell.readonly:
+      return False
+
+    val = cell.val
+    if val.tag == value_e.StrBuffer:
+      val.parts.append(s)
+    elif val.tag == value_e.Str:
+      cell.val = value.StrBuffer([val.s, s])
+    else:
+      return False
+    return True
+
+  #
+  # Computed variables, dispatched from GetVar()
+  #
+
+  def _PipeStatus(self):
+    return value.StrArray([str(i) for i in self.pipe_status[-1]])
+
+  def _FuncName(self):
+    # bash wants it in reverse order.  This is a little inefficient but we're
+    # not depending on deque().
+    strs = []
+    for func_name, source_name, _, _, _ in reversed(self.debug_stack):
+      if func_name:
+        strs.append(func_name)
+      if source_name:
+        strs.append('source')  # bash doesn't give name
+      # Temp stacks are ignored
+
+    if self.has_main:
+      strs.append('main')  # bash does this
+    return value.StrArray(strs)
+
+  def _BashSource(self):
+    # This isn't the call source, it's the source of the function DEFINITION
+    # (or the sourced # file itself).
+    return value.StrArray(list(reversed(self.bash_source)))
+
+  def _CallSource(self):
+    # This is how bash source SHOULD be defined, but it's not!
+    strs = []
+    for func_name, source_name, call_spid, _, _ in reversed(self.debug_stack):
+      # should only happen for the first entry
+      if call_spid == const.NO_INTEGER:
+        continue
+      line_id = self.arena.GetSpanLineId(call_spid)
+      source_str = self.arena.GetLineSourceString(line_id)
+      strs.append(source_str)
+    if self.has_main:
+      strs.append('-')  # Bash does this to line up with main?
+    return value.StrArray(strs)
+
+  def _BashLineNo(self):
+    strs = []
+    for _, _, call_spid, _, _ in reversed(self.debug_stack):
+      # should only happen for the first entry
+      if call_spid == const.NO_INTEGER:
+        continue
+      line_id = self.arena.GetSpanLineId(call_spid)
+      strs.append(self.arena.GetLineNumStr(line_id))
+    if self.has_main:
+      strs.append('0')  # Bash does this to line up with main?
+    return value.StrArray(strs)
+
+  def _CachedArray(self, name, compute):
+    """The call stack arrays only change when a frame is pushed or popped."""
+    val = self.frame_cache.get(name)
+    if val is None:
+      val = compute()
+      self.frame_cache[name] = val
+    return val
+
+  def _LineNo(self):
+    # Update and reuse an object.  The strings are interned, since a loop that
+    # uses $LINENO would otherwise allocate one per iteration.
+    line_id = self.arena.GetSpanLineId(self.current_spid)
+    self.line_num.s = self.arena.GetLineNumStr(line_id)
+    return self.line_num
+
+  def _SourceName(self):
+    # This is OSH-specific.  Get rid of it in favor of ${BASH_SOURCE[0]} ?
+    # Update and reuse an object.
+    line_id = self.arena.GetSpanLineId(self.current_spid)
+    self.source_name.s = self.arena.GetLineSourceString(line_id)
+    return self.source_name
+
   def Unset(self, lval, lookup_mode):
     """
     Returns:
@@ -1045,6 +1337,8 @@ class Mem(object):
         if cell.readonly:
           return False, found
         namespace[lval.name].val = value.Undef()
+        if cell.exported:
+          self.exported = None
         return True, found # found
       else:
         return True, False
@@ -1059,6 +1353,8 @@ class Mem(object):
     cell, namespace = self._FindCellAndNamespace(name, lookup_mode)
     if cell:
       if flag == var_flags_e.Exported:
+        if cell.exported:
+          self.exported = None
         cell.exported = False
       else:
         raise AssertionError
@@ -1067,23 +1363,60 @@ class Mem(object):
       return False
 
   def GetExported(self):
-    """Get all the variables that are marked exported."""
-    # TODO: This is run on every SimpleCommand.  Should we have a dirty flag?
-    # We have to notice these things:
-    # - If an exported variable is changed.
-    # - If the set of exported variables changes.
+    """Get all the variables that are marked exported.
+
+    This is run on every external SimpleCommand, so the dict is cached until an
+    exported variable changes.  Callers must not modify it.
+    """
+    if self.exported is not None:
+      return self.exported
 
     exported = {}
     # Search from globals up.  Names higher on the stack will overwrite names
     # lower on the stack.
     for scope in self.var_stack:
       for name, cell in scope.iteritems():
+        if cell.exported and cell.val.tag in _LAZY_STR_TAGS:
+          _MakeStr(cell)
         # TODO: Disallow exporting at assignment time.  If an exported Str is
         # changed to StrArray, also clear its 'exported' flag.
         if cell.exported and cell.val.tag == value_e.Str:
           exported[name] = cell.val.s
+    self.exported = exported
     return exported
 
+  def Snapshot(self):
+    """Save variables and statuses, for a command sub run in-process.
+
+    Values that can be mutated in place are copied, but strings are shared.
+    """
+    var_stack = []
+    for frame in self.var_stack:
+      copied = {}
+      for name, cell in frame.iteritems():
+        val = cell.val
+        if val.tag == value_e.StrBuffer:
+          val = _MakeStr(cell)
+        elif val.tag == value_e.StrArray:
+          val = value.StrArray(list(val.strs))
+        elif val.tag == value_e.SparseArray:
+          val = value.SparseArray(dict(val.d), val.max_index)
+        elif val.tag == value_e.AssocArray:
+          val = value.AssocArray(dict(val.d))
+        copied[name] = runtime_asdl.cell(val, cell.exported, cell.readonly,
+                                         cell.is_assoc_array)
+      var_stack.append(copied)
+
+    return (var_stack, self.exported, self.last_status[-1],
+            self.pipe_status[-1], self.current_spid)
+
+  def Restore(self, snapshot):
+    """Undo changes made since Snapshot() was called."""
+    (var_stack, self.exported, self.last_status[-1], self.pipe_status[-1],
+     self.current_spid) = snapshot
+    self.var_stack[:] = var_stack
+    self._RebuildBindings()
+
   def VarNames(self):
     """For internal OSH completion and compgen -A variable.
 
@@ -1099,11 +1432,34 @@ class Mem(object):
     result = {}
     for scope in self.var_stack:
       for name, cell in scope.iteritems():
+        if cell.val.tag in _LAZY_STR_TAGS:
+          _MakeStr(cell)
         if isinstance(cell.val, value__Str):
           result[name] = cell.val.s
     return result
 
 
+def SparseLookup(val, index):
+  """Return the entry of a SparseArray at 'index', or None if it's unset.
+
+  Negative indices count back from the end, like they do for StrArray.
+  """
+  if index < 0:
+    index += val.max_index + 1
+  return val.d.get(index)
+
+
+def SparseIndices(val):
+  """Return the indices of a SparseArray in increasing order."""
+  return sorted(val.d)
+
+
+def SparseValues(val):
+  """Return the entries of a SparseArray in index order."""
+  d = val.d
+  return [d[i] for i in sorted(d)]
+
+
 def SetLocalString(mem, name, s):
   """Set a local string.
 
@@ -16,7 +16,7 @@ from osh import state  # module under test
 def _InitMem():
   # empty environment, no arena.
   arena = test_lib.MakeArena('<state_test.py>')
-  line_id = arena.AddLine(1, 'foo')
+  line_id = arena.AddLine('foo', 1)
   unused = arena.AddLineSpan(line_id, 0, 1)  # dummy
   return state.Mem('', [], {}, arena)
 
@@ -209,6 +209,107 @@ class MemTest(unittest.TestCase):
     else:
       self.fail("Expected failure")
 
+  def testSparseArray(self):
+    mem = _InitMem()
+
+    def SetIndex(index, s):
+      lhs = lvalue.LhsIndexedName('a', index)
+      lhs.spids.append(0)
+      mem.SetVar(lhs, value.Str(s), (), scope_e.Dynamic)
+
+    # a[10000000]=x doesn't allocate a big list
+    SetIndex(10000000, 'x')
+    val = mem.GetVar('a')
+    self.assertEqual(value_e.SparseArray, val.tag)
+    self.assertEqual({10000000: 'x'}, val.d)
+
+    SetIndex(3, 'y')
+    SetIndex(-1, 'z')
+    self.assertEqual([3, 10000000], state.SparseIndices(val))
+    self.assertEqual(['y', 'z'], state.SparseValues(val))
+    self.assertEqual('z', state.SparseLookup(val, -1))
+    self.assertEqual(None, state.SparseLookup(val, 4))
+
+    # A big gap past the end of a dense array makes it sparse
+    mem.SetVar(lvalue.LhsName('a'), value.StrArray(['0', '1']), (),
+               scope_e.Dynamic)
+    SetIndex(2000, 'w')
+    val = mem.GetVar('a')
+    self.assertEqual(value_e.SparseArray, val.tag)
+    self.assertEqual({0: '0', 1: '1', 2000: 'w'}, val.d)
+
+    # It becomes dense again once it's more than half full
+    for i in xrange(2, 999):
+      SetIndex(i, str(i))
+    self.assertEqual(value_e.SparseArray, mem.GetVar('a').tag)
+    SetIndex(999, '999')
+    val = mem.GetVar('a')
+    self.assertEqual(value_e.StrArray, val.tag)
+    self.assertEqual(2001, len(val.strs))
+    self.assertEqual(['999', None], val.strs[999:1001])
+    self.assertEqual('w', val.strs[2000])
+
+    # The gap must be bigger than both 1024 and the array's size.  This one is
+    # bigger than 1024, but not bigger than the 2001 entries.
+    SetIndex(4000, 'v')
+    val = mem.GetVar('a')
+    self.assertEqual(value_e.StrArray, val.tag)
+    self.assertEqual(4001, len(val.strs))
+
+  def testAppendString(self):
+    mem = _InitMem()
+    mem.SetVar(lvalue.LhsName('s'), value.Str('a'), (), scope_e.Dynamic)
+
+    # s+=b; s+=c
+    self.assertEqual(True, mem.AppendString('s', 'b'))
+    self.assertEqual(True, mem.AppendString('s', 'c'))
+    self.assertEqual(['a', 'b', 'c'], mem.var_stack[0]['s'].val.parts)
+
+    # Reading it joins the parts
+    val = mem.GetVar('s')
+    self.assertEqual(value_e.Str, val.tag)
+    self.assertEqual('abc', val.s)
+    self.assertEqual(True, mem.var_stack[0]['s'].val is val)
+
+    # The value that was read isn't changed
+    self.assertEqual(True, mem.AppendString('s', 'd'))
+    self.assertEqual('abc', val.s)
+    self.assertEqual(None, mem.GetExported().get('s'))
+    mem.SetVar(lvalue.LhsName('s'), None, (var_flags_e.Exported,),
+               scope_e.Dynamic)
+    self.assertEqual('abcd', mem.GetExported()['s'])
+
+    # The caller has to assign these
+    self.assertEqual(False, mem.AppendString('s', 'e'))  # exported
+    self.assertEqual(False, mem.AppendString('undef', 'x'))
+    self.assertEqual(False, mem.AppendString('LINENO', 'x'))
+
+  def testIntValue(self):
+    mem = _InitMem()
+
+    # (( i = 42 ))
+    mem.SetVar(lvalue.LhsName('i'), value.Int(42), (), scope_e.Dynamic)
+    val = mem.GetArithVar('i')
+    self.assertEqual(value_e.Int, val.tag)
+    self.assertEqual(42, val.i)
+
+    # Reading it as a string makes a Str, once
+    val = mem.GetVar('i')
+    self.assertEqual(value_e.Str, val.tag)
+    self.assertEqual('42', val.s)
+    self.assertEqual(True, mem.GetVar('i') is val)
+    self.assertEqual(True, mem.GetArithVar('i') is val)
+
+    # Exported integers are strings in the environment
+    mem.SetVar(lvalue.LhsName('j'), value.Int(-1), (var_flags_e.Exported,),
+               scope_e.Dynamic)
+    self.assertEqual('-1', mem.GetExported()['j'])
+
+    # Special variables are still computed
+    mem.SetCurrentSpanId(0)
+    mem.SetVar(lvalue.LhsName('LINENO'), value.Int(5), (), scope_e.Dynamic)
+    self.assertEqual('1', mem.GetArithVar('LINENO').s)
+
   def testGetVar(self):
     mem = _InitMem()
 
@@ -223,6 +324,51 @@ class MemTest(unittest.TestCase):
     val = mem.GetVar('undef', scope_e.Dynamic)
     test_lib.AssertAsdlEqual(self, value.Undef(), val)
 
+  def testComputedVars(self):
+    mem = _InitMem()
+    mem.SetCurrentSpanId(0)
+
+    mem.PushCall('my-func', 0, ['a'])
+    val = mem.GetVar('FUNCNAME')
+    self.assertEqual(['my-func'], val.strs)
+    self.assertEqual(['1'], mem.GetVar('BASH_LINENO').strs)
+    self.assertEqual(True, val is mem.GetVar('FUNCNAME'))  # cached
+
+    mem.PushCall('inner', 0, ['b'])
+    self.assertEqual(['inner', 'my-func'], mem.GetVar('FUNCNAME').strs)
+    mem.PopCall()
+    self.assertEqual(['my-func'], mem.GetVar('FUNCNAME').strs)
+    mem.PopCall()
+
+    self.assertEqual('1', mem.GetVar('LINENO').s)
+    # Line number strings are interned
+    self.assertEqual(True, mem.GetVar('LINENO').s is
+                     mem.arena.GetLineNumStr(0))
+
+  def testBindings(self):
+    mem = _InitMem()
+    x = lvalue.LhsName('x')
+    mem.SetVar(x, value.Str('global'), (), scope_e.Dynamic)
+
+    mem.PushCall('f', 0, [])
+    mem.SetVar(x, value.Str('local'), (), scope_e.LocalOnly)
+    mem.PushTemp()
+    mem.SetVar(x, value.Str('temp'), (), scope_e.LocalOnly)
+    self.assertEqual('temp', mem.GetVar('x').s)
+    mem.PopTemp()
+    self.assertEqual('local', mem.GetVar('x').s)
+
+    # A new global that's shadowed by a local
+    y = lvalue.LhsName('y')
+    mem.SetVar(y, value.Str('local'), (), scope_e.LocalOnly)
+    mem.SetVar(y, value.Str('global'), (), scope_e.GlobalOnly)
+    self.assertEqual('local', mem.GetVar('y').s)
+    mem.PopCall()
+
+    self.assertEqual('global', mem.GetVar('x').s)
+    self.assertEqual('global', mem.GetVar('y').s)
+    self.assertEqual([mem.var_stack[0]], mem.bindings['x'])
+
   def testExportThenAssign(self):
     """Regression Test"""
     mem = _InitMem()
@@ -239,6 +385,45 @@ class MemTest(unittest.TestCase):
     e = mem.GetExported()
     self.assertEqual('u', e['U'])
 
+  def testGetExportedIsCached(self):
+    mem = _InitMem()
+    mem.SetVar(
+        lvalue.LhsName('E'), value.Str('1'), (var_flags_e.Exported,),
+        scope_e.Dynamic)
+    e = mem.GetExported()
+    self.assertEqual('1', e['E'])
+
+    # Unexported variables don't invalidate it
+    mem.SetVar(lvalue.LhsName('x'), value.Str('x'), (), scope_e.Dynamic)
+    mem.PushTemp()
+    mem.SetVar(lvalue.LhsName('y'), value.Str('y'), (), scope_e.LocalOnly)
+    mem.PopTemp()
+    self.assertTrue(e is mem.GetExported())
+
+    # E=2
+    mem.SetVar(lvalue.LhsName('E'), value.Str('2'), (), scope_e.Dynamic)
+    self.assertEqual('2', mem.GetExported()['E'])
+
+    # E=temp cmd
+    mem.PushTemp()
+    mem.SetVar(
+        lvalue.LhsName('E'), value.Str('temp'), (var_flags_e.Exported,),
+        scope_e.LocalOnly)
+    self.assertEqual('temp', mem.GetExported()['E'])
+    mem.PopTemp()
+    self.assertEqual('2', mem.GetExported()['E'])
+
+    # export -n E
+    mem.ClearFlag('E', var_flags_e.Exported, scope_e.Dynamic)
+    self.assertEqual(None, mem.GetExported().get('E'))
+
+    # export E; unset E
+    mem.SetVar(lvalue.LhsName('E'), None, (var_flags_e.Exported,),
+               scope_e.Dynamic)
+    self.assertEqual('2', mem.GetExported()['E'])
+    mem.Unset(lvalue.LhsName('E'), scope_e.Dynamic)
+    self.assertEqual(None, mem.GetExported().get('E'))
+
   def testUnset(self):
     mem = _InitMem()
     # unset a
@@ -282,5 +467,36 @@ class MemTest(unittest.TestCase):
     self.assertEqual(['i', 'j', 'k'], mem.GetArgv())
 
 
+class SearchPathTest(unittest.TestCase):
+
+  def testCache(self):
+    mem = _InitMem()
+    mem.SetVar(lvalue.LhsName('PATH'), value.Str('/nonexistent:/bin'), (),
+               scope_e.GlobalOnly)
+    search_path = state.SearchPath(mem)
+
+    self.assertEqual('/bin/sh', search_path.Lookup('sh'))
+    self.assertEqual(None, search_path.Lookup('_nonexistent_'))
+    self.assertEqual(None, search_path.CachedLookup('_nonexistent_'))
+
+    self.assertEqual('/bin/sh', search_path.CachedLookup('sh', hit=True))
+    self.assertEqual('/bin/sh', search_path.CachedLookup('sh', hit=True))
+    search_path.Put('foo', '/x/foo')
+    self.assertEqual([('foo', '/x/foo', 0), ('sh', '/bin/sh', 2)],
+                     search_path.CachedCommands())
+
+    self.assertEqual(True, search_path.MaybeRemove('foo'))
+    self.assertEqual(False, search_path.MaybeRemove('foo'))
+
+    # Assigning PATH, even to the same value, clears the table
+    mem.SetVar(lvalue.LhsName('PATH'), value.Str('/nonexistent:/bin'), (),
+               scope_e.GlobalOnly)
+    self.assertEqual([], search_path.CachedCommands())
+
+    mem.Unset(lvalue.LhsName('PATH'), scope_e.Dynamic)
+    self.assertEqual([], search_path.Dirs())
+    self.assertEqual(None, search_path.CachedLookup('sh'))
+
+
 if __name__ == '__main__':
   unittest.main()
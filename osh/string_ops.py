@@ -210,121 +210,147 @@ def DoUnarySuffixOp(s, op, arg):
     else:  # e.g. ^ ^^ , ,,
       raise AssertionError(op.op_id)
 
-  # For patterns, do fnmatch() in a loop.
-  #
+  if op.op_id not in (Id.VOp1_Pound, Id.VOp1_DPound, Id.VOp1_Percent,
+                      Id.VOp1_DPercent):
+    raise NotImplementedError("Can't use %s with pattern" % op.op_id)
+
+  # For patterns, translate the glob to an ERE once, and let libc find the
+  # boundary of the shortest or longest match in a single call.
+  ere = _GlobToEreCached(arg)
+  if ere is None:  # fnmatch() has the exact semantics for malformed globs
+    return _DoUnarySuffixOpSlow(s, op.op_id, arg)
+
+  is_suffix = op.op_id in (Id.VOp1_Percent, Id.VOp1_DPercent)
+  longest = op.op_id in (Id.VOp1_DPound, Id.VOp1_DPercent)
+  try:
+    boundary = libc.regex_affix(ere, s, is_suffix, longest)
+  except RuntimeError:  # regcomp() failed
+    return _DoUnarySuffixOpSlow(s, op.op_id, arg)
+
+  if boundary == -1:
+    return s
+  if is_suffix:
+    return s[:boundary]
+  else:
+    return s[boundary:]
+
+
+_ERE_CACHE = {}
+_ERE_CACHE_SIZE = 256
+
+
+def _GlobToEreCached(pat):
+  """Translate a glob to an ERE, or return None if it can't be translated.
+
+  Loops use the same few patterns, so memoize the translation.
+  """
+  try:
+    return _ERE_CACHE[pat]
+  except KeyError:
+    pass
+
+  # GlobToERE() asserts on some valid patterns, like ^ outside brackets, a
+  # trailing backslash, and some escapes.  fnmatch() handles all of them.
+  try:
+    ere, warnings = glob_.GlobToERE(pat)
+  except AssertionError:
+    ere, warnings = None, None
+  if warnings:
+    ere = None
+  if len(_ERE_CACHE) >= _ERE_CACHE_SIZE:
+    _ERE_CACHE.clear()
+  _ERE_CACHE[pat] = ere
+  return ere
+
+
+def _DoUnarySuffixOpSlow(s, op_id, arg):
+  """Fallback that does fnmatch() in a loop."""
   # TODO: The loop needs to iterate over code points, not bytes!
   # - The forward case can probably be handled in a similar manner.
   # - The backward case might be handled by pre-calculating an array of start
   #   positions with _NextUtf8Char.
-  #
-  # TODO: Another potential fast path:
-  #
-  # v=aabbccdd
-  # echo ${v#*b}  # strip shortest prefix
-  #
-  # If the whole thing doesn't match '*b*', then no test can succeed.  So we
-  # can fail early.  Conversely echo ${v%%c*} and '*c*'.
-  #
-  # (Although honestly this whole construct is nuts and should be deprecated.)
 
   n = len(s)
-  if op.op_id == Id.VOp1_Pound:  # shortest prefix
+  if op_id == Id.VOp1_Pound:  # shortest prefix
     # 'abcd': match 'a', 'ab', 'abc', ...
     for i in xrange(1, n+1):
-      #log('Matching pattern %r with %r', arg, s[:i])
       if libc.fnmatch(arg, s[:i]):
         return s[i:]
     else:
       return s
 
-  elif op.op_id == Id.VOp1_DPound:  # longest prefix
+  elif op_id == Id.VOp1_DPound:  # longest prefix
     # 'abcd': match 'abc', 'ab', 'a'
     for i in xrange(n, 0, -1):
-      #log('Matching pattern %r with %r', arg, s[:i])
       if libc.fnmatch(arg, s[:i]):
         return s[i:]
     else:
       return s
 
-  elif op.op_id == Id.VOp1_Percent:  # shortest suffix
+  elif op_id == Id.VOp1_Percent:  # shortest suffix
     # 'abcd': match 'abc', 'ab', 'a'
     for i in xrange(n-1, -1, -1):
-      #log('Matching pattern %r with %r', arg, s[:i])
       if libc.fnmatch(arg, s[i:]):
         return s[:i]
     else:
       return s
 
-  elif op.op_id == Id.VOp1_DPercent:  # longest suffix
+  elif op_id == Id.VOp1_DPercent:  # longest suffix
     # 'abcd': match 'abc', 'bc', 'c', ...
     for i in xrange(0, n):
-      #log('Matching pattern %r with %r', arg, s[:i])
       if libc.fnmatch(arg, s[i:]):
         return s[:i]
     else:
       return s
 
   else:
-    raise NotImplementedError("Can't use %s with pattern" % op.op_id)
-
-
-def _AllMatchPositions(s, regex):
-  """Returns a list of all (start, end) match positions of the regex against s.
-
-  (If there are no matches, it returns the empty list.)
-  """
-  matches = []
-  pos = 0
-  n = len(s)
-  while pos < n:  # needed to prevent infinite loop in (.*) case
-    m = libc.regex_first_group_match(regex, s, pos)
-    if m is None:
-      break
-    matches.append(m)
-    start, end = m
-    pos = end  # advance position
-  return matches
-
-
-def _PatSubAll(s, regex, replace_str):
-  parts = []
-  prev_end = 0
-  for start, end in _AllMatchPositions(s, regex):
-    parts.append(s[prev_end:start])
-    parts.append(replace_str)
-    prev_end = end
-  parts.append(s[prev_end:])
-  return ''.join(parts)
+    raise AssertionError(op_id)
 
 
 class GlobReplacer(object):
 
-  def __init__(self, regex, replace_str, slash_spid):
-    # TODO: It would be nice to cache the compilation of the regex here,
-    # instead of just the string.  That would require more sophisticated use of
-    # the Python/C API in libc.c, which we might want to avoid.
+  def __init__(self, regex, replace_str, slash_spid, literal=None):
+    """
+    Args:
+      regex: the glob translated to an ERE
+      literal: the unescaped pattern if it isn't a glob, for a fast path
+    """
+    # The compiled regexes come from the cache in libc, so loops don't
+    # recompile them.
     self.regex = regex
     self.replace_str = replace_str
     self.slash_spid = slash_spid
+    self.literal = literal
 
   def __repr__(self):
     return '<_GlobReplacer regex %r r %r>' % (self.regex, self.replace_str)
 
   def Replace(self, s, op):
-    regex = '(%s)' % self.regex  # make it a group
+    # Fast path for constant strings.  An empty pattern never matches, like
+    # bash.
+    if self.literal is not None and op.replace_mode == Id.Lit_Slash:
+      if len(self.literal):
+        return s.replace(self.literal, self.replace_str)
+      else:
+        return s
 
-    if op.replace_mode == Id.Lit_Slash:
-      try:
-        return _PatSubAll(s, regex, self.replace_str)  # loop over matches
-      except RuntimeError as e:
-        e_die('Error matching regex %r: %s', regex, e, span_id=self.slash_spid)
+    regex = '(%s)' % self.regex  # make it a group
 
     if op.replace_mode == Id.Lit_Pound:
       regex = '^' + regex
     elif op.replace_mode == Id.Lit_Percent:
       regex = regex + '$'
 
-    m = libc.regex_first_group_match(regex, s, 0)
+    try:
+      compiled = libc.regex_compile(regex)
+    except RuntimeError as e:
+      e_die('Error matching regex %r: %s', regex, e, span_id=self.slash_spid)
+
+    if op.replace_mode == Id.Lit_Slash:
+      # Replace all matches in one call
+      return compiled.replace_all(s, self.replace_str)
+
+    m = compiled.first_group_match(s, 0)
     #log('regex = %r, s = %r, match = %r', regex, s, m)
     if m is None:
       return s
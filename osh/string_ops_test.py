@@ -6,6 +6,8 @@ from __future__ import print_function
 
 import unittest
 
+from _devbuild.gen.id_kind_asdl import Id
+from _devbuild.gen.syntax_asdl import suffix_op
 from osh import string_ops  # module under test
 
 
@@ -55,28 +57,65 @@ class LibStrTest(unittest.TestCase):
       print('%d test %06r return %06r' % (i, s[i:], s[:i]))
     print()
 
-  def testPatSubAllMatches(self):
+  def testUnarySuffixOpGlob(self):
+    OPS = [Id.VOp1_Pound, Id.VOp1_DPound, Id.VOp1_Percent, Id.VOp1_DPercent]
+    CASES = [
+        ('aabbccdd', '*b'),
+        ('aabbccdd', 'c*'),
+        ('aabbccdd', '*'),
+        ('aabbccdd', '?'),
+        ('aabbccdd', '*z*'),
+        ('aabbccdd', 'a[ab]'),
+        ('aabbccdd', '[!a]*'),
+        ('aabbccdd', '*[[:alpha:]]'),
+        ('a.b.c', '*.'),
+        ('a.b.c', '.*'),
+        ('foo/bar/baz', '*/'),
+        ('', '*'),
+        ('x', '?'),
+        ('ab[c', 'ab['),  # malformed bracket is a literal
+        # GlobToERE() can't translate these, so they use fnmatch()
+        ('a^b^c', '*^'),
+        ('a^b^c', '^*'),
+        ('ab\\', '*\\'),  # trailing backslash
+        ('a.b.c', '*\\.'),
+    ]
+    for s, pat in CASES:
+      for op_id in OPS:
+        op = suffix_op.StringUnary(op_id, None)
+        expected = string_ops._DoUnarySuffixOpSlow(s, op_id, pat)
+        actual = string_ops.DoUnarySuffixOp(s, op, pat)
+        self.assertEqual(expected, actual, '%r %r %s' % (s, pat, op_id))
+
+    op = suffix_op.StringUnary(Id.VOp1_Pound, None)
+    self.assertEqual('bccdd', string_ops.DoUnarySuffixOp('aabbccdd', op, '*b'))
+    op = suffix_op.StringUnary(Id.VOp1_DPercent, None)
+    self.assertEqual('aabb', string_ops.DoUnarySuffixOp('aabbccdd', op, 'c*'))
+
+    op = suffix_op.StringUnary(Id.VOp1_Pound, None)
+    self.assertEqual('b', string_ops.DoUnarySuffixOp('a^b', op, '*^'))
+    op = suffix_op.StringUnary(Id.VOp1_Percent, None)
+    self.assertEqual('a', string_ops.DoUnarySuffixOp('a^b', op, '^*'))
+
+  def testGlobReplacer(self):
     s = 'oXooXoooX'
+    op = suffix_op.PatSub(None, None, Id.Lit_Slash)
+
+    r = string_ops.GlobReplacer('X.', '_', -1)
+    self.assertEqual('o_o_ooX', r.Replace(s, op))
+
+    r = string_ops.GlobReplacer('z', '_', -1)  # no match
+    self.assertEqual(s, r.Replace(s, op))
+
+    r = string_ops.GlobReplacer('X', '_', -1, literal='X')
+    self.assertEqual('o_oo_ooo_', r.Replace(s, op))
+
+    r = string_ops.GlobReplacer('', '_', -1, literal='')
+    self.assertEqual(s, r.Replace(s, op))
 
-    # Match positions
-    self.assertEqual(
-        [(1, 3), (4, 6)],
-        string_ops._AllMatchPositions(s, '(X.)'))
-
-    # No match
-    self.assertEqual(
-        [],
-        string_ops._AllMatchPositions(s, '(z)'))
-
-    # Replacement
-    self.assertEqual(
-        'o_o_ooX',
-        string_ops._PatSubAll(s, '(X.)', '_'))
-
-    # Replacement with no match
-    self.assertEqual(
-        s,
-        string_ops._PatSubAll(s, '(z)', '_'))
+    op = suffix_op.PatSub(None, None, Id.Undefined_Tok)  # first match
+    r = string_ops.GlobReplacer('X', '_', -1, literal='X')
+    self.assertEqual('o_ooXoooX', r.Replace(s, op))
 
   def testShellQuote(self):
     CASES = [
@@ -25,6 +25,7 @@ from core.meta import LookupKind
 
 from typing import Tuple, Optional, List, TYPE_CHECKING
 if TYPE_CHECKING:
+  from _devbuild.gen.syntax_asdl import arith_expr_t
   from core.util import _ErrorWithLocation
 
 p_die = util.p_die
@@ -400,6 +401,25 @@ def LooksLikeArithVar(w):
   return part0.token
 
 
+def ArithSubExpr(w):
+  # type: (word_t) -> Optional[arith_expr_t]
+  """Return the expression if the word is exactly $(( ... )), else None.
+
+  Used so that i=$((i + 1)) stores an integer.
+  """
+  if not isinstance(w, word__CompoundWord):
+    return None
+
+  if len(w.parts) != 1:
+    return None
+
+  part0 = w.parts[0]
+  if not isinstance(part0, word_part__ArithSubPart):
+    return None
+
+  return part0.anode
+
+
 def IsVarLike(w):
   # type: (word__CompoundWord) -> bool
   """Tests whether a word looks like FOO=bar.
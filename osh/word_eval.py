@@ -49,6 +49,9 @@ def _ValueToPartValue(val, quoted):
   elif val.tag == value_e.StrArray:
     return part_value.Array(val.strs)
 
+  elif val.tag == value_e.SparseArray:
+    return part_value.Array(state.SparseValues(val))
+
   elif val.tag == value_e.AssocArray:
     # TODO: Is this correct?
     return part_value.Array(val.d.values())
@@ -251,7 +254,8 @@ class _WordEvaluator(object):
       is_falsey = (
           undefined or
           (val.tag == value_e.Str and not val.s) or
-          (val.tag == value_e.StrArray and not val.strs)
+          (val.tag == value_e.StrArray and not val.strs) or
+          (val.tag == value_e.SparseArray and not val.d)
       )
     else:
       is_falsey = undefined
@@ -320,6 +324,17 @@ class _WordEvaluator(object):
         return value.Str(val.strs[index_num])
       except IndexError:
         return value.Undef()
+    elif val.tag == value_e.SparseArray:
+      if index in ('@', '*'):
+        return value.StrArray(state.SparseValues(val))
+      try:
+        index_num = int(index)
+      except ValueError:
+        return None
+      s = state.SparseLookup(val, index_num)
+      if s is None:
+        return value.Undef()
+      return value.Str(s)
     elif val.tag == value_e.AssocArray:
       if index in ('@', '*'):
         raise NotImplementedError
@@ -365,6 +380,9 @@ class _WordEvaluator(object):
         # There can be empty placeholder values in the array.
         length = sum(1 for s in val.strs if s is not None)
 
+      elif val.tag == value_e.SparseArray:
+        length = len(val.d)
+
       return value.Str(str(length))
 
     elif op_id == Id.VSub_Bang:  # ${!foo}, "indirect expansion"
@@ -405,6 +423,8 @@ class _WordEvaluator(object):
       elif val.tag == value_e.StrArray:
         indices = [str(i) for i, s in enumerate(val.strs) if s is not None]
         return value.StrArray(indices)
+      elif val.tag == value_e.SparseArray:
+        return value.StrArray([str(i) for i in state.SparseIndices(val)])
       else:
         raise AssertionError
 
@@ -425,6 +445,10 @@ class _WordEvaluator(object):
         s = string_ops.DoUnarySuffixOp(val.s, op, arg_val.s)
         #log('%r %r -> %r', val.s, arg_val.s, s)
         new_val = value.Str(s)
+      elif val.tag == value_e.SparseArray:
+        strs = [string_ops.DoUnarySuffixOp(s, op, arg_val.s)
+                for s in state.SparseValues(val)]
+        new_val = value.StrArray(strs)
       else:  # val.tag == value_e.StrArray:
         # ${a[@]#prefix} is VECTORIZED on arrays.  Oil should have this too.
         strs = []
@@ -466,8 +490,10 @@ class _WordEvaluator(object):
       self._EvalWordPart(p, part_vals, quoted=True)
 
   def _DecayArray(self, val):
-    assert val.tag == value_e.StrArray, val
     sep = self.splitter.GetJoinChar()
+    if val.tag == value_e.SparseArray:
+      return value.Str(sep.join(state.SparseValues(val)))
+    assert val.tag == value_e.StrArray, val
     return value.Str(sep.join(s for s in val.strs if s is not None))
 
   def _EmptyStrOrError(self, val, token=None):
@@ -547,6 +573,8 @@ class _WordEvaluator(object):
           elif val.tag == value_e.StrArray:
             # TODO: Is this a no-op?  Just leave 'val' alone.
             val = value.StrArray(val.strs)
+          # A SparseArray is left alone, since ${!a[@]} and slices need its
+          # indices.
 
         elif op_id == Id.Arith_Star:
           maybe_decay_array = True  # both ${a[*]} and "${a[*]}" decay
@@ -587,6 +615,14 @@ class _WordEvaluator(object):
           else:
             val = value.Str(s)
 
+        elif val.tag == value_e.SparseArray:
+          index = self.arith_ev.Eval(anode)
+          s = state.SparseLookup(val, index)
+          if s is None:
+            val = value.Undef()
+          else:
+            val = value.Str(s)
+
         elif val.tag == value_e.AssocArray:
           key = self.arith_ev.Eval(anode, int_coerce=False)
           try:
@@ -682,7 +718,9 @@ class _WordEvaluator(object):
           #   "Glob is not in CANONICAL FORM".
           # - Propagate location info back to the 'op.pat' word.
           pass
-        replacer = string_ops.GlobReplacer(regex, replace_str, op.spids[0])
+        literal = glob_.GlobToLiteral(pat_val.s)  # for the fast path
+        replacer = string_ops.GlobReplacer(regex, replace_str, op.spids[0],
+                                           literal=literal)
 
         if val.tag == value_e.Str:
           s = replacer.Replace(val.s, op)
@@ -695,6 +733,10 @@ class _WordEvaluator(object):
               strs.append(replacer.Replace(s, op))
           val = value.StrArray(strs)
 
+        elif val.tag == value_e.SparseArray:
+          strs = [replacer.Replace(s, op) for s in state.SparseValues(val)]
+          val = value.StrArray(strs)
+
         else:
           raise AssertionError(val.__class__.__name__)
 
@@ -760,11 +802,21 @@ class _WordEvaluator(object):
                 break
           val = value.StrArray(strs)
 
+        elif val.tag == value_e.SparseArray:
+          d = val.d
+          if begin < 0:
+            begin += val.max_index + 1
+          indices = [i for i in state.SparseIndices(val) if i >= begin]
+          if length is not None and length >= 0:
+            indices = indices[:length]
+          val = value.StrArray([d[i] for i in indices])
+
         else:
           raise AssertionError(val.__class__.__name__)  # Not possible
 
     # After applying suffixes, process maybe_decay_array here.
-    if maybe_decay_array and val.tag == value_e.StrArray:
+    if maybe_decay_array and val.tag in (value_e.StrArray,
+                                         value_e.SparseArray):
       val = self._DecayArray(val)
 
     # For the case where there are no prefix or suffix ops.
@@ -109,6 +109,8 @@ def dup(fd: int) -> int: ...
 def dup2(fd: int, fd2: int) -> None: ...
 def execv(path: str, args: Sequence[str], env: Mapping[str, str]) -> None: ...
 def execve(path: str, args: Sequence[str], env: Mapping[str, str]) -> None: ...
+def posix_spawn(path: str, args: Sequence[str], env: Mapping[str, str],
+                setsigdef: List[int]) -> int: ...
 def fchdir(fd: int) -> None: ...
 def fchmod(fd: int, mode: int) -> None: ...
 def fchown(fd: int, uid: int, gid: int) -> None: ...
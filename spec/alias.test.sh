@@ -522,3 +522,16 @@ echo done
 ## stdout: done
 ## OK osh status: 2
 ## OK osh stdout-json: ""
+
+#### eval of code that defines and uses an alias
+# eval strings are cached, but not when an alias was expanded
+shopt -s expand_aliases
+code='if test "$c" = 1; then alias x="echo A"; else alias x="echo B"; fi
+x'
+for c in 1 2 1 2; do eval "$code"; done
+## STDOUT:
+A
+B
+A
+B
+## END
@@ -71,6 +71,21 @@ s1+='d'
 echo $s1 $s2
 ## stdout: abcd abc
 
+#### Append in a loop, then export and copy
+s=x
+for i in 1 2 3; do
+  s+=$i
+done
+t=$s
+s+=y
+export s
+printenv.py s
+echo $t ${#s}
+## STDOUT:
+x123y
+x123 5
+## END
+
 #### Append to nonexistent string
 f() {
   local a+=a
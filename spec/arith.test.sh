@@ -388,3 +388,13 @@ echo [$a]
 []
 ## END
 ## OK bash status: 0
+
+#### Integer results are used as strings
+i=$(( 0x10 ))
+(( j = i * 2 ))
+(( i++ ))
+s=$i
+s+=$j
+echo $i ${#j} $s ${i}x
+## stdout: 17 2 1732 17x
+## N-I dash stdout: 16 0 16 16x
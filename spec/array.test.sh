@@ -461,6 +461,35 @@ argv.py "${a[@]:15:2}"
 ## N-I mksh status: 1
 ## N-I mksh stdout-json: ""
 
+#### Sparse array with a huge index
+a[10000000]=x
+a[3]=7
+argv.py "${#a[@]}" "${!a[@]}" "${a[@]}"
+argv.py "${a[@]:4}" "${a[@]:0:1}" "${a[-1]}" "${a[5]-unset}"
+a+=(z)
+argv.py "${!a[@]}" "${a[@]/7/8}"
+echo $(( a[3] + 1 ))
+## STDOUT:
+['2', '3', '10000000', '7', 'x']
+['x', '7', 'x', 'unset']
+['3', '10000000', '10000001', '8', 'x', 'z']
+8
+## END
+
+#### Sparse array in arithmetic is its first entry
+b[5000]=3
+echo $((b)) $((b + 1)) $((b[5000] * 2))
+y=$((b))
+echo $y
+b[0]=9
+y=$((b))
+echo $y $((y + 1))
+## STDOUT:
+0 1 6
+0
+9 10
+## END
+
 #### Using an array itself as the index
 # TODO: Fix OSH crash.
 a[a]=42
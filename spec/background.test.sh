@@ -121,3 +121,12 @@ echo ${bar=2} &
 wait
 echo $bar  # bar is NOT SET in the parent process
 ## stdout-json: "1\n1\n2\n\n"
+
+#### Finished background jobs are reaped without wait
+for i in $(seq 30); do
+  sleep 0.01 &
+done
+sleep 0.5
+# Count zombie children of the shell
+ps -o stat= --ppid $$ | grep -c Z || true
+## stdout: 0
@@ -106,3 +106,37 @@ type -f mv tar grep
 mv is /bin/mv
 tar is /bin/tar
 grep is /bin/grep
+## END
+
+#### hash -t, -d, -r
+hash mv
+hash -t mv >/dev/null
+echo status=$?
+hash -d mv
+hash -t mv
+echo status=$?
+hash -p /bin/echo my-echo
+my-echo hi
+hash -r
+hash
+## STDOUT:
+status=0
+status=1
+hi
+hash: hash table empty
+## END
+
+#### Assigning PATH clears the hash table
+hash mv
+PATH=$PATH
+hash
+## STDOUT:
+hash: hash table empty
+## END
+
+#### hash with a name that isn't found
+hash cd zz-not-found
+echo status=$?
+## STDOUT:
+status=1
+## END
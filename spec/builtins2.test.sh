@@ -77,6 +77,21 @@ command seq 3
 3
 ## END
 
+#### command -v finds a file that isn't executable
+mkdir -p $TMP/nx-bin
+touch $TMP/nx-bin/nxfoo
+chmod -x $TMP/nx-bin/nxfoo
+PATH="$TMP/nx-bin:$PATH"
+command -v nxfoo >/dev/null
+echo status=$?
+command -v nxfoo | sed "s;$TMP;TMP;"
+## STDOUT:
+status=0
+TMP/nx-bin/nxfoo
+## BUG dash STDOUT:
+status=127
+## END
+
 #### command command seq 3
 command command seq 3
 ## STDOUT:
@@ -82,5 +82,195 @@ status=1
 OK
 ## END
 
+#### shopt -s reclaim_arena
+shopt -s reclaim_arena
+f() {
+  echo "f $1 $LINENO"
+}
+trap 'echo "exit trap"' EXIT
+for i in 1 2; do
+  eval "echo eval $i"
+done
+eval 'g() { echo g; }'
+f x
+g
+echo $LINENO
+echo $(echo sub)
+# The spec runner drops blank lines and comments, so put them in a file.
+echo 'echo "sourced $1"' > $TMP/reclaim-lib.sh
+printf '%s\n' 'shopt -s reclaim_arena' 'echo a' '' '# comment' 'echo b' \
+  'x=doc' 'cat <<EOF' 'here $x' 'EOF' '' \
+  'h() {' '  . $TMP/reclaim-lib.sh "$@"' '}' 'h y' > $TMP/reclaim.sh
+$SH $TMP/reclaim.sh
+## STDOUT:
+eval 1
+eval 2
+f x 3
+g
+12
+sub
+a
+b
+here doc
+sourced y
+exit trap
+## END
+
+#### OSH_PARSE_CACHE_DIR
+cache_dir=$TMP/parse-cache-$$
+mkdir -p $cache_dir
+cat >$TMP/cached.sh <<'EOF'
+f() { echo "f $1 $LINENO"; }
+x=`echo sub`
+f $x
+echo $LINENO
+EOF
+# The entry is written while the arena is reclaimed, and read without it.
+for opt in -s -u; do
+  OSH_PARSE_CACHE_DIR=$cache_dir \
+    $SH -c "shopt $opt reclaim_arena; . $TMP/cached.sh; . $TMP/cached.sh"
+done
+ls $cache_dir | wc -l
+## STDOUT:
+f sub 1
+4
+f sub 1
+4
+f sub 1
+4
+f sub 1
+4
+1
+## END
+
+#### OSH_PARSE_CACHE_DIR with aliases defined by the file
+cache_dir=$TMP/parse-cache-alias-$$
+mkdir -p $cache_dir
+cat >$TMP/alias-lib.sh <<'EOF'
+if test -n "$MODE"; then
+  alias greet='echo MODE-A'
+else
+  alias greet='echo MODE-B'
+fi
+greet
+EOF
+for mode in 1 '' 1; do
+  MODE=$mode OSH_PARSE_CACHE_DIR=$cache_dir $SH -c ". $TMP/alias-lib.sh"
+done
+## STDOUT:
+MODE-A
+MODE-B
+MODE-A
+## END
+
+#### OSH_PARSE_CACHE_DIR caches a file that defines aliases
+cache_dir=$TMP/parse-cache-rc-$$
+mkdir -p $cache_dir
+cat >$TMP/rc-lib.sh <<'EOF'
+alias ll='ls -l'
+f() { echo "f $1"; }
+EOF
+OSH_PARSE_CACHE_DIR=$cache_dir $SH -c ". $TMP/rc-lib.sh; f 1; alias ll"
+ls $cache_dir | wc -l
+OSH_PARSE_CACHE_DIR=$cache_dir $SH -c ". $TMP/rc-lib.sh; f 2; alias ll"
+## STDOUT:
+f 1
+alias ll='ls -l'
+1
+f 2
+alias ll='ls -l'
+## END
+
+#### shopt -s inline_command_sub restores state
+shopt -s inline_command_sub
+f() { local y=1; x=changed; a[1]=X; printf '%s-%s\n' "$1" $y; }
+x=orig
+a=(1 2 3)
+s=$(f arg; echo ${a[@]})
+echo "$s / $x / ${a[@]}"
+s=$(echo one; false)
+echo "$s status=$?"
+s=$(exit 3)
+echo "status=$?"
+false
+s=$(echo $?)
+echo "last=$s"
+## STDOUT:
+arg-1
+1 X 3 / orig / 1 2 3
+one status=1
+status=3
+last=1
+## END
+
+#### shopt -s inline_command_sub falls back to forking
+shopt -s inline_command_sub
+f() { echo "$1" | tr a-z A-Z; }
+s=$(echo $(f nested) sub)
+echo "$s"
+s=$(echo hi >&2; cd /; pwd)
+test "$PWD" != / && echo "$s"
+## STDOUT:
+NESTED sub
+/
+## STDERR:
+hi
+## END
+
+#### shopt -s parallel_command_sub
+shopt -s parallel_command_sub
+echo "$(echo a)" $(echo b) "x$(echo c)y" ${undefined:-$(echo d)}
+x=$(echo 1; exit 3) y=$(echo 2; exit 4)
+echo "status=$? $x $y"
+x=$(false) y=$(true)
+echo status=$?
+FOO=$(echo f) BAR=$(echo b) env | grep -E '^(FOO|BAR)=' | sort
+## STDOUT:
+a b xcy d
+status=4 1 2
+status=0
+BAR=b
+FOO=f
+## END
+
+#### parallel_command_sub with nested inline command subs
+shopt -s parallel_command_sub inline_command_sub
+log=$TMP/parallel-inline.txt
+rm -f $log
+echo "$(echo $(echo a) $(echo b))" $(echo c >>$log; echo c) $(echo d >>$log; echo d)
+cat $log
+## STDOUT:
+a b c d
+c
+d
+## END
+
+#### OSH_MAX_JOBS limits background jobs
+# With one slot, each job finishes before the next one starts
+OSH_MAX_JOBS=1
+for i in 1 2 3; do
+  { sleep 0.05; echo $i; } &
+done
+echo started
+wait
+OSH_MAX_JOBS=2
+{ sleep 0.1; echo 4; } &
+{ sleep 0.3; echo 5; } &
+echo started
+wait
+OSH_MAX_JOBS=x
+sleep 0 &
+echo bad
+## status: 1
+## STDOUT:
+1
+2
+started
+3
+started
+4
+5
+## END
+
 # NOTE: strict-arith has one case in arith.test.sh), strict-word-eval has a case in var-op-other.
 
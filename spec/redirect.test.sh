@@ -320,3 +320,32 @@ echo done
 ## STDOUT:
 done
 ## END
+
+#### Redirect onto a descriptor the shell saved
+# The shell saves stderr in a high descriptor while 2>/dev/null is in effect.
+{ { echo inner 10>&1 11>&1; } 2>/dev/null; echo after >&2; } 2>&1
+## STDOUT:
+inner
+after
+## END
+
+#### 2>/dev/null silences errors from builtins
+# Leaked errors would show up on stdout.
+{ test 1 -eq x 2>/dev/null; echo status=$?; } 2>&1
+{ [ a -lt ] 2>/dev/null; echo status=$?; } 2>&1
+{ printf '%d\n' abc >/dev/null 2>/dev/null; echo status=$?; } 2>&1
+{ printf '%d\n' abc 2>/dev/null >/dev/null; echo status=$?; } 2>&1
+## STDOUT:
+status=2
+status=2
+status=1
+status=1
+## END
+
+#### Write errors on a redirect are reported
+{ echo hi >/dev/full; echo status=$?; } 2>/dev/null
+{ printf x >/dev/full; echo status=$?; } 2>/dev/null
+## STDOUT:
+status=1
+status=1
+## END
@@ -146,3 +146,18 @@ a-b
 a-b
 a-b
 ## END
+
+#### Replace all with an empty pattern
+x=abc
+echo ${x//""/_}
+p=''
+echo ${x//$p/_}
+echo ${x//,/ }
+y='1,2,,3'
+echo "${y//,/ }"
+## STDOUT:
+abc
+abc
+abc
+1 2  3
+## END
@@ -33,16 +33,18 @@ class Cursor(object):
     # Sometimes we add +1
     assert until_span_id < const.NO_INTEGER, \
         'Missing span ID, got %d' % until_span_id
+    arena = self.arena
     for span_id in xrange(self.next_span_id, until_span_id):
-      span = self.arena.GetLineSpan(span_id)
+      line_id = arena.GetSpanLineId(span_id)
 
       # A span for Eof may have a line_id of -1 when the file is completely
       # empty.
-      if span.line_id == -1:
+      if line_id == -1:
         continue
 
-      line = self.arena.GetLine(span.line_id)
-      piece = line[span.col : span.col + span.length]
+      line = arena.GetLine(line_id)
+      col = arena.GetSpanCol(span_id)
+      piece = line[col : col + arena.GetSpanLength(span_id)]
       self.f.write(piece)
 
     self.next_span_id = until_span_id
@@ -63,16 +65,18 @@ def PrintArena(arena):
 
 def PrintSpans(arena):
   """Just to see spans."""
-  if len(arena.spans) == 1:  # Special case for line_id == -1
+  num_spans = arena.LastSpanId()
+  if num_spans == 1:  # Special case for line_id == -1
     print('Empty file with EOF span on invalid line:')
-    print('%s' % arena.spans[0])
+    print('%s' % arena.GetLineSpan(0))
     return
 
-  for i, span in enumerate(arena.spans):
+  for i in xrange(num_spans):
+    span = arena.GetLineSpan(i)
     line = arena.GetLine(span.line_id)
     piece = line[span.col : span.col + span.length]
     print('%5d %r' % (i, piece))
-  print('(%d spans)' % len(arena.spans), file=sys.stderr)
+  print('(%d spans)' % num_spans, file=sys.stderr)
 
 
 def PrintAsOil(arena, node):
@@ -0,0 +1,208 @@
+"""
+parse_files.py - 'oshc parse' parses many files with a pool of processes.
+
+Usage:
+  oshc parse [-j NUM_JOBS] PATH...
+
+Prints a TSV row for each file, in the order given:
+
+  status  path  num_lines  num_tokens  parse_ms
+
+where status is 'ok', 'parse-error', 'io-error', or 'internal-error'.  Parse
+errors, and tracebacks for internal errors, are printed to stderr.  Backslash,
+tab, and newline in the path are escaped as \\, \t, and \n.
+
+Exit code: 0 if all files parsed, 1 if there was a parse error, 2 if a file
+couldn't be read, or 3 if there was an internal error.
+"""
+from __future__ import print_function
+
+import errno
+import time
+import traceback
+
+import posix_ as posix
+
+from _devbuild.gen.syntax_asdl import source
+from core import alloc
+from core import main_loop
+from core import meta
+from core import pyutil
+from core import ui
+from core import util
+from frontend import args
+from frontend import parse_lib
+from frontend import reader
+
+import libc
+
+SPEC = args.BuiltinFlags()
+SPEC.ShortFlag('-j', args.Int)  # number of worker processes
+
+_STATUS_EXIT_CODE = {
+    'ok': 0, 'parse-error': 1, 'io-error': 2, 'internal-error': 3,
+}
+
+
+def _EscapePath(path):
+  """Escape a path so it fits in one TSV field."""
+  return path.replace('\\', '\\\\').replace('\t', '\\t').replace(
+      '\n', '\\n')
+
+
+def _Row(status, path, num_lines, num_tokens, elapsed_ms):
+  return '%s\t%s\t%d\t%d\t%.2f' % (
+      status, _EscapePath(path), num_lines, num_tokens, elapsed_ms)
+
+
+def _ParseOne(parse_ctx, path):
+  """Parse a file and return a TSV row."""
+  arena = parse_ctx.arena
+  # One Arena per worker.  Each file's lines and spans are discarded after
+  # it's parsed, so memory doesn't grow with the number of files.
+  mark = arena.GetMark()
+  start_time = time.time()
+
+  try:
+    f = open(path)
+  except IOError as e:
+    ui.Stderr("oshc: Couldn't open %r: %s", path, posix.strerror(e.errno))
+    status = 'io-error'
+    num_lines = 0
+    num_tokens = 0
+  else:
+    src = source.MainFile(path)
+    arena.PushSource(src)
+    try:
+      line_reader = reader.FileReader(f, arena)
+      c_parser = parse_ctx.MakeOshParser(line_reader)
+      try:
+        main_loop.ParseWholeFile(c_parser)
+        status = 'ok'
+      except util.ParseError as e:
+        ui.PrettyPrintError(e, arena)
+        status = 'parse-error'
+      except Exception:  # e.g. an AssertionError in the parser
+        # Only this file's row is affected, even in a worker.
+        traceback.print_exc()
+        ui.Stderr('oshc: Internal error parsing %r', path)
+        status = 'internal-error'
+    finally:
+      arena.PopSource()
+      f.close()
+
+    end_lines, end_spans = arena.GetMark()
+    # Don't count lines from backticks and here docs twice
+    num_lines = sum(1 for line_id in xrange(mark[0], end_lines)
+                    if arena.GetLineSource(line_id) is src)
+    num_tokens = end_spans - mark[1]  # each token has a span
+
+  elapsed_ms = (time.time() - start_time) * 1000
+  arena.Reclaim(mark)
+
+  return _Row(status, path, num_lines, num_tokens, elapsed_ms)
+
+
+def _MakeParseContext(oil_grammar):
+  arena = alloc.Arena()
+  aliases = {}  # Dummy value; not respecting aliases!
+  return parse_lib.ParseContext(arena, aliases, oil_grammar)
+
+
+def _RunWorker(oil_grammar, paths, indices, fd):
+  """Runs in a child process.  Writes rows prefixed by their index to fd."""
+  parse_ctx = _MakeParseContext(oil_grammar)
+  rows = []
+  for i in indices:
+    rows.append('%d\t%s\n' % (i, _ParseOne(parse_ctx, paths[i])))
+
+  # Write everything at the end, so a full pipe doesn't stall parsing while the
+  # parent is reading from another worker.
+  buf = ''.join(rows)
+  while buf:
+    n = posix.write(fd, buf)
+    buf = buf[n:]
+
+
+def _ReadAll(fd):
+  chunks = []
+  while True:
+    try:
+      chunk = posix.read(fd, 4096)
+    except OSError as e:
+      if e.errno == errno.EINTR:
+        continue
+      raise
+    if not chunk:
+      break
+    chunks.append(chunk)
+  return ''.join(chunks)
+
+
+def ParseFiles(oil_grammar, paths, num_jobs):
+  """Parse the files with num_jobs worker processes.
+
+  Returns:
+    A list of TSV rows, in the same order as paths.
+  """
+  if num_jobs <= 1:
+    parse_ctx = _MakeParseContext(oil_grammar)
+    return [_ParseOne(parse_ctx, path) for path in paths]
+
+  pipes = []
+  for w in xrange(num_jobs):
+    indices = range(w, len(paths), num_jobs)  # round robin
+    r, wfd = posix.pipe()
+    pid = posix.fork()
+    if pid == 0:  # child
+      status = 0
+      try:
+        posix.close(r)
+        _RunWorker(oil_grammar, paths, indices, wfd)
+      except BaseException:  # don't run the parent's code in the child
+        status = 1
+      posix._exit(status)
+    posix.close(wfd)
+    pipes.append(r)
+
+  rows = [None] * len(paths)
+  for r in pipes:
+    # Paths are escaped, so each row is one line.  (splitlines() would also
+    # split on characters like \r.)
+    for line in _ReadAll(r).split('\n')[:-1]:
+      index, row = line.split('\t', 1)
+      rows[int(index)] = row
+    posix.close(r)
+
+  for _ in pipes:
+    posix.wait()
+
+  # A worker that died leaves holes
+  for i, row in enumerate(rows):
+    if row is None:
+      ui.Stderr('oshc: Worker failed to parse %r', paths[i])
+      rows[i] = _Row('internal-error', paths[i], 0, 0, 0.0)
+  return rows
+
+
+def main(argv):
+  arg, i = SPEC.ParseArgv(argv)
+  paths = argv[i:]
+  if not paths:
+    raise args.UsageError('parse: expected one or more paths')
+
+  num_jobs = arg.j if arg.j is not None else libc.cpu_count()
+  num_jobs = min(num_jobs, len(paths))
+
+  loader = pyutil.GetResourceLoader()
+  oil_grammar = meta.LoadOilGrammar(loader)
+
+  rows = ParseFiles(oil_grammar, paths, num_jobs)
+
+  print('status\tpath\tnum_lines\tnum_tokens\tparse_ms')
+  exit_code = 0
+  for row in rows:
+    print(row)
+    status = row.split('\t', 1)[0]
+    exit_code = max(exit_code, _STATUS_EXIT_CODE[status])
+  return exit_code
@@ -0,0 +1,84 @@
+#!/usr/bin/env python2
+"""
+parse_files_test.py: Tests for parse_files.py
+"""
+
+import os
+import unittest
+
+from core import main_loop
+from tools import parse_files  # module under test
+
+
+def _Write(path, contents):
+  with open(path, 'w') as f:
+    f.write(contents)
+
+
+class ParseFilesTest(unittest.TestCase):
+
+  def setUp(self):
+    if not os.path.exists('_tmp'):
+      os.mkdir('_tmp')
+    self.paths = []
+    for i in xrange(5):
+      path = '_tmp/parse_files_test_%d.sh' % i
+      _Write(path, 'echo %d\nx=`echo $(( %d + 1 ))`\n' % (i, i))
+      self.paths.append(path)
+
+    self.bad = '_tmp/parse_files_test_bad.sh'
+    _Write(self.bad, 'if true; then\n')
+
+  def _Check(self, num_jobs):
+    paths = self.paths + [self.bad, '_tmp/nonexistent.sh']
+    rows = parse_files.ParseFiles(None, paths, num_jobs)
+
+    # Rows are in the same order as the paths
+    self.assertEqual(paths, [row.split('\t')[1] for row in rows])
+
+    for row in rows[:5]:
+      status, _, num_lines, num_tokens, _ = row.split('\t')
+      self.assertEqual('ok', status)
+      self.assertEqual('2', num_lines)  # the backticks line isn't counted
+      # The worker's arena is reclaimed, so the counts are per file
+      self.assertEqual(rows[0].split('\t')[3], num_tokens)
+
+    self.assertEqual('parse-error', rows[5].split('\t')[0])
+    self.assertEqual('io-error', rows[6].split('\t')[0])
+
+  def testInProcess(self):
+    self._Check(1)
+
+  def testWorkers(self):
+    self._Check(3)
+
+  def testInternalError(self):
+    def _Crash(c_parser):
+      raise AssertionError('crash')
+
+    orig = main_loop.ParseWholeFile
+    main_loop.ParseWholeFile = _Crash
+    try:
+      for num_jobs in (1, 3):
+        rows = parse_files.ParseFiles(None, self.paths, num_jobs)
+        # Every row comes from _ParseOne, so a worker keeps going after a crash
+        self.assertEqual(self.paths, [row.split('\t')[1] for row in rows])
+        for row in rows:
+          self.assertEqual('internal-error', row.split('\t')[0])
+    finally:
+      main_loop.ParseWholeFile = orig
+
+  def testEscapedPath(self):
+    path = '_tmp/parse_files_test_tab\tnewline\nbackslash\\.sh'
+    _Write(path, 'echo hi\n')
+    for num_jobs in (1, 3):
+      rows = parse_files.ParseFiles(None, [path] + self.paths, num_jobs)
+      self.assertEqual(6, len(rows))
+      fields = rows[0].split('\t')
+      self.assertEqual('ok', fields[0])
+      self.assertEqual(
+          '_tmp/parse_files_test_tab\\tnewline\\nbackslash\\\\.sh', fields[1])
+
+
+if __name__ == '__main__':
+  unittest.main()